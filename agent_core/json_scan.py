@@ -0,0 +1,111 @@
+"""
+Incremental, brace-balanced JSON object scanner.
+
+Models without native tool support emit tool calls (and other structured
+answers) as JSON embedded in free text: inside prose, inside ``` fences, or
+several objects in a row. A regex cannot match nested braces or `}` inside
+string values, so this scanner tracks string/escape state and brace depth
+instead and yields every top-level JSON object it can decode.
+"""
+
+import json
+from typing import Any, Iterator
+
+
+class JsonObjectScanner:
+    """
+    Pull complete JSON objects out of a text stream.
+
+    Call feed() with each new piece of text (e.g. streamed deltas); it returns
+    the objects completed by that piece. Call finish() once the text is over to
+    recover objects that were hidden behind an unbalanced `{` in prose.
+    """
+
+    def __init__(self) -> None:
+        self._buf = ""
+        self._pos = 0
+        self._start: int | None = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> list[Any]:
+        self._buf += text
+        return self._scan()
+
+    def finish(self) -> list[Any]:
+        found: list[Any] = []
+        # An object that never closed was probably a stray `{` in prose:
+        # restart just after it so objects nested further on are still found.
+        while self._start is not None:
+            self._restart_after(self._start)
+            found.extend(self._scan())
+        return found
+
+    def _restart_after(self, index: int) -> None:
+        self._pos = index + 1
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def _scan(self) -> list[Any]:
+        found: list[Any] = []
+        buf = self._buf
+        i = self._pos
+        n = len(buf)
+        while i < n:
+            if self._start is None:
+                i = buf.find("{", i)
+                if i == -1:
+                    i = n
+                    break
+                self._start = i
+                self._depth = 1
+                i += 1
+                continue
+
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    start = self._start
+                    try:
+                        obj = json.loads(buf[start:i + 1])
+                    except json.JSONDecodeError:
+                        # Balanced but not JSON (e.g. C++ code): look inside it
+                        self._restart_after(start)
+                        i = self._pos
+                        continue
+                    found.append(obj)
+                    self._start = None
+            i += 1
+        self._pos = i
+
+        # Drop text that can no longer be part of an object
+        if self._start is None:
+            self._buf = buf[self._pos:]
+            self._pos = 0
+        elif self._start > 0:
+            self._buf = buf[self._start:]
+            self._pos -= self._start
+            self._start = 0
+        return found
+
+
+def iter_json_objects(text: str) -> Iterator[Any]:
+    """Yield every top-level JSON object found in text, in order."""
+    scanner = JsonObjectScanner()
+    yield from scanner.feed(text)
+    yield from scanner.finish()
@@ -1,4 +1,5 @@
 import os
+from typing import Any
 
 from openai import OpenAI  # type: ignore
 
@@ -11,7 +12,7 @@ def make_client() -> OpenAI:
     Configuration (all optional, with sensible defaults):
 
     - API_PROVIDER:
-        One of: "ollama", "groq", "gemini", "huggingface".
+        One of: "ollama", "groq", "gemini", "huggingface", "openai".
         Default: "ollama".
 
     - OPENAI_BASE_URL:
@@ -21,6 +22,7 @@ def make_client() -> OpenAI:
           * groq       -> https://api.groq.com/openai/v1
           * gemini     -> https://generativelanguage.googleapis.com/v1beta/openai/
           * huggingface-> https://api-inference.huggingface.co/v1
+          * openai     -> the OpenAI client's default endpoint
 
     - OPENAI_API_KEY:
         Provider-specific API key.
@@ -57,3 +59,32 @@ def make_client() -> OpenAI:
         api_key=api_key,
     )
 
+
+# Providers whose chat completions accept prompt_cache_key; others may reject unknown fields
+PROMPT_CACHE_KEY_PROVIDERS = {"openai"}
+
+
+def completion_options() -> dict[str, Any]:
+    """
+    Extra keyword arguments for chat.completions.create that help providers
+    reuse the static prompt prefix between requests.
+
+    - OLLAMA_KEEP_ALIVE (ollama only, default "30m"):
+        Sent as keep_alive so the model, and with it the KV cache of the
+        shared system prefix, stays loaded between rows. "0" unloads after
+        each request; "-1" keeps the model loaded indefinitely.
+
+    - PROMPT_CACHE_KEY (API_PROVIDER=openai only):
+        Sent as prompt_cache_key (OpenAI prompt caching) so requests sharing
+        the prefix are routed to the same cache. Not sent to other providers.
+    """
+    provider = os.getenv("API_PROVIDER", "ollama").strip().lower()
+    extra_body: dict[str, Any] = {}
+    if provider == "ollama":
+        keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "30m").strip()
+        if keep_alive:
+            extra_body["keep_alive"] = int(keep_alive) if keep_alive.lstrip("-").isdigit() else keep_alive
+    cache_key = os.getenv("PROMPT_CACHE_KEY", "").strip()
+    if cache_key and provider in PROMPT_CACHE_KEY_PROVIDERS:
+        extra_body["prompt_cache_key"] = cache_key
+    return {"extra_body": extra_body} if extra_body else {}
@@ -0,0 +1,266 @@
+"""
+Structured (JSON) replies from OpenAI-compatible providers.
+
+Each agent describes its answer with a small JSON schema. structured_completion()
+asks the provider to enforce it where possible, parses and validates the reply,
+and repairs what it can before giving up:
+
+  1. request with response_format (json_schema or json_object, see below)
+  2. parse the whole reply as JSON; else take the first JSON object embedded in
+     it (agent_core/json_scan.py); else the agent's legacy text parser
+  3. still invalid: one minimal follow-up that sends only the schema and the
+     bad reply (not the original prompt) and asks for the corrected object
+
+  STRUCTURED_OUTPUT   json_schema | json_object | off; default per provider
+                      (json_schema for ollama and gemini, json_object for groq,
+                      off otherwise). Providers that reject response_format are
+                      remembered per base URL and model and asked without it.
+  STRUCTURED_REASK    follow-up requests per reply (default 1, 0 = none)
+
+Outcomes are counted per model (parse_stats / format_parse_stats) and set as the
+"parse" attribute of the caller's span: valid, repaired, reasked or failed.
+"""
+
+import json
+import os
+import re
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any, Callable
+
+from agent_core.json_scan import iter_json_objects
+
+OUTCOMES = ("valid", "repaired", "reasked", "failed")
+_DEFAULT_MODES = {"ollama": "json_schema", "gemini": "json_schema", "groq": "json_object"}
+_FENCE_RE = re.compile(r"^```[\w]*\s*|\s*```$")
+_TYPES: dict[str, Callable[[Any], bool]] = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "boolean": lambda v: isinstance(v, bool),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+}
+
+# (base_url, model) pairs that rejected response_format; later requests go without it
+_NO_FORMAT_SUPPORT: set[tuple[str, str]] = set()
+
+
+@dataclass
+class ParseStats:
+    replies: int = 0
+    valid: int = 0
+    repaired: int = 0
+    reasked: int = 0
+    failed: int = 0
+
+    @property
+    def failure_rate(self) -> float | None:
+        """Share of replies that were not valid JSON for the schema as received."""
+        return (self.replies - self.valid) / self.replies if self.replies else None
+
+
+_stats: dict[str, ParseStats] = {}
+_stats_lock = threading.Lock()
+
+
+def record_outcome(model: str, outcome: str) -> None:
+    with _stats_lock:
+        stats = _stats.setdefault(model, ParseStats())
+        stats.replies += 1
+        setattr(stats, outcome, getattr(stats, outcome) + 1)
+
+
+def parse_stats() -> dict[str, dict[str, Any]]:
+    """Per-model outcome counts and first-try failure rate."""
+    with _stats_lock:
+        return {
+            model: {**asdict(s), "failure_rate": None if s.failure_rate is None else round(s.failure_rate, 4)}
+            for model, s in _stats.items()
+        }
+
+
+def reset_parse_stats() -> None:
+    with _stats_lock:
+        _stats.clear()
+
+
+def format_parse_stats() -> str:
+    lines = []
+    for model, s in parse_stats().items():
+        lines.append(
+            f"[Parse] {model}: {s['replies']} replies, {s['valid']} valid, {s['repaired']} repaired, "
+            f"{s['reasked']} re-asked, {s['failed']} failed (first-try failure rate {s['failure_rate']:.1%})"
+        )
+    return "\n".join(lines)
+
+
+def structured_mode() -> str:
+    mode = os.getenv("STRUCTURED_OUTPUT", "").strip().lower()
+    if mode:
+        return mode
+    return _DEFAULT_MODES.get(os.getenv("API_PROVIDER", "ollama").strip().lower(), "off")
+
+
+def response_format(schema: dict[str, Any], name: str) -> dict[str, Any] | None:
+    mode = structured_mode()
+    if mode == "json_schema":
+        return {"type": "json_schema", "json_schema": {"name": name, "schema": schema}}
+    if mode == "json_object":
+        return {"type": "json_object"}
+    return None
+
+
+def validate(value: Any, schema: dict[str, Any], path: str = "$") -> list[str]:
+    """
+    Errors for value against the JSON Schema subset the agents use: type,
+    properties, required, items, enum, minimum/maximum, minLength and minItems.
+    """
+    expected = schema.get("type")
+    if expected and not _TYPES[expected](value):
+        return [f"{path} should be {expected}"]
+    errors: list[str] = []
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path} should be one of {schema['enum']}")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if "minimum" in schema and value < schema["minimum"]:
+            errors.append(f"{path} should be >= {schema['minimum']}")
+        if "maximum" in schema and value > schema["maximum"]:
+            errors.append(f"{path} should be <= {schema['maximum']}")
+    if isinstance(value, str) and len(value.strip()) < schema.get("minLength", 0):
+        errors.append(f"{path} should not be empty")
+    if isinstance(value, list):
+        if len(value) < schema.get("minItems", 0):
+            errors.append(f"{path} should have at least {schema['minItems']} items")
+        for i, item in enumerate(value):
+            errors.extend(validate(item, schema.get("items", {}), f"{path}[{i}]"))
+    if isinstance(value, dict):
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}.{key} is missing")
+        for key, sub in schema.get("properties", {}).items():
+            if key in value:
+                errors.extend(validate(value[key], sub, f"{path}.{key}"))
+    return errors
+
+
+def coerce(value: Any, schema: dict[str, Any]) -> Any:
+    """Fix scalar types models commonly get wrong ("12" for 12, "yes" for true)."""
+    expected = schema.get("type")
+    if expected == "integer" and isinstance(value, str) and value.strip().lstrip("-").isdigit():
+        return int(value.strip())
+    if expected == "integer" and isinstance(value, float) and value.is_integer():
+        return int(value)
+    if expected == "boolean" and isinstance(value, str) and value.strip().lower() in ("true", "yes", "false", "no"):
+        return value.strip().lower() in ("true", "yes")
+    if expected == "object" and isinstance(value, dict):
+        props = schema.get("properties", {})
+        return {k: coerce(v, props[k]) if k in props else v for k, v in value.items()}
+    if expected == "array" and isinstance(value, list):
+        return [coerce(v, schema.get("items", {})) for v in value]
+    return value
+
+
+def parse_reply(
+    content: str,
+    schema: dict[str, Any],
+    fallback: Callable[[str], Any] | None = None,
+    check: Callable[[Any], list[str]] | None = None,
+) -> tuple[Any | None, str, list[str]]:
+    """
+    (value, outcome, errors) for a reply: outcome "valid" when the whole reply is
+    JSON matching schema, "repaired" when an embedded object or the fallback
+    text parser produced a match, "failed" otherwise (errors says why).
+    check adds errors for rules across fields that the schema subset can't
+    express; it only sees values that already match schema.
+    """
+    def _errors(value: Any) -> list[str]:
+        errors = validate(value, schema)
+        return errors or (check(value) if check is not None else [])
+
+    text = _FENCE_RE.sub("", content.strip()).strip()
+    try:
+        value = coerce(json.loads(text), schema)
+        errors = _errors(value)
+        if not errors:
+            return value, "valid", []
+    except json.JSONDecodeError:
+        errors = ["reply is not a JSON object"]
+    for candidate in iter_json_objects(text):
+        candidate = coerce(candidate, schema)
+        if not _errors(candidate):
+            return candidate, "repaired", []
+    if fallback is not None:
+        candidate = fallback(content)
+        if candidate is not None:
+            candidate = coerce(candidate, schema)
+            if not _errors(candidate):
+                return candidate, "repaired", []
+    return None, "failed", errors
+
+
+def _reask_messages(content: str, schema: dict[str, Any], errors: list[str]) -> list[dict[str, str]]:
+    system = (
+        "Rewrite the answer below as a single JSON object matching this JSON schema. "
+        f"Output only the JSON object.\n{json.dumps(schema)}"
+    )
+    user = f"Answer:\n{content[:2000]}\n\nProblems: {'; '.join(errors[:5]) or 'not valid JSON'}"
+    return [{"role": "system", "content": system}, {"role": "user", "content": user}]
+
+
+def create_structured(client: Any, schema: dict[str, Any], name: str, **kwargs: Any) -> Any:
+    """
+    chat.completions.create(**kwargs) with response_format for schema when the
+    provider supports it; a provider that rejects it is asked again without.
+    """
+    fmt = response_format(schema, name)
+    key = (str(client.base_url), kwargs.get("model", ""))
+    if fmt is None or key in _NO_FORMAT_SUPPORT:
+        return client.chat.completions.create(**kwargs)
+    try:
+        return client.chat.completions.create(response_format=fmt, **kwargs)
+    except Exception as e:
+        if getattr(e, "status_code", None) not in (400, 422):
+            raise
+        _NO_FORMAT_SUPPORT.add(key)
+        return client.chat.completions.create(**kwargs)
+
+
+def structured_completion(
+    client: Any,
+    messages: list[dict[str, str]],
+    schema: dict[str, Any],
+    name: str,
+    fallback: Callable[[str], Any] | None = None,
+    span: Any | None = None,
+    check: Callable[[Any], list[str]] | None = None,
+    **kwargs: Any,
+) -> tuple[Any | None, str]:
+    """
+    Request, parse, validate (schema, then check as in parse_reply) and if
+    needed repair one structured reply.
+    kwargs go to chat.completions.create (model, max_tokens, ...); usage of every
+    request is recorded on span. Returns (value or None, raw reply text).
+    """
+    model = kwargs.get("model", "")
+    response = create_structured(client, schema, name, messages=messages, **kwargs)
+    if span is not None:
+        span.record_usage(response)
+    content = (response.choices[0].message.content or "").strip()
+    value, outcome, errors = parse_reply(content, schema, fallback, check)
+
+    for _ in range(int(os.getenv("STRUCTURED_REASK", "1")) if value is None and content else 0):
+        retry_kwargs = {k: v for k, v in kwargs.items() if k not in ("n", "temperature")}
+        response = create_structured(client, schema, name, messages=_reask_messages(content, schema, errors), **retry_kwargs)
+        if span is not None:
+            span.record_usage(response)
+            span.incr("retries")
+        value, _, errors = parse_reply((response.choices[0].message.content or "").strip(), schema, check=check)
+        if value is not None:
+            outcome = "reasked"
+            break
+
+    record_outcome(model, outcome)
+    if span is not None:
+        span.set("parse", outcome)
+    return value, content
@@ -0,0 +1,218 @@
+"""
+Lightweight structured tracing for the detection pipeline.
+
+Wrap each stage in `span(name, **attrs)`; when tracing is enabled every span is
+recorded with its wall time, attributes (sample ID, query, cache hits, retries)
+and token usage, exported as one JSON line per span, and summarised per stage at
+the end of a run. When tracing is disabled span() costs a single global lookup.
+
+    enable_tracing("traces.jsonl")
+    with trace_context(sample_id="32"):
+        with span("detect_bug") as s:
+            response = client.chat.completions.create(...)
+            s.record_usage(response)
+    print(format_summary())
+"""
+
+import contextlib
+import contextvars
+import json
+import threading
+import time
+from typing import Any, Iterator
+
+_context: contextvars.ContextVar[dict[str, Any]] = contextvars.ContextVar("trace_context", default={})
+
+
+class Span:
+    """One timed pipeline stage. Attributes are free-form JSON-serialisable values."""
+
+    __slots__ = ("name", "attrs", "start", "duration_s")
+
+    def __init__(self, name: str, attrs: dict[str, Any]) -> None:
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration_s = 0.0
+
+    def set(self, key: str, value: Any) -> None:
+        self.attrs[key] = value
+
+    def incr(self, key: str, amount: int = 1) -> None:
+        self.attrs[key] = self.attrs.get(key, 0) + amount
+
+    def record_usage(self, response: Any) -> None:
+        """Add prompt/completion tokens from an OpenAI-style response.usage."""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        self.incr("prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+        self.incr("completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", 0) if details is not None else 0
+        if cached:
+            self.incr("cached_prompt_tokens", cached)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "span": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round(self.duration_s * 1000, 3),
+            **self.attrs,
+        }
+
+
+class _NullSpan:
+    """Returned when tracing is disabled; accepts and ignores everything."""
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def incr(self, key: str, amount: int = 1) -> None:
+        pass
+
+    def record_usage(self, response: Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Collects finished spans in memory and optionally streams them to a JSONL file."""
+
+    def __init__(self, path: str | None = None) -> None:
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+        self._file = open(path, "w", encoding="utf-8") if path else None
+
+    def record(self, s: Span) -> None:
+        with self._lock:
+            self.spans.append(s)
+            if self._file:
+                self._file.write(json.dumps(s.to_dict(), default=str) + "\n")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+_tracer: Tracer | None = None
+
+
+def enable_tracing(path: str | None = None) -> Tracer:
+    """Start recording spans (and writing them to `path` as JSONL, if given)."""
+    global _tracer
+    if _tracer:
+        _tracer.close()
+    _tracer = Tracer(path)
+    return _tracer
+
+
+def disable_tracing() -> Tracer | None:
+    """Stop recording; returns the tracer so its spans can still be summarised."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer:
+        tracer.close()
+    return tracer
+
+
+def get_tracer() -> Tracer | None:
+    return _tracer
+
+
+@contextlib.contextmanager
+def trace_context(**attrs: Any) -> Iterator[None]:
+    """Attach attributes (e.g. sample_id) to every span opened inside this block."""
+    token = _context.set({**_context.get(), **attrs})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+@contextlib.contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Span | _NullSpan]:
+    tracer = _tracer
+    if tracer is None:
+        yield _NULL_SPAN
+        return
+    s = Span(name, {**_context.get(), **attrs})
+    started = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        s.set("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        s.duration_s = time.perf_counter() - started
+        tracer.record(s)
+
+
+def record_span(name: str, started: float, **attrs: Any) -> None:
+    """
+    Record a span that began at time.perf_counter() value `started` and ends now,
+    for a stage that is not one block of code (e.g. a row whose detection ran in
+    a shared batch request).
+    """
+    tracer = _tracer
+    if tracer is None:
+        return
+    s = Span(name, {**_context.get(), **attrs})
+    s.duration_s = time.perf_counter() - started
+    s.start = time.time() - s.duration_s
+    tracer.record(s)
+
+
+def _percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), int(round(p / 100.0 * len(ordered) + 0.5))))
+    return ordered[rank - 1]
+
+
+def summarize(spans: list[Span] | None = None) -> dict[str, dict[str, Any]]:
+    """Per-stage count, p50/p95/p99/mean latency (ms), token totals, cache hits and retries."""
+    if spans is None:
+        spans = _tracer.spans if _tracer else []
+    by_stage: dict[str, list[Span]] = {}
+    for s in spans:
+        by_stage.setdefault(s.name, []).append(s)
+    summary: dict[str, dict[str, Any]] = {}
+    for name, group in by_stage.items():
+        durations = [s.duration_s * 1000 for s in group]
+        summary[name] = {
+            "count": len(group),
+            "p50_ms": round(_percentile(durations, 50), 2),
+            "p95_ms": round(_percentile(durations, 95), 2),
+            "p99_ms": round(_percentile(durations, 99), 2),
+            "mean_ms": round(sum(durations) / len(durations), 2),
+            "prompt_tokens": sum(s.attrs.get("prompt_tokens", 0) for s in group),
+            "completion_tokens": sum(s.attrs.get("completion_tokens", 0) for s in group),
+            "cached_prompt_tokens": sum(s.attrs.get("cached_prompt_tokens", 0) for s in group),
+            "cache_hits": sum(1 for s in group if s.attrs.get("cache_hit")),
+            "retries": sum(s.attrs.get("retries", 0) for s in group),
+            "errors": sum(1 for s in group if "error" in s.attrs),
+        }
+    return summary
+
+
+def format_summary(spans: list[Span] | None = None) -> str:
+    """Render summarize() as a fixed-width table."""
+    summary = summarize(spans)
+    if not summary:
+        return "No spans recorded."
+    header = (
+        f"{'stage':<26}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        f"{'mean ms':>10}{'prompt tok':>12}{'compl tok':>11}{'cache':>7}{'retry':>7}{'err':>5}"
+    )
+    lines = [header, "-" * len(header)]
+    for name, st in sorted(summary.items(), key=lambda kv: -kv[1]["mean_ms"] * kv[1]["count"]):
+        lines.append(
+            f"{name:<26}{st['count']:>7}{st['p50_ms']:>10.1f}{st['p95_ms']:>10.1f}{st['p99_ms']:>10.1f}"
+            f"{st['mean_ms']:>10.1f}{st['prompt_tokens']:>12}{st['completion_tokens']:>11}"
+            f"{st['cache_hits']:>7}{st['retries']:>7}{st['errors']:>5}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,125 @@
+"""
+Token-aware packing of retrieved documentation into a prompt budget.
+
+Chunks are split into sentences (and code lines), each sentence is scored by
+the snippet identifiers it mentions (RDI methods / TA:: constants count double)
+per token, and the best sentences are added greedily until the token budget is
+spent. The kept sentences are emitted in their original order under the same
+"--- Chunk N ---" headers format_chunks_for_prompt uses, so prompts that cite
+chunks keep working.
+
+Tokens are counted with tiktoken when it is installed, otherwise with a
+word/punctuation heuristic that errs on the high side for code.
+"""
+
+import math
+import os
+import re
+from functools import lru_cache
+from typing import Any
+
+from agents.query_planner import api_terms
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+(?=[A-Z(`\"'])")
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+_WORD_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}")
+# Words in almost every RDI snippet or sentence; matching them says nothing
+_STOPWORDS = {"rdi", "the", "and", "for", "with", "this", "that", "rdi_begin", "rdi_end", "execute"}
+# Default doc budgets (tokens) per prompt (per snippet for batched detection); DOC_TOKEN_BUDGET overrides all
+DEFAULT_BUDGETS = {"detection": 450, "explanation": 550, "batch": 200}
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str) -> Any:
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    encoding = _encoding(model or os.getenv("MODEL", "gpt-4o-mini"))
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # ~4 characters per token for words, one token per punctuation mark
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in _PIECE_RE.findall(text))
+
+
+def doc_token_budget(purpose: str) -> int:
+    """Token budget for documentation in the `purpose` prompt (detection / explanation)."""
+    override = os.getenv(f"DOC_TOKEN_BUDGET_{purpose.upper()}") or os.getenv("DOC_TOKEN_BUDGET")
+    return int(override) if override else DEFAULT_BUDGETS.get(purpose, 500)
+
+
+def split_sentences(text: str) -> list[str]:
+    sentences = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line:
+            sentences.extend(s.strip() for s in _SENTENCE_RE.split(line) if s.strip())
+    return sentences
+
+
+def _snippet_weights(code: str) -> dict[str, float]:
+    weights = {w.lower(): 1.0 for w in _WORD_RE.findall(code) if w.lower() not in _STOPWORDS}
+    for term in api_terms(code):
+        weights[term.lower()] = 2.0
+    return weights
+
+
+def _sentence_score(sentence: str, weights: dict[str, float]) -> float:
+    words = {w.lower() for w in _WORD_RE.findall(sentence)}
+    words |= {f"ta::{m.lower()}" for m in re.findall(r"\bTA::(\w+)", sentence)}
+    return sum(weights.get(w, 0.0) for w in words)
+
+
+def pack_chunks_for_prompt(
+    chunks: list[dict[str, Any]], code: str, budget_tokens: int, model: str | None = None
+) -> str:
+    """Pack the most snippet-relevant sentences of chunks into at most budget_tokens tokens."""
+    if not chunks or budget_tokens <= 0:
+        return ""
+    weights = _snippet_weights(code)
+    candidates = []  # (density, chunk_index, sentence_index, sentence, tokens)
+    per_chunk: list[list[str]] = []
+    for ci, chunk in enumerate(chunks):
+        sentences = split_sentences(chunk.get("text") or "")
+        per_chunk.append(sentences)
+        for si, sentence in enumerate(sentences):
+            tokens = count_tokens(sentence, model)
+            score = _sentence_score(sentence, weights)
+            # Earlier (better-ranked) chunks win ties
+            candidates.append((score / tokens - ci * 1e-6, ci, si, sentence, tokens))
+
+    relevant = [c for c in candidates if c[0] > 0]
+    if not relevant:
+        # Nothing mentions the snippet's identifiers: keep the leading sentences of the top chunks
+        relevant = sorted(candidates, key=lambda c: (c[1], c[2]))
+    else:
+        relevant.sort(key=lambda c: -c[0])
+
+    kept: dict[int, set[int]] = {}
+    used = 0
+    for _, ci, si, _, tokens in relevant:
+        # Header cost the first time a chunk is used
+        header = 0 if ci in kept else count_tokens(f"--- Chunk {ci + 1} ---", model) + 1
+        if used + tokens + header > budget_tokens:
+            continue
+        kept.setdefault(ci, set()).add(si)
+        used += tokens + header
+
+    parts = []
+    for n, ci in enumerate(sorted(kept), 1):
+        lines = []
+        last = -1
+        for si in sorted(kept[ci]):
+            if si != last + 1:
+                lines.append("...")
+            lines.append(per_chunk[ci][si])
+            last = si
+        parts.append(f"--- Chunk {n} ---\n" + "\n".join(lines))
+    return "\n\n".join(parts)
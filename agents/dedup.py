@@ -0,0 +1,169 @@
+"""
+Near-duplicate detection across a batch of snippets.
+
+Production CSVs repeat the same snippet with different whitespace, comments
+(`// n`) or string literals (pin / port / label names). Each snippet is reduced
+to a canonical token stream (comments dropped, literals masked as STR) and
+fingerprinted with MinHash over token shingles; snippets whose estimated
+Jaccard similarity to a group's representative reaches the threshold (and whose
+context matches) join that group, and the pipeline runs once per group.
+
+Results are mapped back per member: the bug line is translated through a
+difflib alignment of canonical lines, and literals named in the explanation are
+swapped for the member's own. Members with an identical canonical form always
+reuse the result. Members that differ in code (e.g. a changed numeric value)
+reuse it only when the representative found a bug and every line up to it is
+unchanged; otherwise the mapping is refused and the member runs on its own.
+"""
+
+import difflib
+import re
+import zlib
+from dataclasses import dataclass, field
+
+_TOKEN_RE = re.compile(
+    r'(?P<comment>//[^\n]*|/\*.*?\*/)'
+    r'|(?P<string>"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\')'
+    r"|(?P<word>[A-Za-z_]\w*|\d+(?:\.\d+)?)"
+    r"|(?P<op>::|->|[^\s\w])",
+    re.DOTALL,
+)
+STRING_TOKEN = "STR"
+NUM_PERM = 64
+BANDS = 16
+_MERSENNE = (1 << 61) - 1
+# Fixed (a, b) pairs so fingerprints are stable across processes
+_PERMS = [
+    ((i * 0x9E3779B97F4A7C15 + 1) % _MERSENNE | 1, (i * 0xC2B2AE3D27D4EB4F + 7) % _MERSENNE)
+    for i in range(NUM_PERM)
+]
+
+
+@dataclass
+class Canonical:
+    tokens: list[str]
+    literals: list[str]
+    # (1-based original line number, canonical line) for lines with any code
+    lines: list[tuple[int, str]]
+    shingles: set[str] = field(default_factory=set)
+    signature: list[int] = field(default_factory=list)
+
+
+def canonicalize(code: str, shingle_size: int = 3) -> Canonical:
+    tokens: list[str] = []
+    literals: list[str] = []
+    per_line: dict[int, list[str]] = {}
+    for m in _TOKEN_RE.finditer(code):
+        if m.lastgroup == "comment":
+            continue
+        line = code.count("\n", 0, m.start()) + 1
+        if m.lastgroup == "string":
+            literals.append(m.group())
+            token = STRING_TOKEN
+        else:
+            token = m.group()
+        tokens.append(token)
+        per_line.setdefault(line, []).append(token)
+    lines = [(n, " ".join(toks)) for n, toks in sorted(per_line.items())]
+    shingles = {" ".join(tokens[i:i + shingle_size]) for i in range(max(1, len(tokens) - shingle_size + 1))}
+    return Canonical(tokens=tokens, literals=literals, lines=lines, shingles=shingles, signature=minhash(shingles))
+
+
+def minhash(shingles: set[str]) -> list[int]:
+    hashes = [zlib.crc32(s.encode("utf-8")) for s in shingles] or [0]
+    return [min((a * h + b) % _MERSENNE for h in hashes) for a, b in _PERMS]
+
+
+def estimated_jaccard(a: Canonical, b: Canonical) -> float:
+    return sum(1 for x, y in zip(a.signature, b.signature) if x == y) / NUM_PERM
+
+
+def group_near_duplicates(items: list[tuple[str, str]], threshold: float = 0.9) -> list[list[int]]:
+    """
+    Group (context, code) items; each group is [representative, members...] by
+    input index. A member is compared against representatives only (no chaining),
+    using LSH bands to find candidates and requiring identical normalized context.
+    """
+    rows_per_band = NUM_PERM // BANDS
+    canon = [canonicalize(code) for _, code in items]
+    contexts = [" ".join(context.split()).lower() for context, _ in items]
+    buckets: dict[tuple, list[int]] = {}
+    groups: dict[int, list[int]] = {}
+    for i, c in enumerate(canon):
+        keys = [
+            (contexts[i], band, tuple(c.signature[band * rows_per_band:(band + 1) * rows_per_band]))
+            for band in range(BANDS)
+        ]
+        candidates = dict.fromkeys(rep for key in keys for rep in buckets.get(key, []))
+        match = None
+        for rep in candidates:
+            if canon[rep].tokens == c.tokens or estimated_jaccard(canon[rep], c) >= threshold:
+                match = rep
+                break
+        if match is not None:
+            groups[match].append(i)
+            continue
+        groups[i] = [i]
+        for key in keys:
+            buckets.setdefault(key, []).append(i)
+    return list(groups.values())
+
+
+def map_line(rep: Canonical, member: Canonical, line: int) -> int | None:
+    """
+    Translate the representative's 1-based bug line (0 = no bug) to the member,
+    or None when the result can't safely be reused (see module docstring).
+    """
+    identical = rep.tokens == member.tokens
+    if line <= 0:
+        return 0 if identical else None
+    rep_index = next((i for i, (n, _) in enumerate(rep.lines) if n == line), None)
+    if rep_index is None:
+        return None
+    matcher = difflib.SequenceMatcher(
+        a=[text for _, text in rep.lines], b=[text for _, text in member.lines], autojunk=False
+    )
+    for tag, i1, i2, j1, _ in matcher.get_opcodes():
+        if tag != "equal":
+            if not identical and i1 <= rep_index:
+                # A change at or before the bug line could move or remove the bug
+                return None
+            continue
+        if i1 <= rep_index < i2:
+            return member.lines[j1 + rep_index - i1][0]
+    return None
+
+
+def translate_literals(text: str, rep: Canonical, member: Canonical) -> str:
+    """Replace the representative's string literals in text with the member's, position by position."""
+    if len(rep.literals) != len(member.literals):
+        return text
+    for old, new in zip(rep.literals, member.literals):
+        if old == new:
+            continue
+        text = text.replace(old, new)
+        bare_old, bare_new = old[1:-1], new[1:-1]
+        if bare_old and len(bare_old) > 2:
+            text = re.sub(rf"\b{re.escape(bare_old)}\b", bare_new.replace("\\", "\\\\"), text)
+    return text
+
+
+# Spans that wrap one LLM request each (see agent_core.tracing)
+LLM_SPANS = {"generate_search_queries", "detect_bug", "generate_explanation"}
+
+
+@dataclass
+class DedupReport:
+    rows: int = 0
+    groups: int = 0
+    reused: int = 0
+    rerun: int = 0
+    llm_calls: int = 0
+    llm_calls_saved: int = 0
+
+    def format(self) -> str:
+        return (
+            f"[Dedup] {self.rows} rows in {self.groups} groups: {self.reused} results reused, "
+            f"{self.rerun} re-run after line mapping failed; {self.llm_calls} LLM calls made, "
+            f"~{self.llm_calls_saved} saved"
+        )
@@ -3,6 +3,7 @@ Bug Detection Agent: decides if there is a bug and the exact line number
 where the bug first manifests. Uses LLM with optional MCP retrieval context.
 """
 
+import contextvars
 import json
 import os
 import re
@@ -10,46 +11,30 @@ from typing import Any
 
 from dotenv import load_dotenv
 
+from agent_core.tracing import span, trace_context
+
 load_dotenv()
 
+# Bug line reported when detection failed (API error or no parseable reply), distinct
+# from 0 = no bug; the pipeline writes it to the CSV as is
+UNRESOLVED_LINE = -1
+# Completion budget of one detection answer: a JSON object with a sentence of reasoning
+ANSWER_MAX_TOKENS = 200
 
-def detect_bug(
-    code: str,
-    mcp_chunks: list[dict[str, Any]] | None = None,
-    verbose: bool = False,
-) -> tuple[bool, int, str]:
-    """
-    Detect whether the code contains a bug and the first line where it manifests.
-    Returns: (bug_present, bug_line, reasoning).
-    """
-    from agent_core.llm_client import make_client
+
+def detection_messages(code: str, mcp_chunks: list[dict[str, Any]] | None = None) -> list[dict[str, str]]:
+    """Chat messages for detect_bug: the static system prefix, then the per-sample user message."""
     from agents.parsing import format_parsed_for_prompt, parse_code
-    from agents.mcp_lookup import format_chunks_for_prompt
+    from agents.context_packer import doc_token_budget, pack_chunks_for_prompt
+    from agents.prompt_prefix import detection_system_prompt
 
     parsed = parse_code(code)
     code_with_lines = format_parsed_for_prompt(parsed)
     doc_section = ""
     if mcp_chunks:
-        doc_section = "\n\nRelevant RDI API Documentation & Bug Patterns:\n" + format_chunks_for_prompt(mcp_chunks, max_chars=3000)
-
-    system = """You are a C++/RDI (SmartRDI API) expert. 
-Your task is to identify the first line (1-based) where a bug manifests.
-
-RDI bugs often involve multi-line sequences:
-1. Missing prerequisite calls (e.g., calling burst() before begin()).
-2. Invalid order of operations (e.g., RDI_END() before RDI_BEGIN()).
-3. State conflicts across lines (e.g., setting a range on line 5 that makes line 10 invalid).
-4. Missing cleanup or synchronization.
-
-Analyze the ENTIRE sequence or block.
-Identify the first line that is WRONG or represents the start of the ERROR.
-
-Reply exactly in this format:
-REASONING: <1-sentence description of the logic error>
-BUG: YES
-LINE: <line_number>
-
-If no bug: BUG: NO, LINE: 0"""
+        doc_section = "\n\nRelevant RDI API Documentation & Bug Patterns:\n" + pack_chunks_for_prompt(
+            mcp_chunks, code, doc_token_budget("detection")
+        )
 
     user = f"""Analyze this RDI code snippet for sequential and logic bugs.
 {doc_section}
@@ -58,26 +43,116 @@ Code with Line Numbers:
 {code_with_lines}
 
 Identify the bug and the first line where the sequence fails."""
+    return [
+        {"role": "system", "content": detection_system_prompt()},
+        {"role": "user", "content": user},
+    ]
+
+
+def triage_snippet(code: str, model: Any | None = None) -> Any:
+    """
+    First detection tier (agents/triage.py): rules plus a local classifier
+    (model, default the one trained on TRIAGE_TRAIN).
+    Returns a TriageResult whose tier is "clean", "flagged" or "escalate".
+    """
+    from agents.triage import triage
+
+    with span("triage") as s:
+        result = triage(code, model)
+        s.set("tier", result.tier)
+        s.set("probability", round(result.probability, 4))
+    return result
+
+
+def detect_bug(
+    code: str,
+    mcp_chunks: list[dict[str, Any]] | None = None,
+    verbose: bool = False,
+    triaged: Any | None = None,
+) -> tuple[bool, int, str]:
+    """
+    Detect whether the code contains a bug and the first line where it manifests.
+    With a triage_snippet() result, clean and flagged snippets are answered from
+    triage and only escalated ones reach the LLM.
+    Returns: (bug_present, bug_line, reasoning); bug_line is UNRESOLVED_LINE when
+    the request failed or no reply could be parsed, with the reason as reasoning.
+    """
+    from agent_core.llm_client import completion_options, make_client
+    from agent_core.structured import structured_completion
+
+    if triaged is not None and triaged.tier != "escalate":
+        if verbose:
+            print(f"[Detection] Triage tier {triaged.tier} (p={triaged.probability:.2f}): {triaged.reasoning}")
+        return triaged.tier == "flagged", triaged.line, triaged.reasoning
 
+    messages = detection_messages(code, mcp_chunks)
     try:
-        client = make_client()
-        model_name = os.getenv("MODEL", "gpt-4o-mini")
-        response = client.chat.completions.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": user},
-            ],
-            max_tokens=100, # Reduced
-        )
-        content = (response.choices[0].message.content or "").strip()
+        with span("detect_bug", doc_chunks=len(mcp_chunks or [])) as s:
+            answer, content = structured_completion(
+                make_client(),
+                messages,
+                detection_schema(len(code.splitlines())),
+                "detection",
+                fallback=_legacy_answer,
+                span=s,
+                check=check_answer,
+                model=os.getenv("MODEL", "gpt-4o-mini"),
+                max_tokens=ANSWER_MAX_TOKENS,
+                **completion_options(),
+            )
         if verbose:
             print(f"[Detection] Raw response: {content}")
     except Exception as e:
         import sys
         sys.stderr.write(f"[detect_bug] API error: {e}\n")
-        return False, 0, f"API Error: {e}"
+        return False, UNRESOLVED_LINE, f"API Error: {e}"
+
+    if answer is None:
+        import sys
+        sys.stderr.write(f"[detect_bug] Unparseable reply: {content[:200]!r}\n")
+        return False, UNRESOLVED_LINE, "Unparseable detection reply."
+    return _answer_tuple(answer)
 
+
+def detection_schema(n_lines: int) -> dict[str, Any]:
+    """JSON schema of one detection answer for a snippet of n_lines lines."""
+    return {
+        "type": "object",
+        "properties": {
+            "reasoning": {"type": "string"},
+            "bug": {"type": "boolean"},
+            "line": {"type": "integer", "minimum": 0, "maximum": max(n_lines, 0)},
+        },
+        "required": ["reasoning", "bug", "line"],
+    }
+
+
+def check_answer(answer: dict[str, Any]) -> list[str]:
+    """Errors for a schema-valid detection answer whose bug and line disagree."""
+    if answer["bug"] and answer["line"] < 1:
+        return ["$.line should be >= 1 when bug is true"]
+    if not answer["bug"] and answer["line"] != 0:
+        return ["$.line should be 0 when bug is false"]
+    return []
+
+
+def _answer_tuple(answer: dict[str, Any]) -> tuple[bool, int, str]:
+    """(bug_present, bug_line, reasoning) of an answer that passed check_answer()."""
+    reasoning = str(answer.get("reasoning") or "Unknown reasoning.").strip()
+    return answer["bug"], answer["line"], reasoning
+
+
+def _legacy_answer(content: str) -> dict[str, Any] | None:
+    """A REASONING / BUG / LINE text reply as a detection answer; None without BUG or LINE markers."""
+    upper = content.upper()
+    if "BUG:" not in upper and "LINE:" not in upper:
+        return None
+    bug_present, line, reasoning = parse_detection(content)
+    return {"reasoning": reasoning, "bug": bug_present, "line": line}
+
+
+def parse_detection(content: str) -> tuple[bool, int, str]:
+    """Parse a REASONING / BUG / LINE text reply into (bug_present, bug_line, reasoning)."""
     if "```" in content:
         content = re.sub(r"```[\w]*\n?", "", content).strip()
     
@@ -103,3 +178,294 @@ Identify the bug and the first line where the sequence fails."""
         line = 0
 
     return bug_present, line, reasoning
+
+
+# (base_url, model) pairs that ignored or rejected n > 1; later votes go straight to parallel calls
+_NO_N_SUPPORT: set[tuple[str, str]] = set()
+
+
+def _ballot(content: str, schema: dict[str, Any], model: str) -> list[tuple[bool, int, str]]:
+    """One vote per parseable sample (no re-ask); unparseable samples cast no vote."""
+    from agent_core.structured import parse_reply, record_outcome
+
+    answer, outcome, _ = parse_reply(content, schema, _legacy_answer, check_answer)
+    record_outcome(model, outcome)
+    return [] if answer is None else [_answer_tuple(answer)]
+
+
+def _tally(ballots: list[tuple[bool, int, str]]) -> tuple[int, int]:
+    """Most voted line and its count; ties go to the line voted first."""
+    counts: dict[int, int] = {}
+    for _, line, _ in ballots:
+        counts[line] = counts.get(line, 0) + 1
+    winner = max(dict.fromkeys(line for _, line, _ in ballots), key=lambda line: counts[line])
+    return winner, counts[winner]
+
+
+def detect_bug_voted(
+    code: str,
+    mcp_chunks: list[dict[str, Any]] | None = None,
+    votes: int = 3,
+    verbose: bool = False,
+    triaged: Any | None = None,
+) -> tuple[bool, int, str, float | None]:
+    """
+    Self-consistency detection: sample `votes` answers at DETECTION_VOTE_TEMPERATURE
+    (default 0.7) and take the majority line (0 = no bug). All samples are requested
+    in one call with n=votes; providers that ignore or reject n get parallel single
+    calls instead, and waiting stops as soon as one line holds a majority.
+    Returns: (bug_present, bug_line, reasoning, confidence), confidence being the
+    winning line's share of all `votes` samples, counting samples not received
+    after an early stop or left unparsed as disagreeing (None when not voting).
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    from agent_core.llm_client import completion_options, make_client
+    from agent_core.structured import create_structured
+
+    if votes <= 1 or (triaged is not None and triaged.tier != "escalate"):
+        return (*detect_bug(code, mcp_chunks, verbose=verbose, triaged=triaged), None)
+
+    messages = detection_messages(code, mcp_chunks)
+    model_name = os.getenv("MODEL", "gpt-4o-mini")
+    temperature = float(os.getenv("DETECTION_VOTE_TEMPERATURE", "0.7"))
+    client = make_client()
+    provider_key = (str(client.base_url), model_name)
+    majority = votes // 2 + 1
+    schema = detection_schema(len(code.splitlines()))
+    ballots: list[tuple[bool, int, str]] = []
+    errors: list[str] = []
+
+    def _request(n: int) -> list[str]:
+        with span("detect_bug", doc_chunks=len(mcp_chunks or []), votes=n) as s:
+            response = create_structured(
+                client,
+                schema,
+                "detection",
+                model=model_name,
+                messages=messages,
+                max_tokens=ANSWER_MAX_TOKENS,
+                temperature=temperature,
+                **({"n": n} if n > 1 else {}),
+                **completion_options(),
+            )
+            s.record_usage(response)
+        return [(c.message.content or "").strip() for c in response.choices]
+
+    received = 0
+    if provider_key not in _NO_N_SUPPORT:
+        try:
+            samples = _request(votes)[:votes]
+            if len(samples) < votes:
+                # The provider ignored n
+                _NO_N_SUPPORT.add(provider_key)
+        except Exception as e:
+            samples = []
+            errors.append(str(e))
+            if getattr(e, "status_code", None) in (400, 422):
+                # The provider rejected n; other errors (timeouts, 429, 5xx) say nothing about it
+                _NO_N_SUPPORT.add(provider_key)
+        received = len(samples)
+        for content in samples:
+            ballots.extend(_ballot(content, schema, model_name))
+
+    if received < votes and (not ballots or _tally(ballots)[1] < majority):
+        pool = ThreadPoolExecutor(max_workers=votes - received)
+        # Worker threads don't inherit contextvars; each vote runs in its own copy of the
+        # caller's context so its span (also one finishing after an early stop) keeps sample_id
+        pending = {pool.submit(contextvars.copy_context().run, _request, 1) for _ in range(votes - received)}
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        for content in future.result()[:1]:
+                            ballots.extend(_ballot(content, schema, model_name))
+                    except Exception as e:
+                        errors.append(str(e))
+                if ballots and _tally(ballots)[1] >= majority:
+                    break
+        finally:
+            # Don't wait for samples that can no longer change the outcome
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    if not ballots:
+        import sys
+        reason = f"API Error: {errors[-1]}" if errors else "No parseable detection votes."
+        sys.stderr.write(f"[detect_bug] {reason}\n")
+        return False, UNRESOLVED_LINE, reason, None
+
+    winner, count = _tally(ballots)
+    confidence = round(count / votes, 3)
+    reasoning = next(r for _, line, r in ballots if line == winner)
+    if verbose:
+        print(f"[Detection] Votes {[line for _, line, _ in ballots]} -> line {winner} (confidence {confidence})")
+    return winner > 0, winner, reasoning, confidence
+
+
+BATCH_INSTRUCTIONS = """Analyze each RDI code snippet below independently for sequential and logic bugs.
+Line numbers restart at 1 in every snippet.
+
+Reply with only a JSON object holding one answer per snippet, in snippet order:
+{"answers": [{"id": "<snippet id>", "reasoning": "<1 sentence>", "bug": true, "line": <first buggy line>}, ...]}
+Use "bug": false and "line": 0 when a snippet has no bug."""
+
+
+def _snippet_block(sample_id: str, code: str, mcp_chunks: list[dict[str, Any]] | None) -> str:
+    from agents.context_packer import doc_token_budget, pack_chunks_for_prompt
+    from agents.parsing import format_parsed_for_prompt, parse_code
+
+    block = f"=== SNIPPET {sample_id} ==="
+    if mcp_chunks:
+        docs = pack_chunks_for_prompt(mcp_chunks, code, doc_token_budget("batch"))
+        if docs:
+            block += f"\nRelevant documentation:\n{docs}"
+    return block + f"\nCode with Line Numbers:\n{format_parsed_for_prompt(parse_code(code))}"
+
+
+def pack_batches(blocks: list[tuple[str, str]], budget_tokens: int, max_snippets: int) -> list[list[tuple[str, str]]]:
+    """Greedily group (id, block) pairs, in order, into batches under budget_tokens and max_snippets."""
+    from agents.context_packer import count_tokens
+
+    batches: list[list[tuple[str, str]]] = []
+    current: list[tuple[str, str]] = []
+    used = 0
+    for sample_id, block in blocks:
+        tokens = count_tokens(block)
+        if current and (used + tokens > budget_tokens or len(current) >= max_snippets):
+            batches.append(current)
+            current, used = [], 0
+        # A snippet larger than the budget still gets a batch of its own
+        current.append((sample_id, block))
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "answers": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "string"},
+                    "reasoning": {"type": "string"},
+                    "bug": {"type": "boolean"},
+                    "line": {"type": "integer", "minimum": 0},
+                },
+                "required": ["id", "reasoning", "bug", "line"],
+            },
+        },
+    },
+    "required": ["answers"],
+}
+
+
+def parse_batch_answers(content: str, expected: dict[str, int]) -> tuple[dict[str, tuple[bool, int, str]], str]:
+    """
+    Map per-ID JSON answers back to samples. expected maps sample ID -> number of
+    code lines; answers for unknown IDs or failing detection_schema() or
+    check_answer() are dropped.
+    Accepts the {"answers": [...]} object or loose per-snippet objects.
+    Returns (answers, parse outcome as in agent_core.structured.parse_reply).
+    """
+    from agent_core.json_scan import iter_json_objects
+    from agent_core.structured import coerce, parse_reply, validate
+
+    whole, outcome, _ = parse_reply(content, BATCH_SCHEMA)
+    if whole is not None:
+        objects = whole["answers"]
+    else:
+        objects = []
+        for obj in iter_json_objects(content):
+            objects.extend(obj["answers"] if isinstance(obj.get("answers"), list) else [obj])
+    answers: dict[str, tuple[bool, int, str]] = {}
+    for obj in objects:
+        if not isinstance(obj, dict):
+            continue
+        sample_id = str(obj.get("id", "")).strip()
+        if sample_id not in expected or sample_id in answers:
+            continue
+        schema = detection_schema(expected[sample_id])
+        obj = coerce(obj, schema)
+        if validate(obj, schema) or check_answer(obj):
+            continue
+        answers[sample_id] = _answer_tuple(obj)
+    if whole is None and answers:
+        outcome = "repaired"
+    return answers, outcome
+
+
+def detect_bugs_batched(
+    items: list[tuple[str, str, list[dict[str, Any]] | None]],
+    max_snippets: int = 8,
+    workers: int = 1,
+    verbose: bool = False,
+) -> dict[str, tuple[bool, int, str]]:
+    """
+    Detect bugs in several (sample_id, code, mcp_chunks) snippets per request.
+    Snippets are packed into batches of at most max_snippets and
+    DETECTION_BATCH_TOKENS tokens (default 2500) behind the usual static system
+    prefix, and answered as one JSON object per ID within ANSWER_MAX_TOKENS
+    per snippet. Any ID whose answer is missing (e.g. cut off by a truncated
+    reply) or invalid falls back to a single-snippet detect_bug call.
+    Returns: {sample_id: (bug_present, bug_line, reasoning)}.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from agent_core.llm_client import completion_options, make_client
+    from agent_core.structured import create_structured, record_outcome
+    from agents.prompt_prefix import detection_system_prompt
+
+    budget = int(os.getenv("DETECTION_BATCH_TOKENS", "2500"))
+    by_id = {sample_id: (code, chunks) for sample_id, code, chunks in items}
+    blocks = [(sample_id, _snippet_block(sample_id, code, chunks)) for sample_id, code, chunks in items]
+    batches = pack_batches(blocks, budget, max_snippets)
+
+    def _run_batch(batch: list[tuple[str, str]]) -> dict[str, tuple[bool, int, str]]:
+        ids = [sample_id for sample_id, _ in batch]
+        expected = {sample_id: len(by_id[sample_id][0].splitlines()) for sample_id in ids}
+        user = BATCH_INSTRUCTIONS + "\n\n" + "\n\n".join(block for _, block in batch)
+        answers: dict[str, tuple[bool, int, str]] = {}
+        try:
+            with span("detect_bug_batch", snippets=len(batch), sample_ids=ids) as s:
+                model_name = os.getenv("MODEL", "gpt-4o-mini")
+                response = create_structured(
+                    make_client(),
+                    BATCH_SCHEMA,
+                    "detection_batch",
+                    model=model_name,
+                    messages=[
+                        {"role": "system", "content": detection_system_prompt()},
+                        {"role": "user", "content": user},
+                    ],
+                    max_tokens=ANSWER_MAX_TOKENS * len(batch) + 40,
+                    **completion_options(),
+                )
+                s.record_usage(response)
+                if getattr(response.choices[0], "finish_reason", None) == "length":
+                    s.set("truncated", True)
+                answers, outcome = parse_batch_answers(response.choices[0].message.content or "", expected)
+                record_outcome(model_name, outcome)
+                s.set("parse", outcome)
+                s.set("parsed", len(answers))
+        except Exception as e:
+            import sys
+            sys.stderr.write(f"[detect_bugs_batched] API error: {e}\n")
+        missing = [sample_id for sample_id in ids if sample_id not in answers]
+        if verbose:
+            print(f"[Detection] Batch of {len(ids)}: {len(answers)} parsed, {len(missing)} falling back")
+        for sample_id in missing:
+            code, chunks = by_id[sample_id]
+            with trace_context(sample_id=sample_id):
+                answers[sample_id] = detect_bug(code, mcp_chunks=chunks, verbose=verbose)
+        return answers
+
+    results: dict[str, tuple[bool, int, str]] = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches) or 1))) as pool:
+        for answers in pool.map(_run_batch, batches):
+            results.update(answers)
+    return results
@@ -0,0 +1,331 @@
+"""
+Evaluation harness: score the pipeline's bug lines against samples.csv.
+
+Ground truth is derived per row by diffing Code against Correct Code
+(agents/ground_truth.py). Every Correct Code snippet is also run as a negative
+sample (ID "<id>-fixed", truth 0) so false positives can be measured; the
+samples.csv rows all contain a bug. With triage, each row is screened by a
+classifier trained without its own sample (agents.triage.leave_one_out_model).
+
+Rows run in parallel through run_pipeline_row. Results are cached on disk per
+configuration fingerprint (provider, model, MCP settings, prompt prefix and the
+source of the agents that build the prompts), so re-running an unchanged
+configuration only runs new rows and a changed prompt or model starts fresh.
+
+Metrics:
+  exact                 predicted line == true line, over buggy rows
+  within_1              |predicted - true| <= 1 with a bug reported, over buggy rows
+  miss_rate             no bug reported, over buggy rows
+  false_positive_rate   bug reported, over negative rows
+  unresolved            rows whose detection failed (UNRESOLVED_LINE); they
+                        count as misses and are not cached, so a re-run retries them
+  tokens_per_row        prompt + completion tokens per row (cached rows included)
+  rows_per_s            rows run in this invocation per second of wall time
+  parse                 structured-reply outcomes per model for the rows run
+                        (agent_core/structured.py), when any LLM call was made
+"""
+
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+from agent_core.structured import parse_stats, reset_parse_stats
+from agent_core.tracing import disable_tracing, enable_tracing, get_tracer, span, trace_context
+from agents.dedup import LLM_SPANS
+from agents.detection import UNRESOLVED_LINE
+from agents.ground_truth import SAMPLES_CSV, load_samples
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+CACHE_DIR = Path(os.getenv("EVAL_CACHE_DIR", str(PROJECT_ROOT / ".eval_cache")))
+# Modules whose code shapes the prompts; editing any of them invalidates the cache
+_PROMPT_SOURCES = [
+    "agents/detection.py",
+    "agents/explanation.py",
+    "agents/prompt_prefix.py",
+    "agents/context_packer.py",
+    "agents/mcp_lookup.py",
+    "agents/query_planner.py",
+    "agents/orchestrator.py",
+    "agents/triage.py",
+    "agent_core/structured.py",
+]
+# Environment that changes what the pipeline answers
+_CONFIG_ENV = [
+    "API_PROVIDER", "OPENAI_BASE_URL", "MODEL", "MCP_SERVER_URL", "MCP_TOP_K", "MCP_RERANK", "MCP_ROUTING",
+    "QUERY_PLAN_MIN_SCORE", "DOC_TOKEN_BUDGET", "DOC_TOKEN_BUDGET_DETECTION", "DOC_TOKEN_BUDGET_EXPLANATION",
+    "FEW_SHOT_EXAMPLES", "TRIAGE_LOW", "TRIAGE_HIGH", "TRIAGE_TRAIN", "DETECTION_VOTE_TEMPERATURE",
+    "DOC_TOKEN_BUDGET_BATCH", "DETECTION_BATCH_TOKENS", "STRUCTURED_OUTPUT", "STRUCTURED_REASK",
+]
+
+
+@dataclass
+class EvalRow:
+    id: str
+    truth: int
+    predicted: int
+    explanation: str
+    tokens: int
+    cached: bool
+    tier: str | None = None
+    confidence: float | None = None
+
+
+def config_fingerprint(
+    use_mcp: bool, triage: bool = False, votes: int = 1, batch_size: int = 1
+) -> tuple[dict[str, Any], str]:
+    config = {name: os.getenv(name, "") for name in _CONFIG_ENV}
+    config["use_mcp"] = use_mcp
+    config["triage"] = triage
+    config["votes"] = votes
+    config["batch_size"] = batch_size
+    digest = hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8"))
+    for rel in _PROMPT_SOURCES:
+        path = PROJECT_ROOT / rel
+        if path.exists():
+            digest.update(path.read_bytes())
+    return config, digest.hexdigest()[:16]
+
+
+def _row_key(code: str, context: str) -> str:
+    return hashlib.sha256(f"{context}\0{code}".encode("utf-8")).hexdigest()
+
+
+def build_cases(
+    samples_path: Path = SAMPLES_CSV,
+    negatives: bool = True,
+    limit: int | None = None,
+) -> list[dict[str, Any]]:
+    """(id, context, code, truth) cases: each buggy sample, then its fixed version as a negative."""
+    rows = load_samples(samples_path)
+    if rows and "Bug Line" not in rows[0]:
+        raise ValueError(f"{samples_path} has no 'Correct Code' column to derive ground truth from")
+    if limit is not None:
+        rows = rows[:limit]
+    cases = []
+    for row in rows:
+        context = row.get("Context") or ""
+        cases.append({"id": str(row["ID"]), "context": context, "code": row["Code"].strip(), "truth": row["Bug Line"]})
+        if negatives and (row.get("Correct Code") or "").strip() and row["Bug Line"]:
+            cases.append({"id": f"{row['ID']}-fixed", "context": context, "code": row["Correct Code"].strip(), "truth": 0})
+    return cases
+
+
+def score(rows: list[EvalRow]) -> dict[str, Any]:
+    buggy = [r for r in rows if r.truth > 0]
+    clean = [r for r in rows if r.truth == 0]
+
+    def rate(hits: int, total: int) -> float | None:
+        return round(hits / total, 4) if total else None
+
+    return {
+        "rows": len(rows),
+        "buggy_rows": len(buggy),
+        "negative_rows": len(clean),
+        "exact": rate(sum(1 for r in buggy if r.predicted == r.truth), len(buggy)),
+        "within_1": rate(sum(1 for r in buggy if r.predicted > 0 and abs(r.predicted - r.truth) <= 1), len(buggy)),
+        "miss_rate": rate(sum(1 for r in buggy if r.predicted <= 0), len(buggy)),
+        "false_positive_rate": rate(sum(1 for r in clean if r.predicted > 0), len(clean)),
+        "unresolved": sum(1 for r in rows if r.predicted == UNRESOLVED_LINE),
+        "tokens_per_row": round(sum(r.tokens for r in rows) / len(rows), 1) if rows else None,
+    }
+
+
+def tier_metrics(rows: list[EvalRow]) -> dict[str, Any]:
+    """Share and exact accuracy of the rows each triage tier answered (escalate = the LLM detector)."""
+    from agents.triage import TIERS
+
+    metrics: dict[str, Any] = {}
+    for tier in TIERS:
+        group = [r for r in rows if r.tier == tier]
+        metrics[tier] = {
+            "rows": len(group),
+            "share": round(len(group) / len(rows), 4) if rows else None,
+            "exact": round(sum(1 for r in group if r.predicted == r.truth) / len(group), 4) if group else None,
+        }
+    return metrics
+
+
+def evaluate(
+    samples_path: Path = SAMPLES_CSV,
+    use_mcp: bool = True,
+    workers: int = 4,
+    limit: int | None = None,
+    negatives: bool = True,
+    use_cache: bool = True,
+    verbose: bool = False,
+    triage: bool = False,
+    votes: int = 1,
+    batch_size: int = 1,
+) -> dict[str, Any]:
+    from agents.orchestrator import run_pipeline_batch, run_pipeline_row
+    from agents.triage import leave_one_out_model
+
+    if batch_size > 1 and votes > 1:
+        raise ValueError("batch_size > 1 and votes > 1 cannot be combined; batched detection does not vote")
+
+    config, fingerprint = config_fingerprint(use_mcp, triage, votes, batch_size)
+    cache_path = CACHE_DIR / f"{fingerprint}.json"
+    cache: dict[str, Any] = {}
+    if use_cache and cache_path.exists():
+        cache = json.loads(cache_path.read_text(encoding="utf-8"))
+
+    cases = build_cases(samples_path, negatives=negatives, limit=limit)
+    todo = [c for c in cases if _row_key(c["code"], c["context"]) not in cache]
+
+    def _run(case: dict[str, Any]) -> tuple[int, str, float | None]:
+        with trace_context(sample_id=case["id"]), span("pipeline_row"):
+            _, line, explanation, confidence = run_pipeline_row(
+                case["id"], case["code"], context=case["context"] or None, use_mcp=use_mcp, verbose=verbose,
+                triage=triage, votes=votes, triage_model=leave_one_out_model,
+            )
+        return line, explanation, confidence
+
+    reset_parse_stats()
+    owns_tracer = get_tracer() is None
+    tracer = enable_tracing() if owns_tracer else get_tracer()
+    started = time.perf_counter()
+    try:
+        if batch_size > 1:
+            batched = run_pipeline_batch(
+                [(c["id"], c["code"], c["context"]) for c in todo], use_mcp=use_mcp, verbose=verbose,
+                triage=triage, batch_size=batch_size, workers=workers, triage_model=leave_one_out_model,
+            )
+            results = [(line, explanation, confidence) for _, line, explanation, confidence in batched]
+        else:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                results = list(pool.map(_run, todo))
+    finally:
+        elapsed = time.perf_counter() - started
+        if owns_tracer:
+            disable_tracing()
+
+    tokens: dict[str, int] = {}
+    tiers: dict[str, str] = {}
+    for s in tracer.spans:
+        if s.name == "triage":
+            tiers[str(s.attrs.get("sample_id"))] = s.attrs.get("tier")
+        if s.name in LLM_SPANS:
+            sid = str(s.attrs.get("sample_id"))
+            tokens[sid] = tokens.get(sid, 0) + s.attrs.get("prompt_tokens", 0) + s.attrs.get("completion_tokens", 0)
+        elif s.name == "detect_bug_batch" and s.attrs.get("sample_ids"):
+            # One request for several rows: split its tokens evenly
+            ids = s.attrs["sample_ids"]
+            share = (s.attrs.get("prompt_tokens", 0) + s.attrs.get("completion_tokens", 0)) / len(ids)
+            for sid in ids:
+                tokens[str(sid)] = tokens.get(str(sid), 0) + round(share)
+    fresh: dict[int, dict[str, Any]] = {}
+    for case, (line, explanation, confidence) in zip(todo, results):
+        fresh[id(case)] = {
+            "predicted": line, "explanation": explanation, "tokens": tokens.get(case["id"], 0),
+            "tier": tiers.get(case["id"]), "confidence": confidence,
+        }
+        if line != UNRESOLVED_LINE:
+            cache[_row_key(case["code"], case["context"])] = fresh[id(case)]
+    if use_cache and todo:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = cache_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(cache), encoding="utf-8")
+        os.replace(tmp, cache_path)
+
+    rows = []
+    for case in cases:
+        hit = fresh.get(id(case)) or cache[_row_key(case["code"], case["context"])]
+        rows.append(EvalRow(
+            id=case["id"], truth=case["truth"], predicted=hit["predicted"], explanation=hit["explanation"],
+            tokens=hit["tokens"], cached=id(case) not in fresh, tier=hit.get("tier"), confidence=hit.get("confidence"),
+        ))
+
+    metrics = score(rows)
+    metrics["cached_rows"] = len(cases) - len(todo)
+    metrics["rows_per_s"] = round(len(todo) / elapsed, 3) if todo and elapsed > 0 else None
+    if triage:
+        metrics["tiers"] = tier_metrics(rows)
+    if parse_stats():
+        metrics["parse"] = parse_stats()
+    return {
+        "config": {**config, "fingerprint": fingerprint, "workers": workers, "negatives": negatives,
+                   "samples": str(samples_path)},
+        "metrics": metrics,
+        "rows": [asdict(r) for r in rows],
+    }
+
+
+def format_metrics(metrics: dict[str, Any]) -> str:
+    def pct(value: float | None) -> str:
+        return "n/a" if value is None else f"{value:.1%}"
+
+    return (
+        f"[Eval] {metrics['rows']} rows ({metrics['buggy_rows']} buggy, {metrics['negative_rows']} negative, "
+        f"{metrics['cached_rows']} cached)\n"
+        f"  exact {pct(metrics['exact'])}  within_1 {pct(metrics['within_1'])}  "
+        f"miss {pct(metrics['miss_rate'])}  false_positive {pct(metrics['false_positive_rate'])}  "
+        f"unresolved {metrics['unresolved']}\n"
+        f"  tokens/row {metrics['tokens_per_row']}  rows/s {metrics['rows_per_s']}"
+    ) + "".join(
+        f"\n  parse {model}: first-try failure {pct(st['failure_rate'])}, {st['reasked']} re-asked, {st['failed']} failed"
+        for model, st in metrics.get("parse", {}).items()
+    ) + "".join(
+        f"\n  tier {tier}: {st['rows']} rows ({pct(st['share'])}), exact {pct(st['exact'])}"
+        for tier, st in metrics.get("tiers", {}).items()
+    )
+
+
+def compare(result: dict[str, Any], baseline: dict[str, Any]) -> str:
+    """Side-by-side metrics of two evaluation JSON files."""
+    keys = ["exact", "within_1", "miss_rate", "false_positive_rate", "tokens_per_row", "rows_per_s"]
+    lines = [f"{'metric':<22}{'this':>12}{'baseline':>12}{'delta':>12}"]
+    for key in keys:
+        a, b = result["metrics"].get(key), baseline["metrics"].get(key)
+        delta = f"{a - b:+.4g}" if isinstance(a, (int, float)) and isinstance(b, (int, float)) else ""
+        lines.append(f"{key:<22}{str(a):>12}{str(b):>12}{delta:>12}")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Score pipeline bug lines against samples.csv ground truth.")
+    parser.add_argument("input", nargs="?", default=str(SAMPLES_CSV), help="CSV with Code and Correct Code columns")
+    parser.add_argument("-o", "--output", default=None, help="Write the results JSON here (default: stdout)")
+    parser.add_argument("-j", "--workers", type=int, default=4, help="Rows evaluated concurrently (default: 4)")
+    parser.add_argument("-n", "--limit", type=int, default=None, help="Evaluate only the first N samples")
+    parser.add_argument("--no-mcp", action="store_true", help="Disable MCP documentation lookup")
+    parser.add_argument("--no-negatives", action="store_true", help="Do not run Correct Code as negative samples")
+    parser.add_argument("--triage", action="store_true", help="Evaluate the two-tier (triage + LLM) detector")
+    parser.add_argument("--votes", type=int, default=1, help="Detection samples per row, majority-voted")
+    parser.add_argument("--batch-size", type=int, default=1, help="Snippets per detection request (batched when > 1)")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore and do not update the result cache")
+    parser.add_argument("--compare", default=None, help="Baseline results JSON to compare against")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Verbose pipeline output")
+    args = parser.parse_args()
+    if args.batch_size > 1 and args.votes > 1:
+        parser.error("--batch-size and --votes cannot be combined")
+
+    result = evaluate(
+        samples_path=Path(args.input),
+        use_mcp=not args.no_mcp,
+        workers=args.workers,
+        limit=args.limit,
+        negatives=not args.no_negatives,
+        use_cache=not args.no_cache,
+        verbose=args.verbose,
+        triage=args.triage,
+        votes=args.votes,
+        batch_size=args.batch_size,
+    )
+    sys.stderr.write(format_metrics(result["metrics"]) + "\n")
+    text = json.dumps(result, indent=2)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        sys.stdout.write(text + "\n")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        sys.stderr.write(compare(result, baseline) + "\n")
@@ -8,8 +8,22 @@ from typing import Any
 
 from dotenv import load_dotenv
 
+from agent_core.tracing import span
+
 load_dotenv()
 
+EXPLANATION_SCHEMA = {
+    "type": "object",
+    "properties": {"explanation": {"type": "string", "minLength": 1}},
+    "required": ["explanation"],
+}
+
+
+def _plain_explanation(content: str) -> dict[str, str] | None:
+    """A plain-text reply as an explanation answer."""
+    text = content.strip()
+    return {"explanation": text} if text and not text.startswith("{") else None
+
 
 def generate_explanation(
     code: str,
@@ -20,10 +34,12 @@ def generate_explanation(
     """
     Generate a short explanation of the bug, grounded in MCP documentation.
     """
-    from agent_core.llm_client import make_client
-    from agents.mcp_lookup import format_chunks_for_prompt
+    from agent_core.llm_client import completion_options, make_client
+    from agent_core.structured import structured_completion
+    from agents.context_packer import doc_token_budget, pack_chunks_for_prompt
+    from agents.prompt_prefix import explanation_system_prompt
 
-    docs_text = format_chunks_for_prompt(mcp_chunks, max_chars=3500)
+    docs_text = pack_chunks_for_prompt(mcp_chunks, code, doc_token_budget("explanation"))
     
     docs_instruction = ""
     if docs_text:
@@ -31,12 +47,6 @@ def generate_explanation(
     else:
         docs_instruction = "No documentation was found in the search. Do NOT cite any 'Doc' or 'Chunk'. Explain the bug based on general C++ knowledge or the internal reasoning provided."
 
-    system = f"""You are an RDI expert. Write a 1-sentence explanation of the bug.
-1. {docs_instruction}
-2. Incorporate the detection reasoning.
-3. Be remarkably concise. STRICTLY 1 SENTENCE. Maximum 60 words ONLY.
-4. Use format: BUG: <bug description> and do not cite chunk sources."""
-
     reasoning_part = f"\nReasoning: {detection_reasoning}\n" if detection_reasoning else ""
 
     user = f"""Code:
@@ -46,19 +56,26 @@ Line: {bug_line}
 {reasoning_part}
 {f"Docs:\n{docs_text}" if docs_text else ""}
 
-Write 1-sentence explanation:"""
+{docs_instruction}
+Write the 1-sentence explanation as JSON:"""
 
     try:
-        client = make_client()
-        response = client.chat.completions.create(
-            model=os.getenv("MODEL", "gpt-4o-mini"),
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": user},
-            ],
-            max_tokens=80, # Reduced
-        )
-        content = (response.choices[0].message.content or "").strip()
+        with span("generate_explanation", doc_chunks=len(mcp_chunks)) as s:
+            answer, _ = structured_completion(
+                make_client(),
+                [
+                    {"role": "system", "content": explanation_system_prompt()},
+                    {"role": "user", "content": user},
+                ],
+                EXPLANATION_SCHEMA,
+                "explanation",
+                fallback=_plain_explanation,
+                span=s,
+                model=os.getenv("MODEL", "gpt-4o-mini"),
+                max_tokens=100, # Reduced
+                **completion_options(),
+            )
+        content = answer["explanation"] if answer else ""
         return content.replace("\n", " ").strip() or "Bug on line {}.".format(bug_line)
     except Exception as e:
         return f"Bug on line {bug_line}. (Explanation unavailable: {e})"
@@ -0,0 +1,38 @@
+"""
+Ground-truth bug lines derived from samples.csv.
+
+samples.csv has no Bug Line column; the first line where Code differs from
+Correct Code is taken as the line where the bug manifests (1-based in Code,
+0 when the two are identical). Comparison ignores surrounding whitespace.
+"""
+
+import csv
+import difflib
+from pathlib import Path
+from typing import Any
+
+SAMPLES_CSV = Path(__file__).resolve().parent.parent / "samples.csv"
+
+
+def bug_line(code: str, correct_code: str) -> int:
+    buggy = [line.strip() for line in code.splitlines()]
+    fixed = [line.strip() for line in correct_code.splitlines()]
+    matcher = difflib.SequenceMatcher(a=buggy, b=fixed, autojunk=False)
+    for tag, i1, i2, _, _ in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        if i1 < len(buggy):
+            return i1 + 1
+        # Only lines appended at the end differ: blame the last line
+        return len(buggy)
+    return 0
+
+
+def load_samples(path: Path = SAMPLES_CSV) -> list[dict[str, Any]]:
+    """samples.csv rows with an added int "Bug Line" derived from Correct Code."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    for row in rows:
+        if "Correct Code" in row:
+            row["Bug Line"] = bug_line(row.get("Code") or "", row.get("Correct Code") or "")
+    return rows
@@ -6,11 +6,21 @@ documentation grounding in the bug detection pipeline.
 """
 
 import asyncio
+import contextlib
+import json
 import os
-from typing import Any
+from typing import Any, AsyncIterator
 
 
-def search_documents(query: str, url: str | None = None, timeout: float = 30.0) -> list[dict[str, Any]]:
+def search_documents(
+    query: str,
+    url: str | None = None,
+    timeout: float = 30.0,
+    top_k: int | None = None,
+    collection: str | None = None,
+    mode: str | None = None,
+    context: str | None = None,
+) -> list[dict[str, Any]]:
     """
     Search documents using the MCP server's vector retrieval (sync wrapper).
 
@@ -18,16 +28,27 @@ def search_documents(query: str, url: str | None = None, timeout: float = 30.0)
         query: Search query string.
         url: MCP SSE URL (default from MCP_SERVER_URL or http://localhost:8003/sse).
         timeout: Request timeout in seconds.
+        top_k: Maximum results to return (server default when None).
+        collection: Collection to search, e.g. "api_docs" (server default when None).
+        mode: "vector", "keyword" or "hybrid" (server default when None).
+        context: Code snippet to rerank a wider candidate set against (no reranking when None).
 
     Returns:
         List of dicts with "text" and "score" keys (same as server's search_documents).
     """
-    return asyncio.run(_search_documents_async(query, url=url, timeout=timeout))
+    return asyncio.run(
+        _search_documents_async(
+            query, url=url, timeout=timeout, top_k=top_k, collection=collection, mode=mode, context=context
+        )
+    )
 
 
-async def _search_documents_async(
-    query: str, url: str | None = None, timeout: float = 30.0
-) -> list[dict[str, Any]]:
+def server_url(url: str | None = None) -> str:
+    """The MCP SSE URL to connect to: url, else MCP_SERVER_URL, else the local default."""
+    return url or os.getenv("MCP_SERVER_URL", "http://localhost:8003/sse")
+
+
+def _make_client(url: str | None = None) -> Any:
     try:
         from fastmcp import Client
         from fastmcp.client.transports import SSETransport
@@ -36,16 +57,57 @@ async def _search_documents_async(
             "FastMCP client requires: pip install fastmcp"
         ) from None
 
-    base_url = url or os.getenv("MCP_SERVER_URL", "http://localhost:8003/sse")
-    transport = SSETransport(url=base_url)
-    client = Client(transport)
+    transport = SSETransport(url=server_url(url))
+    return Client(transport)
+
 
+@contextlib.asynccontextmanager
+async def open_session(url: str | None = None) -> AsyncIterator[Any]:
+    """One MCP connection that several concurrent call_search() calls can share."""
+    client = _make_client(url)
     async with client:
-        result = await asyncio.wait_for(
-            client.call_tool("search_documents", {"query": query}),
-            timeout=timeout,
+        yield client
+
+
+async def _search_documents_async(
+    query: str,
+    url: str | None = None,
+    timeout: float = 30.0,
+    top_k: int | None = None,
+    collection: str | None = None,
+    mode: str | None = None,
+    context: str | None = None,
+) -> list[dict[str, Any]]:
+    async with open_session(url) as client:
+        return await call_search(
+            client, query, timeout=timeout, top_k=top_k, collection=collection, mode=mode, context=context
         )
 
+
+async def call_search(
+    client: Any,
+    query: str,
+    timeout: float = 30.0,
+    top_k: int | None = None,
+    collection: str | None = None,
+    mode: str | None = None,
+    context: str | None = None,
+) -> list[dict[str, Any]]:
+    """search_documents over an open session (see open_session); same arguments as search_documents."""
+    arguments: dict[str, Any] = {"query": query}
+    if top_k is not None:
+        arguments["top_k"] = top_k
+    if collection:
+        arguments["collection"] = collection
+    if mode:
+        arguments["mode"] = mode
+    if context:
+        arguments["context"] = context
+    result = await asyncio.wait_for(
+        client.call_tool("search_documents", arguments),
+        timeout=timeout,
+    )
+
     if getattr(result, "is_error", False):
         err_msg = (
             result.content[0].text
@@ -61,7 +123,6 @@ async def _search_documents_async(
     content = getattr(result, "content", []) or []
     for block in content:
         if hasattr(block, "text") and block.text:
-            import json
             try:
                 parsed = json.loads(block.text)
                 if isinstance(parsed, list):
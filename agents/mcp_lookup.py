@@ -3,10 +3,27 @@ MCP Documentation Lookup Agent: builds queries from code/context and calls
 the MCP server's search_documents to retrieve relevant docs/bug patterns.
 """
 
+import asyncio
 import os
+import re
+import time
 from typing import Any
 
-from agents.mcp_client import search_documents
+from agent_core.tracing import span
+from agents.mcp_client import call_search, open_session, server_url
+
+
+QUERIES_SCHEMA = {
+    "type": "object",
+    "properties": {"queries": {"type": "array", "items": {"type": "string"}, "minItems": 1}},
+    "required": ["queries"],
+}
+
+
+def _query_lines(content: str) -> dict[str, list[str]] | None:
+    """A one-query-per-line text reply as a queries answer."""
+    lines = [q.strip("- ").strip('"').strip() for q in content.splitlines() if q.strip()]
+    return {"queries": lines} if lines and not content.lstrip().startswith("{") else None
 
 
 def generate_search_queries(
@@ -15,40 +32,51 @@ def generate_search_queries(
     """
     Generate targeted search queries. Focus on reducing token usage for analysis.
     """
-    from agent_core.llm_client import make_client
-    import re
+    from agent_core.llm_client import completion_options, make_client
+    from agent_core.structured import structured_completion
+    from agents.query_planner import plan_queries
 
     queries = []
 
-    # 1. Regex-based extraction (zero-token cost)
-    methods = re.findall(r"\.([a-zA-Z0-9_]+)\(", code_snippet)
-    objects = re.findall(r"rdi\.([a-zA-Z0-9_]+)", code_snippet)
-    
-    technical_terms = list(set(methods + objects))
-    for term in technical_terms[:3]: # Further reduced
-        queries.append(f"RDI API {term}")
+    # 1. Deterministic plan from the RDI call chains (zero-token cost)
+    with span("plan_queries") as s:
+        plan = plan_queries(code_snippet)
+        s.set("plan_score", plan.score)
+    queries.extend(plan.queries)
+    # The hypothesis (sample context) is a ready-made free-text query for the bug patterns
+    if hypothesis and hypothesis.strip():
+        queries.insert(min(2, len(queries)), hypothesis.strip().splitlines()[0][:120])
 
-    # 2. LLM-based query generation (using smaller snippet)
-    try:
-        system = "Suggest 2 RDI search queries. One per line. No quotes."
-        user = f"Code:\n{code_snippet[:500]}\n" # Reduced snippet size
-        if hypothesis:
-            user += f"Hypothesis: {hypothesis}\n"
-
-        client = make_client()
-        response = client.chat.completions.create(
-            model=os.getenv("MODEL", "gpt-4o-mini"),
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": user},
-            ],
-            max_tokens=40, # Reduced
-        )
-        llm_content = (response.choices[0].message.content or "").strip()
-        llm_queries = [q.strip("- ").strip('"').strip() for q in llm_content.splitlines() if q.strip()]
-        queries.extend(llm_queries)
-    except Exception:
-        pass
+    # 2. LLM-based query generation, only when the plan covers too few known API terms
+    min_score = float(os.getenv("QUERY_PLAN_MIN_SCORE", "0.5"))
+    if plan.score < min_score or not plan.queries:
+        if verbose:
+            print(f"[MCP Lookup] Query plan score {plan.score} < {min_score}; asking the LLM for queries.")
+        try:
+            system = 'Suggest 2 RDI search queries. Reply with only JSON: {"queries": ["<query>", "<query>"]}'
+            user = f"Code:\n{code_snippet[:500]}\n" # Reduced snippet size
+            if hypothesis:
+                user += f"Hypothesis: {hypothesis}\n"
+
+            with span("generate_search_queries") as s:
+                answer, _ = structured_completion(
+                    make_client(),
+                    [
+                        {"role": "system", "content": system},
+                        {"role": "user", "content": user},
+                    ],
+                    QUERIES_SCHEMA,
+                    "search_queries",
+                    fallback=_query_lines,
+                    span=s,
+                    model=os.getenv("MODEL", "gpt-4o-mini"),
+                    max_tokens=60, # Reduced
+                    **completion_options(),
+                )
+            if answer:
+                queries.extend(q.strip() for q in answer["queries"] if q.strip())
+        except Exception:
+            pass
 
     # 3. Fallback
     first_line = code_snippet.strip().split("\n")[0][:60].strip()
@@ -67,34 +95,162 @@ def generate_search_queries(
     return final_queries[:4] # Reduced
 
 
+# Queries naming an API (regex-extracted "RDI API x", calls, camelCase, Class::member)
+# go to the API docs; free-text hypothesis queries go to the bug patterns.
+_IDENTIFIER_QUERY_RE = re.compile(r"^RDI API |::|\w\.\w|\w\(|\b[a-z]+[A-Z]\w*")
+# Collections each server (by URL) reported as unknown; skipped there for the rest of the run
+_missing_collections: dict[str, set[str]] = {}
+# Rank offset for fusing the result lists of several queries (as in the server's hybrid mode)
+FUSION_K = 60
+# Queries that must have answered before the rest may be cancelled early
+EARLY_STOP_MIN_QUERIES = 2
+
+
+def route_query(query: str, url: str | None = None) -> list[tuple[str, str]]:
+    """
+    (collection, mode) pairs to try in order for a query against the server at
+    url. The default collection is always the last fallback; MCP_ROUTING=0
+    searches only the default collection.
+    """
+    if os.getenv("MCP_ROUTING", "1") == "0":
+        return [("default", "vector")]
+    if _IDENTIFIER_QUERY_RE.search(query):
+        routes = [("api_docs", "hybrid")]
+    else:
+        routes = [("bug_patterns", "vector")]
+    routes.append(("default", "vector"))
+    missing = _missing_collections.get(server_url(url), set())
+    return [(c, m) for c, m in routes if c not in missing]
+
+
+async def _search_routed(
+    client: Any, query: str, top_k: int, timeout: float, context: str | None = None, url: str | None = None
+) -> list[dict[str, Any]]:
+    """Search the routed collections in order until one returns results."""
+    for collection, mode in route_query(query, url):
+        try:
+            with span("search_documents", query=query, collection=collection) as s:
+                results = await call_search(
+                    client, query, timeout=timeout, top_k=top_k, collection=collection, mode=mode, context=context
+                )
+                s.set("results", len(results))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The client raises on tool errors; older clients return them as an "error" result instead
+            results = [{"text": "", "score": 0.0, "error": str(e)}]
+        errors = [r["error"] for r in results if r.get("error")]
+        if any("Unknown collection" in e for e in errors):
+            _missing_collections.setdefault(server_url(url), set()).add(collection)
+            continue
+        if results and not errors:
+            return results
+    return []
+
+
+async def _fan_out(
+    queries: list[str], top_k: int, timeout: float, context: str | None, verbose: bool
+) -> list[dict[str, Any]]:
+    """
+    Issue every query concurrently over one MCP session and merge results as they
+    arrive. Each query's results come from a different collection and mode, and
+    their scores are not comparable (cosine, BM25, fused ranks, reranker scores),
+    so chunks are merged by rank: a chunk scores sum(1 / (FUSION_K + rank)) over
+    the queries that returned it, divided by what rank 1 in every query answered
+    so far would give. That puts "score" in 0..1, roughly the share of the
+    answered queries that found the chunk; the server's own score is kept as
+    "source_score".
+
+    Stops at the overall deadline, or, once EARLY_STOP_MIN_QUERIES queries have
+    answered, as soon as top_k chunks score at least MCP_EARLY_STOP_SCORE
+    (default 0.4) on that scale, cancelling the rest. With the defaults that is
+    two queries returning top_k chunks between them; after more answers a chunk
+    needs more of them to agree.
+    """
+    early_score = float(os.getenv("MCP_EARLY_STOP_SCORE", "0.4"))
+    deadline = time.monotonic() + timeout
+    url = server_url()
+    merged: dict[str, dict[str, Any]] = {}
+    fused: dict[str, float] = {}
+    answered = 0
+
+    async with open_session(url) as client:
+        pending = {
+            asyncio.create_task(
+                _search_routed(client, q, top_k, max(0.1, deadline - time.monotonic()), context, url)
+            )
+            for q in queries
+        }
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled() or task.exception() is not None:
+                        continue
+                    answered += 1
+                    ranked = sorted(
+                        (r for r in task.result() if (r.get("text") or "").strip() and not r.get("error")),
+                        key=lambda r: -(r.get("score") or 0.0),
+                    )
+                    seen: set[str] = set()
+                    for rank, r in enumerate(ranked, 1):
+                        text = r["text"].strip()
+                        if text in seen:
+                            continue
+                        seen.add(text)
+                        merged.setdefault(text, r)
+                        fused[text] = fused.get(text, 0.0) + 1.0 / (FUSION_K + rank)
+                if answered < min(EARLY_STOP_MIN_QUERIES, len(queries)):
+                    continue
+                support = answered / (FUSION_K + 1)
+                strong = sum(1 for score in fused.values() if score / support >= early_score)
+                if strong >= top_k:
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+    if verbose and pending:
+        print(f"[MCP Lookup] Cancelled {len(pending)} outstanding queries.")
+
+    best = sorted(fused, key=lambda text: -fused[text])[:top_k]
+    support = max(answered, 1) / (FUSION_K + 1)
+    return [
+        {**merged[text], "source_score": merged[text].get("score"), "score": round(fused[text] / support, 4)}
+        for text in best
+    ]
+
+
 def lookup_docs(
     code_snippet: str,
     hypothesis: str | None = None,
-    top_k: int = 5, # Reduced from 10
+    top_k: int | None = None,
     timeout: float = 30.0,
     verbose: bool = False,
 ) -> list[dict[str, Any]]:
     """
-    Retrieve relevant documentation. top_k=5 to stay within token limits.
+    Retrieve relevant documentation. With server-side reranking against the
+    snippet (MCP_RERANK, default on) the top 3 chunks are kept, otherwise 5,
+    to stay within token limits. `timeout` is the deadline for all queries together.
     """
+    rerank = os.getenv("MCP_RERANK", "1") != "0"
+    if top_k is None:
+        top_k = int(os.getenv("MCP_TOP_K", "3" if rerank else "5"))
+    context = code_snippet[:2000] if rerank else None
     queries = generate_search_queries(code_snippet, hypothesis, verbose=verbose)
+    if not queries:
+        return []
 
-    all_chunks: list[dict[str, Any]] = []
-    seen: set[str] = set()
-    for q in queries:
-        try:
-            results = search_documents(q, timeout=timeout)
-            for r in results:
-                text = (r.get("text") or "").strip()
-                if text and text not in seen and not r.get("error"):
-                    seen.add(text)
-                    all_chunks.append(r)
-        except Exception:
-            continue
-        if len(all_chunks) >= top_k:
-            break
-            
-    return all_chunks[:top_k]
+    try:
+        return asyncio.run(_fan_out(queries, top_k, timeout, context, verbose))
+    except Exception as e:
+        if verbose:
+            print(f"[MCP Lookup] Search failed: {e}")
+        return []
 
 
 def format_chunks_for_prompt(chunks: list[dict[str, Any]], max_chars: int = 2000) -> str: # Reduced from 4000
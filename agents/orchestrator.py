@@ -6,8 +6,10 @@ and outputs CSV with columns ID, Bug Line, Explanation.
 import csv
 import io
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
 
 # Project root for imports when run as script
 if __name__ == "__main__":
@@ -15,7 +17,17 @@ if __name__ == "__main__":
     if str(_root) not in sys.path:
         sys.path.insert(0, str(_root))
 
-from agents.detection import detect_bug
+from agent_core.structured import format_parse_stats, parse_stats, reset_parse_stats
+from agent_core.tracing import (
+    disable_tracing,
+    enable_tracing,
+    format_summary,
+    get_tracer,
+    record_span,
+    span,
+    trace_context,
+)
+from agents.detection import UNRESOLVED_LINE, detect_bug_voted, detect_bugs_batched, triage_snippet
 from agents.explanation import generate_explanation
 from agents.mcp_lookup import lookup_docs
 
@@ -26,21 +38,38 @@ def run_pipeline_row(
     context: str | None = None,
     use_mcp: bool = True,
     verbose: bool = False,
-) -> tuple[str, int, str]:
+    triage: bool = False,
+    votes: int = 1,
+    triage_model: Callable[[str], Any] | None = None,
+) -> tuple[str, int, str, float | None]:
     """
     Run the pipeline for one code snippet.
     Collaboration: Lookup -> Detect (with Reasoning) -> Explain (using Docs + Reasoning).
+    With triage, snippets the first tier clears skip lookup and detection entirely;
+    triage_model(code) picks the classifier (default: the one trained on TRIAGE_TRAIN).
+    With votes > 1, detection takes a majority over that many samples.
+    Returns: (sample_id, bug_line, explanation, confidence); confidence is the
+    vote agreement, None without voting. When detection failed, bug_line is
+    UNRESOLVED_LINE and the explanation says why (not "No bug detected.").
     """
     if verbose:
         print(f"\n[Orchestrator] Processing Sample {sample_id}...")
 
+    triaged = triage_snippet(code, triage_model(code) if triage_model else None) if triage else None
+    if triaged is not None and triaged.tier == "clean":
+        if verbose:
+            print(f"[Orchestrator] Triage cleared the snippet (p={triaged.probability:.2f}).")
+        return sample_id, 0, "No bug detected.", None
+
     # 1. MCP Lookup (Agentic Querying)
     mcp_chunks = lookup_docs(code, hypothesis=context, timeout=25.0, verbose=verbose) if use_mcp else []
     if verbose:
         print(f"[Orchestrator] Retrieved {len(mcp_chunks)} doc chunks.")
 
     # 2. Bug Detection (returns reasoning)
-    bug_present, bug_line, reasoning = detect_bug(code, mcp_chunks=mcp_chunks, verbose=verbose)
+    bug_present, bug_line, reasoning, confidence = detect_bug_voted(
+        code, mcp_chunks=mcp_chunks, votes=votes, verbose=verbose, triaged=triaged
+    )
     if verbose:
         status = f"YES on line {bug_line}" if bug_present else "NO"
         # Clean reasoning for clean terminal output
@@ -48,7 +77,9 @@ def run_pipeline_row(
         print(f"[Orchestrator] Bug Detected: {status}")
         print(f"[Orchestrator] Detection Reasoning: {clean_reasoning}")
 
-    if not bug_present or bug_line <= 0:
+    if bug_line == UNRESOLVED_LINE:
+        explanation = _unresolved_explanation(reasoning)
+    elif not bug_present or bug_line <= 0:
         explanation = "No bug detected."
     else:
         # 3. Explanation Generation (grounded in MCP + reasoning)
@@ -57,7 +88,73 @@ def run_pipeline_row(
             clean_explanation = explanation.replace("\r", " ").replace("\n", " ").strip()
             print(f"[Orchestrator] Explanation generated: {clean_explanation[:100]}...")
 
-    return sample_id, bug_line, explanation
+    return sample_id, bug_line, explanation, confidence
+
+
+def _unresolved_explanation(reason: str) -> str:
+    return f"UNRESOLVED: detection failed ({reason.rstrip('.')}); re-run this row."
+
+
+def run_pipeline_batch(
+    rows: list[tuple[str, str, str]],
+    use_mcp: bool = True,
+    verbose: bool = False,
+    triage: bool = False,
+    batch_size: int = 8,
+    workers: int = 1,
+    triage_model: Callable[[str], Any] | None = None,
+) -> list[tuple[str, int, str, float | None]]:
+    """
+    Run the pipeline for (sample_id, code, context) rows with batched detection:
+    lookup (and triage) per row, then several snippets per detection request
+    (see detect_bugs_batched), then one explanation per buggy row.
+    triage_model is as in run_pipeline_row. Each row gets a pipeline_row span
+    from the start of its lookup to the end of its explanation.
+    """
+    started = [0.0] * len(rows)
+
+    def _prepare(i: int) -> tuple[Any, list[dict[str, Any]]]:
+        sample_id, code, context = rows[i]
+        started[i] = time.perf_counter()
+        with trace_context(sample_id=sample_id):
+            triaged = triage_snippet(code, triage_model(code) if triage_model else None) if triage else None
+            if triaged is not None and triaged.tier == "clean":
+                return triaged, []
+            chunks = lookup_docs(code, hypothesis=context or None, timeout=25.0, verbose=verbose) if use_mcp else []
+            return triaged, chunks
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        prepared = list(pool.map(_prepare, range(len(rows))))
+
+    # Keys the model sees; sample IDs unless the input repeats one
+    ids = [sample_id for sample_id, _, _ in rows]
+    keys = ids if len(set(ids)) == len(ids) else [f"{sample_id}#{i}" for i, sample_id in enumerate(ids)]
+    pending = [
+        (keys[i], rows[i][1], chunks)
+        for i, (triaged, chunks) in enumerate(prepared)
+        if triaged is None or triaged.tier == "escalate"
+    ]
+    detected = detect_bugs_batched(pending, max_snippets=batch_size, workers=workers, verbose=verbose)
+    for i, (triaged, _) in enumerate(prepared):
+        if triaged is not None and triaged.tier != "escalate":
+            detected[keys[i]] = (triaged.tier == "flagged", triaged.line, triaged.reasoning)
+
+    def _explain(i: int) -> tuple[str, int, str, float | None]:
+        sample_id, code, _ = rows[i]
+        bug_present, bug_line, reasoning = detected[keys[i]]
+        if bug_line == UNRESOLVED_LINE:
+            result = sample_id, UNRESOLVED_LINE, _unresolved_explanation(reasoning), None
+        elif not bug_present or bug_line <= 0:
+            result = sample_id, 0, "No bug detected.", None
+        else:
+            with trace_context(sample_id=sample_id):
+                explanation = generate_explanation(code, bug_line, prepared[i][1], detection_reasoning=reasoning)
+            result = sample_id, bug_line, explanation, None
+        record_span("pipeline_row", started[i], sample_id=sample_id, batched=True)
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return list(pool.map(_explain, range(len(rows))))
 
 
 def run_pipeline_csv(
@@ -66,6 +163,13 @@ def run_pipeline_csv(
     use_mcp: bool = True,
     limit: int | None = None,
     verbose: bool = False,
+    workers: int = 1,
+    trace_path: Path | None = None,
+    dedup: bool = False,
+    dedup_threshold: float = 0.9,
+    triage: bool = False,
+    votes: int = 1,
+    batch_size: int = 1,
 ) -> None:
     """
     Run pipeline on samples.csv (or given path) and write CSV with ID, Bug Line, Explanation.
@@ -75,7 +179,22 @@ def run_pipeline_csv(
         output_path: Output CSV path; if None, print to stdout.
         use_mcp: Whether to call MCP server for documentation lookup.
         limit: If set, process only the first N rows (for testing).
+        workers: Number of rows processed concurrently (output order is preserved).
+        trace_path: If set, write per-stage spans as JSONL here and print a
+            latency summary table to stderr at the end of the run.
+        dedup: Run the pipeline once per group of near-duplicate snippets and map
+            results back to the other rows (see agents/dedup.py).
+        dedup_threshold: Minimum estimated Jaccard similarity to join a group.
+        triage: Screen each snippet with the local triage tier first and send
+            only uncertain ones to the LLM detector (see agents/triage.py).
+        votes: Detection samples per row for self-consistency voting; with more
+            than one, a Confidence column (vote agreement) is added to the CSV.
+        batch_size: Snippets per detection request; more than one enables
+            batched detection (see run_pipeline_batch). Raises ValueError
+            together with votes > 1.
     """
+    if batch_size > 1 and votes > 1:
+        raise ValueError("batch_size > 1 and votes > 1 cannot be combined; batched detection does not vote")
     # Input: only ID, Context, Code. We do not read Explanation or Correct Code.
     ID_COLUMN = "ID"
     CONTEXT_COLUMN = "Context"
@@ -88,7 +207,8 @@ def run_pipeline_csv(
     def _norm(s: str) -> str:
         return s.strip().replace("\ufeff", "")
 
-    rows_out: list[tuple[str, int, str]] = []
+    # (sample_id, code, context); code is None for rows with no code
+    rows_in: list[tuple[str, str | None, str]] = []
     with open(input_path, "r", encoding="utf-8", newline="") as f:
         reader = csv.DictReader(f)
         # Normalize header names (BOM, spaces)
@@ -106,19 +226,76 @@ def run_pipeline_csv(
             context = row.get(CONTEXT_COLUMN) or (row.get(fieldnames[context_idx]) if context_idx < len(fieldnames) else "") or ""
             code = row.get(CODE_COLUMN) or (row.get(fieldnames[code_idx]) if code_idx < len(fieldnames) else "") or ""
             code = (code or "").strip()
-            if not code:
-                rows_out.append((sample_id, 0, "No code provided."))
-                continue
-            id_val, bug_line, explanation = run_pipeline_row(
-                sample_id, code, context=context or None, use_mcp=use_mcp, verbose=verbose
+            rows_in.append((sample_id, code or None, context))
+
+    def _run(row: tuple[str, str | None, str]) -> tuple[str, int, str, float | None]:
+        sample_id, code, context = row
+        if not code:
+            return sample_id, 0, "No code provided.", None
+        with trace_context(sample_id=sample_id), span("pipeline_row"):
+            return run_pipeline_row(
+                sample_id, code, context=context or None, use_mcp=use_mcp, verbose=verbose,
+                triage=triage, votes=votes,
+            )
+
+    def _run_all(rows: list[tuple[str, str | None, str]]) -> list[tuple[str, int, str, float | None]]:
+        if batch_size > 1:
+            with_code = [i for i, (_, code, _) in enumerate(rows) if code]
+            results = [_run(row) if not row[1] else None for row in rows]
+            batched = run_pipeline_batch(
+                [(rows[i][0], rows[i][1] or "", rows[i][2]) for i in with_code],
+                use_mcp=use_mcp, verbose=verbose, triage=triage, batch_size=batch_size, workers=workers,
             )
-            rows_out.append((id_val, bug_line, explanation))
+            for i, result in zip(with_code, batched):
+                results[i] = result
+            return results
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                return list(pool.map(_run, rows))
+        return [_run(row) for row in rows]
+
+    if trace_path:
+        trace_path.parent.mkdir(parents=True, exist_ok=True)
+        enable_tracing(str(trace_path))
+    elif dedup or triage:
+        # In-memory spans only, to count LLM calls per row / triage tiers
+        enable_tracing()
+    reset_parse_stats()
+    try:
+        if dedup:
+            rows_out = _run_deduplicated(rows_in, _run_all, dedup_threshold)
+        else:
+            rows_out = _run_all(rows_in)
+        if parse_stats():
+            sys.stderr.write(format_parse_stats() + "\n")
+        unresolved = [r[0] for r in rows_out if r[1] == UNRESOLVED_LINE]
+        if unresolved:
+            sys.stderr.write(
+                f"[Detect] {len(unresolved)} rows unresolved (Bug Line {UNRESOLVED_LINE}): {', '.join(unresolved)}\n"
+            )
+        if triage:
+            from agents.triage import tier_report
+
+            tiers = [s.attrs.get("tier") for s in get_tracer().spans if s.name == "triage"]
+            sys.stderr.write(tier_report([(t, None, None) for t in tiers]) + "\n")
+    finally:
+        if trace_path:
+            tracer = disable_tracing()
+            sys.stderr.write(f"\n[Trace] {len(tracer.spans)} spans written to {trace_path}\n")
+            sys.stderr.write(format_summary(tracer.spans) + "\n")
+        elif dedup or triage:
+            disable_tracing()
 
     out_buffer = io.StringIO()
     writer = csv.writer(out_buffer, quoting=csv.QUOTE_MINIMAL)
-    writer.writerow(["ID", "Bug Line", "Explanation"])
-    for r in rows_out:
-        writer.writerow([r[0], r[1], r[2]])
+    if votes > 1:
+        writer.writerow(["ID", "Bug Line", "Explanation", "Confidence"])
+        for r in rows_out:
+            writer.writerow([r[0], r[1], r[2], "" if r[3] is None else f"{r[3]:.2f}"])
+    else:
+        writer.writerow(["ID", "Bug Line", "Explanation"])
+        for r in rows_out:
+            writer.writerow([r[0], r[1], r[2]])
     result = out_buffer.getvalue()
 
     if output_path:
@@ -129,6 +306,68 @@ def run_pipeline_csv(
         sys.stdout.write(result)
 
 
+def _run_deduplicated(
+    rows_in: list[tuple[str, str | None, str]],
+    run_all: Any,
+    threshold: float,
+) -> list[tuple[str, int, str, float | None]]:
+    """Run one representative per near-duplicate group, then map results onto the members."""
+    from agents.dedup import LLM_SPANS, DedupReport, canonicalize, group_near_duplicates, map_line, translate_literals
+
+    with_code = [i for i, (_, code, _) in enumerate(rows_in) if code]
+    groups = group_near_duplicates([(rows_in[i][2], rows_in[i][1] or "") for i in with_code], threshold)
+    groups = [[with_code[j] for j in g] for g in groups]
+    reps = [g[0] for g in groups]
+    rows_out: list[tuple[str, int, str, float | None] | None] = [None] * len(rows_in)
+
+    # Rows without code are answered directly; representatives go through the pipeline
+    first = [i for i in range(len(rows_in)) if not rows_in[i][1]] + reps
+    for i, result in zip(first, run_all([rows_in[i] for i in first])):
+        rows_out[i] = result
+
+    report = DedupReport(rows=len(with_code), groups=len(groups))
+    rerun: list[int] = []
+    for group in groups:
+        rep_canon = canonicalize(rows_in[group[0]][1] or "")
+        _, rep_line, rep_explanation, rep_confidence = rows_out[group[0]]
+        if rep_line == UNRESOLVED_LINE:
+            # Nothing to reuse; give each member its own attempt
+            rerun.extend(group[1:])
+            continue
+        for member in group[1:]:
+            member_id, member_code, _ = rows_in[member]
+            member_canon = canonicalize(member_code or "")
+            line = map_line(rep_canon, member_canon, rep_line)
+            if line is None:
+                rerun.append(member)
+                continue
+            rows_out[member] = (
+                member_id, line, translate_literals(rep_explanation, rep_canon, member_canon), rep_confidence
+            )
+            report.reused += 1
+    if rerun:
+        for i, result in zip(rerun, run_all([rows_in[i] for i in rerun])):
+            rows_out[i] = result
+        report.rerun = len(rerun)
+
+    tracer = get_tracer()
+    if tracer:
+        calls: dict[str, int] = {}
+        batch_calls = 0
+        for s in tracer.spans:
+            if s.name in LLM_SPANS:
+                sid = str(s.attrs.get("sample_id"))
+                calls[sid] = calls.get(sid, 0) + 1
+            elif s.name == "detect_bug_batch":
+                batch_calls += 1
+        report.llm_calls = sum(calls.values()) + batch_calls
+        for group in groups:
+            rep_calls = calls.get(str(rows_in[group[0]][0]), 0)
+            report.llm_calls_saved += rep_calls * sum(1 for m in group[1:] if m not in rerun)
+    sys.stderr.write(report.format() + "\n")
+    return [r for r in rows_out if r is not None]
+
+
 def main() -> None:
     import argparse
     parser = argparse.ArgumentParser(
@@ -156,18 +395,66 @@ def main() -> None:
         default=None,
         help="Process only first N rows",
     )
+    parser.add_argument(
+        "-j", "--workers",
+        type=int,
+        default=1,
+        help="Number of rows to process concurrently (default: 1)",
+    )
+    parser.add_argument(
+        "--trace",
+        default=None,
+        help="Write per-stage JSONL traces here and print a latency summary",
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Run the pipeline once per group of near-duplicate snippets and reuse the result",
+    )
+    parser.add_argument(
+        "--dedup-threshold",
+        type=float,
+        default=0.9,
+        help="Minimum estimated Jaccard similarity for --dedup grouping (default: 0.9)",
+    )
+    parser.add_argument(
+        "--triage",
+        action="store_true",
+        help="Screen snippets with the local triage tier; only uncertain ones reach the LLM detector",
+    )
+    parser.add_argument(
+        "--votes",
+        type=int,
+        default=1,
+        help="Detection samples per row, majority-voted; adds a Confidence column when > 1 (default: 1)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="Snippets per detection request (batched detection when > 1; default: 1)",
+    )
     parser.add_argument(
         "-v", "--verbose",
         action="store_true",
         help="Print raw model response when no bug is detected (for debugging)",
     )
     args = parser.parse_args()
+    if args.batch_size > 1 and args.votes > 1:
+        parser.error("--batch-size and --votes cannot be combined")
     run_pipeline_csv(
         input_path=Path(args.input),
         output_path=Path(args.output) if args.output else None,
         use_mcp=not args.no_mcp,
         limit=args.limit,
         verbose=args.verbose,
+        workers=args.workers,
+        trace_path=Path(args.trace) if args.trace else None,
+        dedup=args.dedup,
+        dedup_threshold=args.dedup_threshold,
+        triage=args.triage,
+        votes=args.votes,
+        batch_size=args.batch_size,
     )
 
 
@@ -0,0 +1,131 @@
+"""
+Static prompt prefixes for the detection and explanation agents.
+
+Providers reuse work for a repeated prompt prefix: Ollama keeps the KV cache
+of the previous request while the model stays loaded (keep_alive), and
+OpenAI-compatible prompt caching bills and serves a cached prefix faster. Both
+only help when the leading messages are byte-identical from one call to the
+next, so each agent's system message is built once per process from the rules
+plus a fixed few-shot block of hand-written RDI snippets (buggy and correct),
+and all per-sample content (docs, code, reasoning) goes into the user message
+after it.
+The examples are not taken from samples.csv: the pipeline reads only ID,
+Context and Code from it, never Explanation or Correct Code.
+
+  FEW_SHOT_EXAMPLES   number of examples in the prefix (default 5, 0 = rules only)
+"""
+
+import json
+import os
+from functools import lru_cache
+from typing import Any
+
+from agents.parsing import format_parsed_for_prompt, parse_code
+
+DETECTION_RULES = """You are a C++/RDI (SmartRDI API) expert.
+Your task is to identify the first line (1-based) where a bug manifests.
+
+RDI bugs often involve multi-line sequences:
+1. Missing prerequisite calls (e.g., calling burst() before begin()).
+2. Invalid order of operations (e.g., RDI_END() before RDI_BEGIN()).
+3. State conflicts across lines (e.g., setting a range on line 5 that makes line 10 invalid).
+4. Missing cleanup or synchronization.
+
+Analyze the ENTIRE sequence or block.
+Identify the first line that is WRONG or represents the start of the ERROR.
+
+Reply with only a JSON object in this format:
+{"reasoning": "<1-sentence description of the logic error>", "bug": true, "line": <line_number>}
+
+If no bug: {"reasoning": "<why the sequence is valid>", "bug": false, "line": 0}"""
+
+EXPLANATION_RULES = """You are an RDI expert. Write a 1-sentence explanation of the bug.
+1. Follow the documentation instruction given with each request.
+2. Incorporate the detection reasoning.
+3. Be remarkably concise. STRICTLY 1 SENTENCE. Maximum 60 words ONLY.
+4. Do not cite chunk sources.
+5. Reply with only a JSON object: {"explanation": "BUG: <bug description>"}"""
+
+
+def _one_line(text: str, max_words: int = 60) -> str:
+    words = " ".join(text.split()).split(" ")
+    return " ".join(words[:max_words])
+
+
+def _ensure_bug_prefix(explanation: str) -> str:
+    text = _one_line(explanation)
+    head = text.split(":", 1)
+    if len(head) == 2 and head[0].strip().upper().startswith("BUG"):
+        text = head[1].strip()
+    return f"BUG: {text}"
+
+
+# Hand-written patterns covering the rules above, plus a correct snippet so the prefix
+# doesn't only show bugs; "line" is 1-based in "code", 0 for the correct one
+FEW_SHOT = (
+    {
+        "code": 'RDI_END();\nrdi.dc().pin("VDD").vForce(1.2 V).execute();\nRDI_BEGIN();',
+        "line": 1,
+        "reasoning": "RDI_END() closes the block before RDI_BEGIN() opens it, so the execute runs outside any RDI block.",
+        "explanation": "RDI_END() is called before RDI_BEGIN(), inverting the block so the vForce execute runs outside it.",
+    },
+    {
+        "code": (
+            'RDI_BEGIN();\nrdi.dc("meas1").pin("IO1").iMeas().execute();\n'
+            'double value = rdi.id("meas1").getValue("IO1");\nRDI_END();'
+        ),
+        "line": 3,
+        "reasoning": "The result of meas1 is read inside the RDI block, before RDI_END() makes it available.",
+        "explanation": "getValue() for meas1 is called before RDI_END(), so the measurement result is not available yet.",
+    },
+    {
+        "code": (
+            'RDI_BEGIN();\nrdi.dc("meas1").pin("IO1").iMeas().execute();\nRDI_END();\n'
+            'double value = rdi.id("meas1").getValue("IO1");'
+        ),
+        "line": 0,
+        "reasoning": "The measurement runs inside the RDI block and its result is read after RDI_END() under the same ID.",
+    },
+    {
+        "code": 'RDI_BEGIN();\nrdi.dc().pin("VDD").vForce(5 V).vForceRange(2 V).execute();\nRDI_END();',
+        "line": 2,
+        "reasoning": "The 5 V force value exceeds the 2 V force range set in the same chain.",
+        "explanation": "vForce(5 V) is outside the vForceRange(2 V) set on the same pin, so the force cannot be applied.",
+    },
+    {
+        "code": (
+            'RDI_BEGIN();\nrdi.dc("vdd_meas").pin("VDD").iMeas().execute();\nRDI_END();\n'
+            'double current = rdi.id("vdd_mes").getValue("VDD");'
+        ),
+        "line": 4,
+        "reasoning": "The result is read under ID vdd_mes, but the measurement was stored under vdd_meas.",
+        "explanation": "getValue() reads result ID vdd_mes, which was never measured; the iMeas() result is stored as vdd_meas.",
+    },
+)
+
+
+def few_shot_examples() -> tuple[dict[str, Any], ...]:
+    n = int(os.getenv("FEW_SHOT_EXAMPLES", "5"))
+    return FEW_SHOT[: max(n, 0)]
+
+
+@lru_cache(maxsize=1)
+def detection_system_prompt() -> str:
+    parts = [DETECTION_RULES]
+    for k, example in enumerate(few_shot_examples(), 1):
+        parts.append(
+            f"Example {k}:\n{format_parsed_for_prompt(parse_code(example['code']))}\n"
+            + json.dumps({"reasoning": example["reasoning"], "bug": example["line"] > 0, "line": example["line"]})
+        )
+    return "\n\n".join(parts)
+
+
+@lru_cache(maxsize=1)
+def explanation_system_prompt() -> str:
+    parts = [EXPLANATION_RULES]
+    buggy = [example for example in few_shot_examples() if example["line"] > 0]
+    for k, example in enumerate(buggy, 1):
+        line = example["code"].splitlines()[example["line"] - 1].strip()
+        reply = json.dumps({"explanation": _ensure_bug_prefix(example["explanation"])})
+        parts.append(f"Example {k}:\nLine {example['line']}: {line}\n{reply}")
+    return "\n\n".join(parts)
@@ -0,0 +1,149 @@
+"""
+Deterministic MCP query planner.
+
+Derives search queries from the RDI call chains in a snippet instead of asking
+the LLM. Each chain (rdi.port("pt1").dc().pin("d").vForce(1 uA).burst()) is
+reduced to its API terms, the terms are weighted by IDF from a vocabulary built
+over the ingested documentation, and the rarest (most specific) terms become
+"RDI API <term>" queries plus one query per chain. The plan score is the share
+of the snippet's API terms the vocabulary knows; generate_search_queries only
+falls back to the LLM when it is below QUERY_PLAN_MIN_SCORE.
+
+The vocabulary is read from api_vocabulary.json files that
+server/ingest_from_samples.py writes into each collection, or built from
+samples.csv when none exist.
+"""
+
+import csv
+import json
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+STORAGE_ROOT = PROJECT_ROOT / "server" / "storage"
+SAMPLES_CSV = PROJECT_ROOT / "samples.csv"
+VOCABULARY_FILE = "api_vocabulary.json"
+
+_METHOD_RE = re.compile(r"\.\s*([A-Za-z_]\w*)\s*\(")
+_CONSTANT_RE = re.compile(r"\bTA::(\w+)")
+_CHAIN_START_RE = re.compile(r"\brdi\s*\.")
+# Ubiquitous chain links that say nothing about the bug
+_GENERIC_TERMS = {"execute", "pin", "port", "label"}
+
+
+def api_terms(text: str) -> list[str]:
+    """RDI method names (.name( ) and TA:: constants, in order of appearance, deduplicated."""
+    seen: dict[str, None] = {}
+    for match in sorted(
+        [(m.start(), m.group(1)) for m in _METHOD_RE.finditer(text)]
+        + [(m.start(), f"TA::{m.group(1)}") for m in _CONSTANT_RE.finditer(text)]
+    ):
+        seen.setdefault(match[1], None)
+    return list(seen)
+
+
+def parse_call_chains(code: str) -> list[list[str]]:
+    """Split code into statements and return the API terms of each rdi.* chain."""
+    # Strip // comments, then statements may span lines (fluent chains) until ';'
+    stripped = "\n".join(line.split("//", 1)[0] for line in code.splitlines())
+    chains = []
+    for statement in stripped.split(";"):
+        match = _CHAIN_START_RE.search(statement)
+        if not match:
+            continue
+        terms = api_terms(statement[match.start():])
+        if terms:
+            chains.append(terms)
+    return chains
+
+
+def build_vocabulary(documents: Iterable[str]) -> dict:
+    """Document frequencies of API terms; the JSON layout written to api_vocabulary.json."""
+    df: dict[str, int] = {}
+    n = 0
+    for text in documents:
+        n += 1
+        for term in set(api_terms(text)):
+            df[term] = df.get(term, 0) + 1
+    return {"documents": n, "df": df}
+
+
+@dataclass
+class Vocabulary:
+    documents: int = 0
+    df: dict[str, int] = field(default_factory=dict)
+
+    def idf(self, term: str) -> float | None:
+        """Smoothed IDF, or None for terms the documentation never mentions."""
+        count = self.df.get(term)
+        if not count:
+            return None
+        return math.log((self.documents + 1) / (count + 1)) + 1.0
+
+    def merge(self, data: dict) -> None:
+        self.documents += int(data.get("documents", 0))
+        for term, count in data.get("df", {}).items():
+            self.df[term] = self.df.get(term, 0) + int(count)
+
+
+def load_vocabulary(storage_root: Path = STORAGE_ROOT, samples_path: Path = SAMPLES_CSV) -> Vocabulary:
+    """Merge every collection's api_vocabulary.json; fall back to samples.csv."""
+    vocab = Vocabulary()
+    override = os.getenv("API_VOCABULARY")
+    paths = [Path(override)] if override else [storage_root / VOCABULARY_FILE, *storage_root.glob(f"*/{VOCABULARY_FILE}")]
+    for path in paths:
+        if path.is_file():
+            with open(path, "r", encoding="utf-8") as f:
+                vocab.merge(json.load(f))
+    if vocab.documents == 0 and samples_path.exists():
+        with open(samples_path, "r", encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))
+        vocab.merge(build_vocabulary(
+            f"{row.get('Context', '')}\n{row.get('Code', '')}\n{row.get('Correct Code', '')}" for row in rows
+        ))
+    return vocab
+
+
+_vocabulary: Vocabulary | None = None
+
+
+def get_vocabulary() -> Vocabulary:
+    global _vocabulary
+    if _vocabulary is None:
+        _vocabulary = load_vocabulary()
+    return _vocabulary
+
+
+@dataclass
+class QueryPlan:
+    queries: list[str]
+    score: float
+    terms: list[tuple[str, float]]  # known API terms with their IDF, most specific first
+    unknown_terms: list[str]
+
+
+def plan_queries(code_snippet: str, vocab: Vocabulary | None = None, max_term_queries: int = 3) -> QueryPlan:
+    vocab = vocab or get_vocabulary()
+    chains = parse_call_chains(code_snippet)
+    all_terms = list(dict.fromkeys(t for chain in chains for t in chain if t not in _GENERIC_TERMS))
+    known = [(t, vocab.idf(t)) for t in all_terms]
+    terms = sorted([(t, w) for t, w in known if w is not None], key=lambda tw: -tw[1])
+    unknown = [t for t, w in known if w is None]
+    score = len(terms) / len(all_terms) if all_terms else 0.0
+
+    queries = [f"RDI API {term}" for term, _ in terms[:max_term_queries]]
+    # One query per distinct chain, keeping its most specific terms in call order
+    idf = dict(terms)
+    seen_chains = set()
+    for chain in chains:
+        specific = [t for t in chain if idf.get(t)]
+        specific = sorted(specific, key=lambda t: -idf[t])[:3]
+        key = tuple(sorted(specific))
+        if len(specific) > 1 and key not in seen_chains:
+            seen_chains.add(key)
+            queries.append("RDI " + " ".join(t for t in chain if t in specific))
+    return QueryPlan(queries=queries, score=round(score, 3), terms=terms, unknown_terms=unknown)
@@ -0,0 +1,257 @@
+"""
+Cheap first-pass triage before the main detector.
+
+Each snippet is screened by a few deterministic rules and a logistic classifier
+over RDI token features, both local and instant:
+
+  rules       RDI_END before RDI_BEGIN, the same call repeated back to back
+              (.end().end()), a unit that doesn't exist or doesn't fit the call
+              (vForce(1 uA), iRange(2 mAh)), and API methods that never occur in
+              correct code (misspelled or invented names)
+  classifier  logistic regression over rule hits and API terms, trained on the
+              triage CSV (default samples.csv): Code rows are buggy, their
+              Correct Code counterparts clean
+
+The bug probability p places the snippet in a tier:
+
+  clean     p <= TRIAGE_LOW and no strong rule hit: answered "no bug" without
+            the LLM. Off by default (TRIAGE_LOW 0) until the threshold has been
+            validated on real data; the samples only measure it in-sample
+  flagged   p >= TRIAGE_HIGH (default 0.6) and a strong rule points at a line:
+            answered with that line, the LLM only writes the explanation
+  escalate  everything else goes to the configured MODEL as before
+
+`python -m agents.triage` reports leave-one-sample-out accuracy and escalation
+rate per tier for the current thresholds.
+"""
+
+import csv
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+from agents.ground_truth import SAMPLES_CSV, bug_line
+from agents.query_planner import api_terms
+
+TIERS = ("clean", "flagged", "escalate")
+_BEGIN_RE = re.compile(r"\bRDI_BEGIN\s*\(")
+_END_RE = re.compile(r"\bRDI_END\s*\(")
+# .end().end(), .burst("b").burst(): a call repeated with no arguments the second time
+_REPEATED_CALL_RE = re.compile(r"\.\s*(\w+)\s*\([^()]*\)\s*\.\s*\1\s*\(\s*\)")
+_VALUE_UNIT_RE = re.compile(r"\.\s*(\w+)\s*\(([^()]*)\)")
+# A number (optionally with an exponent: 1e-3 V, not unit "e") followed by its unit
+_UNIT_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?(?![eE][-+]?\d)\s*([A-Za-z]+)\b")
+_VOLT = {"V", "mV", "uV", "kV"}
+_AMP = {"A", "mA", "uA", "nA", "pA"}
+_KNOWN_UNITS = _VOLT | _AMP | {"s", "ms", "us", "ns", "ps", "Hz", "kHz", "MHz", "GHz", "Ohm", "kOhm", "MOhm", "pF", "nF", "uF", "dB"}
+# Calls whose numeric arguments must be a voltage / a current
+_VOLTAGE_CALLS = re.compile(r"^(vForce|vForceRange|vClamp|vMeasRange|vRange)$")
+_CURRENT_CALLS = re.compile(r"^(iForce|iForceRange|iClamp|iMeasRange|iRange)$")
+# Rules precise enough to answer with their line; unknown_api only feeds the classifier
+STRONG_RULES = {"begin_end", "repeated_call", "unit"}
+
+
+@dataclass
+class Finding:
+    rule: str
+    line: int
+    detail: str
+
+
+@dataclass
+class TriageResult:
+    tier: str
+    probability: float
+    line: int = 0
+    reasoning: str = ""
+    findings: list[Finding] = field(default_factory=list)
+
+
+def rule_findings(code: str, known_methods: set[str]) -> list[Finding]:
+    """Rule hits in line order (1-based lines of code)."""
+    findings: list[Finding] = []
+    begun = False
+    for n, raw in enumerate(code.splitlines(), 1):
+        line = raw.split("//", 1)[0]
+        if _END_RE.search(line) and not begun:
+            findings.append(Finding("begin_end", n, "RDI_END() appears before RDI_BEGIN()"))
+        if _BEGIN_RE.search(line):
+            begun = True
+        repeated = _REPEATED_CALL_RE.search(line)
+        if repeated:
+            findings.append(Finding("repeated_call", n, f"{repeated.group(1)}() is called twice in a row"))
+        for call, args in _VALUE_UNIT_RE.findall(line):
+            for unit in _UNIT_RE.findall(args):
+                if unit not in _KNOWN_UNITS:
+                    findings.append(Finding("unit", n, f"{call}() uses unknown unit '{unit}'"))
+                elif _VOLTAGE_CALLS.match(call) and unit in _AMP or _CURRENT_CALLS.match(call) and unit in _VOLT:
+                    findings.append(Finding("unit", n, f"{call}() is given a value in {unit}"))
+        if known_methods:
+            for term in api_terms(line):
+                if not term.startswith("TA::") and term not in known_methods:
+                    findings.append(Finding("unknown_api", n, f"{term}() is not a known RDI method"))
+    return findings
+
+
+def features(code: str, findings: list[Finding]) -> dict[str, float]:
+    feats: dict[str, float] = {"bias": 1.0}
+    for f in findings:
+        feats[f"rule:{f.rule}"] = 1.0
+    unknown = sum(1 for f in findings if f.rule == "unknown_api")
+    if unknown:
+        feats["unknown_api_count"] = min(unknown, 3) / 3
+    for term in api_terms(code):
+        feats[f"term:{term}"] = 1.0
+    return feats
+
+
+@dataclass
+class TriageModel:
+    weights: dict[str, float]
+    known_methods: set[str]
+
+    def probability(self, feats: dict[str, float]) -> float:
+        z = sum(self.weights.get(k, 0.0) * v for k, v in feats.items())
+        return 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, z))))
+
+
+def train(rows: list[dict[str, Any]], epochs: int = 300, lr: float = 0.5, l2: float = 0.01) -> TriageModel:
+    """Fit on (Code -> 1, Correct Code -> 0) pairs; methods seen in correct code and context are 'known'."""
+    known = set()
+    for row in rows:
+        known.update(t for t in api_terms(f"{row.get('Context', '')}\n{row.get('Correct Code', '')}") if not t.startswith("TA::"))
+    examples = []
+    for row in rows:
+        for text, label in ((row.get("Code") or "", 1.0), (row.get("Correct Code") or "", 0.0)):
+            if text.strip():
+                examples.append((features(text, rule_findings(text, known)), label))
+    weights: dict[str, float] = {}
+    for _ in range(epochs):
+        grad: dict[str, float] = {}
+        for feats, label in examples:
+            z = sum(weights.get(k, 0.0) * v for k, v in feats.items())
+            error = 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, z)))) - label
+            for k, v in feats.items():
+                grad[k] = grad.get(k, 0.0) + error * v
+        for k, g in grad.items():
+            w = weights.get(k, 0.0)
+            weights[k] = w - lr * (g / len(examples) + l2 * w)
+    return TriageModel(weights=weights, known_methods=known)
+
+
+def load_training_rows(path: Path | None = None) -> list[dict[str, Any]]:
+    path = path or Path(os.getenv("TRIAGE_TRAIN", str(SAMPLES_CSV)))
+    if not path.exists():
+        return []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return [r for r in csv.DictReader(f) if (r.get("Correct Code") or "").strip()]
+
+
+@lru_cache(maxsize=1)
+def get_model() -> TriageModel:
+    return train(load_training_rows())
+
+
+@lru_cache(maxsize=None)
+def _model_without(index: int) -> TriageModel:
+    rows = load_training_rows()
+    return train(rows[:index] + rows[index + 1:])
+
+
+def leave_one_out_model(code: str) -> TriageModel:
+    """
+    The model trained without the training sample whose Code or Correct Code is
+    code, as in cross_validate, so scoring the training CSV stays out of sample.
+    Snippets that are not in the training set get get_model().
+    """
+    code = code.strip()
+    for i, row in enumerate(load_training_rows()):
+        if code in ((row.get("Code") or "").strip(), (row.get("Correct Code") or "").strip()):
+            return _model_without(i)
+    return get_model()
+
+
+def thresholds() -> tuple[float, float]:
+    # The classifier's probability is always > 0, so the default TRIAGE_LOW of 0 disables the clean tier
+    return float(os.getenv("TRIAGE_LOW", "0")), float(os.getenv("TRIAGE_HIGH", "0.6"))
+
+
+def triage(code: str, model: TriageModel | None = None, low: float | None = None, high: float | None = None) -> TriageResult:
+    model = model or get_model()
+    default_low, default_high = thresholds()
+    low = default_low if low is None else low
+    high = default_high if high is None else high
+    findings = rule_findings(code, model.known_methods)
+    strong = [f for f in findings if f.rule in STRONG_RULES]
+    p = model.probability(features(code, findings))
+    if p <= low and not strong:
+        return TriageResult("clean", p, reasoning="Triage: no rule hits and low bug probability.")
+    if p >= high and strong:
+        first = min(strong, key=lambda f: f.line)
+        return TriageResult("flagged", p, line=first.line, reasoning=f"Triage: {first.detail}.", findings=findings)
+    return TriageResult("escalate", p, findings=findings)
+
+
+@dataclass
+class TierStats:
+    rows: int = 0
+    scored: int = 0
+    correct: int = 0
+
+    @property
+    def accuracy(self) -> float | None:
+        return self.correct / self.scored if self.scored else None
+
+
+def tier_report(outcomes: list[tuple[str, int | None, int | None]]) -> str:
+    """
+    Format (tier, truth, predicted) outcomes as share and accuracy per tier.
+    Outcomes with truth or prediction None (unknown) count toward the share only.
+    """
+    stats = {tier: TierStats() for tier in TIERS}
+    for tier, truth, predicted in outcomes:
+        stats[tier].rows += 1
+        if truth is not None and predicted is not None:
+            stats[tier].scored += 1
+            stats[tier].correct += int(predicted == truth)
+    total = len(outcomes) or 1
+    parts = [f"[Triage] {len(outcomes)} rows, escalation rate {stats['escalate'].rows / total:.1%}"]
+    for tier in TIERS:
+        acc = stats[tier].accuracy
+        parts.append(f"{tier} {stats[tier].rows}" + ("" if acc is None else f" ({acc:.1%} correct)"))
+    return "; ".join(parts)
+
+
+def cross_validate(rows: list[dict[str, Any]], low: float, high: float) -> list[tuple[str, int | None, int | None]]:
+    """Leave one sample (its buggy and correct snippet) out, train on the rest, triage the held-out pair."""
+    outcomes = []
+    for i, row in enumerate(rows):
+        model = train(rows[:i] + rows[i + 1:])
+        truth_buggy = bug_line(row["Code"], row["Correct Code"])
+        for code, truth in ((row["Code"], truth_buggy), (row["Correct Code"], 0)):
+            result = triage(code, model, low, high)
+            outcomes.append((result.tier, truth, result.line if result.tier != "escalate" else None))
+    return outcomes
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Leave-one-out triage accuracy and escalation rate.")
+    parser.add_argument("input", nargs="?", default=None, help="Training CSV with Code and Correct Code")
+    parser.add_argument("--low", type=float, default=None, help="Clean threshold (default: TRIAGE_LOW)")
+    parser.add_argument("--high", type=float, default=None, help="Flag threshold (default: TRIAGE_HIGH)")
+    args = parser.parse_args()
+    low, high = thresholds()
+    low = low if args.low is None else args.low
+    high = high if args.high is None else args.high
+    rows = load_training_rows(Path(args.input) if args.input else None)
+    print(tier_report(cross_validate(rows, low, high)))
+
+
+if __name__ == "__main__":
+    main()
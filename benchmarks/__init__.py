@@ -0,0 +1,3 @@
+"""
+Offline benchmark suite: fake LLM / MCP servers and throughput scenarios.
+"""
@@ -0,0 +1,305 @@
+"""
+Deterministic OpenAI-compatible chat completions server for offline benchmarks.
+
+Serves POST /v1/chat/completions from a background thread with configurable
+latency and jitter. Answers are canned per agent (query generation, detection,
+explanation, and the main.py tool-calling loop) so benchmark runs never depend
+on a real provider and produce the same output every time.
+
+With prefill_ms_per_1k_tokens set, the server also models prompt caching: the
+prompt is compared against the last few prompts it served, the longest shared
+prefix counts as cached (reported as usage.prompt_tokens_details.cached_tokens),
+and only the uncached tokens add prefill time before the first token.
+
+Requests with temperature > 0 model sampling: the k-th sample for a prompt
+(counting both n choices and repeated requests) keeps the canned detection line
+with probability ~0.6 and otherwise picks another line, deterministically per k.
+supports_n=False makes the server ignore n like some providers do.
+
+Replies are the JSON each agent's prompt asks for. With malformed_rate set, that
+share of requests without response_format is answered in prose instead, to
+exercise the structured-output repair path (agent_core/structured.py).
+"""
+
+import hashlib
+import http.server
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Any
+
+# Prompts remembered for prefix reuse (like a server with a few KV-cache slots)
+CACHE_SLOTS = 8
+
+
+def _text(messages: list[dict[str, Any]], role: str) -> str:
+    return "\n".join(
+        str(m.get("content") or "") for m in messages if m.get("role") == role
+    )
+
+
+def _stable_int(text: str) -> int:
+    return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def canned_reply(body: dict[str, Any], variant: int = 0, malformed: bool = False) -> dict[str, Any]:
+    """
+    Build the assistant message for a chat completion request body (variant k > 0 =
+    k-th resample). Agents get the JSON their prompts ask for; malformed=True
+    answers in prose instead, like a model that ignored the format.
+    """
+    messages = body.get("messages") or []
+    system = _text(messages, "system")
+    user = _text(messages, "user")
+
+    if body.get("tools"):
+        # main.py agent loop: fix mod.py, run the test, then finish
+        turns = sum(1 for m in messages if m.get("role") == "assistant")
+        if turns == 0:
+            return _tool_call("write_file", {"file_path": "mod.py", "content": "X = 2\n"}, turns)
+        if turns == 1:
+            return _tool_call("run_python_file", {"file_path": "main.py"}, turns)
+        return {"role": "assistant", "content": "Bug fixed successfully"}
+
+    if system.startswith("Rewrite the answer below as a single JSON object"):
+        return {"role": "assistant", "content": _repaired(system, user)}
+
+    if "search queries" in system:
+        queries = ["RDI burst execute order", "RDI_BEGIN RDI_END sequence"]
+        content = "\n".join(queries) if malformed else json.dumps({"queries": queries})
+        return {"role": "assistant", "content": content}
+
+    if "explanation" in system.lower():
+        text = "BUG: The call sequence violates the documented RDI ordering for this block."
+        return {"role": "assistant", "content": text if malformed else json.dumps({"explanation": text})}
+
+    if "=== SNIPPET " in user:
+        # Batched detection: one answer per snippet, same line choice as single calls
+        answers = []
+        for block in user.split("=== SNIPPET ")[1:]:
+            sample_id, _, code = block.partition(" ===")
+            numbered = [line for line in code.splitlines() if "|" in line and line.split("|")[0].strip().isdigit()]
+            line = (_stable_int(code) % len(numbered)) + 1 if numbered else 1
+            answers.append({"id": sample_id.strip(), "reasoning": "Canned benchmark answer.", "bug": True, "line": line})
+        if malformed:
+            return {"role": "assistant", "content": "Answers:\n" + "\n".join(json.dumps(a) for a in answers)}
+        return {"role": "assistant", "content": json.dumps({"answers": answers})}
+
+    # Detection: pick a deterministic line among the numbered code lines
+    numbered = [line for line in user.splitlines() if "|" in line and line.split("|")[0].strip().isdigit()]
+    line = (_stable_int(user) % len(numbered)) + 1 if numbered else 1
+    if variant and numbered and _stable_int(f"{user}#{variant}") % 10 >= 6:
+        line = (_stable_int(f"{user}#{variant}") // 10 % len(numbered)) + 1
+    if malformed:
+        return {"role": "assistant", "content": f"The sequence first goes wrong on line {line}, a canned benchmark answer."}
+    return {
+        "role": "assistant",
+        "content": json.dumps({"reasoning": "Canned benchmark answer.", "bug": True, "line": line}),
+    }
+
+
+def _repaired(system: str, user: str) -> str:
+    """Answer a structured-output follow-up by restating the prose answer as the requested JSON."""
+    answer = user.split("Answer:", 1)[-1].split("\n\nProblems:", 1)[0].strip()
+    if '"queries"' in system:
+        return json.dumps({"queries": [q.strip() for q in answer.splitlines() if q.strip()] or ["RDI"]})
+    if '"explanation"' in system:
+        return json.dumps({"explanation": answer})
+    found = re.search(r"line (\d+)", answer, re.IGNORECASE)
+    line = int(found.group(1)) if found else 0
+    return json.dumps({"reasoning": answer[:200], "bug": line > 0, "line": line})
+
+
+def _tool_call(name: str, arguments: dict[str, Any], turn: int) -> dict[str, Any]:
+    return {
+        "role": "assistant",
+        "content": None,
+        "tool_calls": [{
+            "id": f"call_{turn}",
+            "type": "function",
+            "function": {"name": name, "arguments": json.dumps(arguments)},
+        }],
+    }
+
+
+class FakeLLMServer:
+    """
+    In-process fake provider. Use as a context manager; `base_url` is ready to
+    pass as OPENAI_BASE_URL.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 50.0,
+        jitter_ms: float = 0.0,
+        seed: int = 0,
+        port: int = 0,
+        prefill_ms_per_1k_tokens: float = 0.0,
+        supports_n: bool = True,
+        malformed_rate: float = 0.0,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.prefill_ms_per_1k_tokens = prefill_ms_per_1k_tokens
+        self._prompts: deque[str] = deque(maxlen=CACHE_SLOTS)
+        self._cache_lock = threading.Lock()
+        self.supports_n = supports_n
+        self.malformed_rate = malformed_rate
+        self._samples: dict[str, int] = {}
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.requests = 0
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                cached_tokens = server._prefill(body)
+                server._sleep()
+                server.requests += 1
+                if body.get("stream"):
+                    self._stream(body, cached_tokens)
+                else:
+                    self._send_json(server._completion(body, cached_tokens))
+
+            def _send_json(self, payload: dict[str, Any]) -> None:
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, body: dict[str, Any], cached_tokens: int) -> None:
+                completion = server._completion(body, cached_tokens)
+                message = completion["choices"][0]["message"]
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                delta: dict[str, Any] = {"role": "assistant"}
+                if message.get("tool_calls"):
+                    delta["tool_calls"] = [
+                        dict(tc, index=i) for i, tc in enumerate(message["tool_calls"])
+                    ]
+                chunks = [delta]
+                for word in (message.get("content") or "").split(" "):
+                    chunks.append({"content": word + " "})
+                for i, d in enumerate(chunks):
+                    last = i == len(chunks) - 1
+                    chunk = {
+                        "id": completion["id"],
+                        "object": "chat.completion.chunk",
+                        "created": completion["created"],
+                        "model": completion["model"],
+                        "choices": [{
+                            "index": 0,
+                            "delta": d,
+                            "finish_reason": completion["choices"][0]["finish_reason"] if last else None,
+                        }],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                usage_chunk = dict(chunk, choices=[], usage=completion["usage"])
+                self.wfile.write(f"data: {json.dumps(usage_chunk)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+        self._httpd = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _sleep(self) -> None:
+        with self._rng_lock:
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        time.sleep(max(0.0, self.latency_ms + jitter) / 1000.0)
+
+    def _prefill(self, body: dict[str, Any]) -> int:
+        """Sleep for the uncached part of the prompt; return the cached prompt tokens."""
+        if not self.prefill_ms_per_1k_tokens:
+            return 0
+        prompt = "".join(
+            f"<{m.get('role')}>{m.get('content') or ''}" for m in body.get("messages") or []
+        )
+        with self._cache_lock:
+            shared = max((len(os.path.commonprefix([prompt, p])) for p in self._prompts), default=0)
+            self._prompts.append(prompt)
+        cached_tokens = shared // 4
+        uncached_tokens = max(0, len(prompt) // 4 - cached_tokens)
+        time.sleep(uncached_tokens * self.prefill_ms_per_1k_tokens / 1_000_000.0)
+        return cached_tokens
+
+    def _variants(self, body: dict[str, Any]) -> list[int]:
+        n = int(body.get("n") or 1) if self.supports_n else 1
+        if not body.get("temperature"):
+            return [0] * n
+        key = json.dumps(body.get("messages") or [], sort_keys=True)
+        with self._rng_lock:
+            start = self._samples.get(key, 0)
+            self._samples[key] = start + n
+        return list(range(start, start + n))
+
+    def _malformed(self, body: dict[str, Any]) -> bool:
+        # response_format constrains decoding, so only unconstrained replies go wrong
+        if not self.malformed_rate or body.get("response_format"):
+            return False
+        with self._rng_lock:
+            return self._rng.random() < self.malformed_rate
+
+    def _completion(self, body: dict[str, Any], cached_tokens: int = 0) -> dict[str, Any]:
+        messages = [canned_reply(body, variant, self._malformed(body)) for variant in self._variants(body)]
+        prompt_chars = sum(len(str(m.get("content") or "")) for m in body.get("messages") or [])
+        completion_chars = sum(
+            len(m.get("content") or "") + sum(len(tc["function"]["arguments"]) for tc in m.get("tool_calls") or [])
+            for m in messages
+        )
+        prompt_tokens = max(1, prompt_chars // 4)
+        completion_tokens = max(1, completion_chars // 4)
+        return {
+            "id": f"chatcmpl-fake-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model") or "fake",
+            "choices": [
+                {
+                    "index": i,
+                    "finish_reason": "tool_calls" if m.get("tool_calls") else "stop",
+                    "message": m,
+                }
+                for i, m in enumerate(messages)
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": min(cached_tokens, prompt_tokens)},
+            },
+        }
+
+    def start(self) -> "FakeLLMServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "FakeLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
@@ -0,0 +1,68 @@
+"""
+Stand-in MCP server exposing search_documents with canned chunks.
+
+Chunks are built from samples.csv (ID, Context, Code — the same text layout
+server/ingest_from_samples.py indexes) and ranked by simple term overlap, so no
+embedding model or persisted index is needed. Run as a subprocess:
+
+  python -m benchmarks.fake_mcp --port 8013 --latency-ms 20
+"""
+
+import argparse
+import csv
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+_TOKEN_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]+")
+
+
+def load_chunks(samples_path: Path) -> list[str]:
+    with open(samples_path, "r", encoding="utf-8", newline="") as f:
+        return [
+            f"ID: {row.get('ID', '')}\nContext: {row.get('Context', '')}\nCode:\n{row.get('Code', '')}".strip()
+            for row in csv.DictReader(f)
+        ]
+
+
+def main() -> None:
+    from fastmcp import FastMCP
+
+    parser = argparse.ArgumentParser(description="Fake MCP search_documents server for benchmarks.")
+    parser.add_argument("--port", type=int, default=8013)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--samples", default=str(PROJECT_ROOT / "samples.csv"))
+    args = parser.parse_args()
+
+    chunks = load_chunks(Path(args.samples))
+    chunk_terms = [set(_TOKEN_RE.findall(c.lower())) for c in chunks]
+    rng = random.Random(0)
+    mcp = FastMCP("FakeMCP")
+
+    @mcp.tool()
+    def search_documents(
+        query: str, top_k: int = 0, collection: str = "default", mode: str = "vector", context: str = ""
+    ) -> list:
+        if collection != "default":
+            # Like a server with only the legacy index: lookup_docs falls back to "default"
+            raise ValueError(f"Unknown collection {collection!r}; available: default")
+        delay = args.latency_ms + (rng.uniform(-args.jitter_ms, args.jitter_ms) if args.jitter_ms else 0.0)
+        time.sleep(max(0.0, delay) / 1000.0)
+        terms = set(_TOKEN_RE.findall(query.lower()))
+        scored = sorted(
+            ((len(terms & ct) / (len(terms) or 1), i) for i, ct in enumerate(chunk_terms)),
+            key=lambda t: (-t[0], t[1]),
+        )
+        return [{"text": chunks[i], "score": round(score, 4)} for score, i in scored[: top_k or args.top_k]]
+
+    print(f"Fake MCP server on port {args.port} ({len(chunks)} chunks)", file=sys.stderr)
+    mcp.run(transport="sse", host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
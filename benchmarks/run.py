@@ -0,0 +1,313 @@
+"""
+Offline throughput benchmarks for the detection pipeline and the main.py agent loop.
+
+Starts the in-process fake LLM (benchmarks.fake_llm) and the fake MCP server
+(benchmarks.fake_mcp) and runs each scenario in a fresh subprocess so peak RSS
+is measured per scenario. Reports rows/s and p50/p95/p99 latency per stage as JSON.
+
+  python -m benchmarks.run -o bench.json
+  python -m benchmarks.run --sizes 20,100 --workers 1,8 --latency-ms 80 --jitter-ms 30
+  python -m benchmarks.run -o new.json --compare bench.json
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from benchmarks.fake_llm import FakeLLMServer
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Nearest-rank percentile (p in 0-100) of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), int(round(p / 100.0 * len(ordered) + 0.5))))
+    return ordered[rank - 1]
+
+
+def summarize(durations: dict[str, list[float]]) -> dict[str, dict[str, float]]:
+    return {
+        stage: {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+            "mean_ms": round(sum(values) / len(values) * 1000, 2),
+        }
+        for stage, values in sorted(durations.items())
+        if values
+    }
+
+
+class StageTimer:
+    """Wraps module attributes so every call records its wall time under a stage name."""
+
+    def __init__(self) -> None:
+        self.durations: dict[str, list[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def wrap(self, module: Any, attr: str, stage: str | None = None) -> None:
+        fn: Callable[..., Any] = getattr(module, attr)
+        stage = stage or attr
+
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self.durations[stage].append(elapsed)
+
+        setattr(module, attr, timed)
+
+
+def peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def make_dataset(rows: int, path: Path) -> None:
+    """Write a CSV with `rows` rows by cycling through samples.csv."""
+    with open(PROJECT_ROOT / "samples.csv", "r", encoding="utf-8", newline="") as f:
+        samples = list(csv.DictReader(f))
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["ID", "Context", "Code"])
+        writer.writeheader()
+        for i in range(rows):
+            sample = samples[i % len(samples)]
+            writer.writerow({"ID": str(i + 1), "Context": sample["Context"], "Code": sample["Code"]})
+
+
+def make_project(path: Path) -> None:
+    """A tiny buggy project the fake LLM knows how to fix."""
+    path.mkdir(parents=True, exist_ok=True)
+    (path / "mod.py").write_text("X = 1\n", encoding="utf-8")
+    (path / "main.py").write_text("import mod\nassert mod.X == 2\nprint('ok')\n", encoding="utf-8")
+
+
+def run_pipeline_scenario(rows: int, workers: int, use_mcp: bool) -> dict[str, Any]:
+    import agents.orchestrator as orchestrator
+    from agent_core import tracing
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset = Path(tmp) / "dataset.csv"
+        output = Path(tmp) / "out.csv"
+        make_dataset(rows, dataset)
+        tracer = tracing.enable_tracing()
+        started = time.perf_counter()
+        orchestrator.run_pipeline_csv(
+            input_path=dataset, output_path=output, use_mcp=use_mcp, workers=workers
+        )
+        elapsed = time.perf_counter() - started
+        tracing.disable_tracing()
+
+    return {
+        "rows": rows,
+        "wall_s": round(elapsed, 3),
+        "rows_per_s": round(rows / elapsed, 2),
+        "stages": tracing.summarize(tracer.spans),
+    }
+
+
+def run_agent_scenario(jobs: int, workers: int) -> dict[str, Any]:
+    import functions.fn as fn
+    import main as agent_main
+    from agent_core.llm_client import make_client
+    from functions.candidates import make_scratch_copy, remove_scratch_copy
+
+    timer = StageTimer()
+    timer.wrap(agent_main, "get_api_response", "llm_turn")
+    timer.wrap(fn, "call_tool", "tool")
+    timer.wrap(agent_main, "run_agent", "job")
+    client = make_client()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        project = Path(tmp) / "project"
+        make_project(project)
+
+        def _job(_: int) -> bool:
+            scratch = make_scratch_copy(str(project))
+            try:
+                return agent_main.run_agent(client, "Fix the bug in mod.py", scratch)["success"]
+            finally:
+                remove_scratch_copy(scratch)
+
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_job, range(jobs)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "rows": jobs,
+        "succeeded": sum(results),
+        "wall_s": round(elapsed, 3),
+        "rows_per_s": round(jobs / elapsed, 2),
+        "stages": summarize(timer.durations),
+    }
+
+
+def run_child(scenario: dict[str, Any]) -> None:
+    if scenario["kind"] == "pipeline":
+        result = run_pipeline_scenario(scenario["size"], scenario["workers"], scenario["use_mcp"])
+    else:
+        result = run_agent_scenario(scenario["size"], scenario["workers"])
+    result["peak_rss_mb"] = peak_rss_mb()
+    sys.stdout.write(json.dumps(result) + "\n")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float = 30.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with socket.socket() as s:
+            if s.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"Fake MCP server did not start on port {port}")
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any], max_regression: float) -> bool:
+    """Print rows/s deltas per scenario; return False on a regression."""
+    ok = True
+    base = {s["name"]: s for s in baseline.get("scenarios", [])}
+    print(f"\n{'scenario':<32} {'rows/s':>10} {'base':>10} {'delta':>8}")
+    for s in results["scenarios"]:
+        b = base.get(s["name"])
+        if not b or not b.get("rows_per_s"):
+            continue
+        delta = (s["rows_per_s"] - b["rows_per_s"]) / b["rows_per_s"]
+        flag = ""
+        if delta < -max_regression:
+            ok = False
+            flag = "  REGRESSION"
+        print(f"{s['name']:<32} {s['rows_per_s']:>10.2f} {b['rows_per_s']:>10.2f} {delta:>+7.1%}{flag}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline pipeline / agent-loop benchmarks.")
+    parser.add_argument("--sizes", default="10,50", help="Comma-separated dataset sizes (rows / jobs)")
+    parser.add_argument("--workers", default="1,4", help="Comma-separated concurrency levels")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Fake LLM latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="Fake LLM latency jitter (+/-)")
+    parser.add_argument("--mcp-latency-ms", type=float, default=20.0, help="Fake MCP latency per search")
+    parser.add_argument("--scenarios", default="pipeline,pipeline-no-mcp,agent", help="Scenarios to run")
+    parser.add_argument("-o", "--output", default=None, help="Write results JSON here (default: stdout)")
+    parser.add_argument("--compare", default=None, help="Baseline results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed rows/s drop vs baseline")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(json.loads(args.child))
+        return
+
+    sizes = [int(x) for x in args.sizes.split(",") if x]
+    workers = [int(x) for x in args.workers.split(",") if x]
+    kinds = [k.strip() for k in args.scenarios.split(",") if k.strip()]
+
+    mcp_port = _free_port()
+    mcp_proc = None
+    if any(k == "pipeline" for k in kinds):
+        mcp_proc = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.fake_mcp", "--port", str(mcp_port),
+             "--latency-ms", str(args.mcp_latency_ms)],
+            cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        _wait_for_port(mcp_port)
+
+    scenarios = []
+    try:
+        with FakeLLMServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms) as llm:
+            env = dict(
+                os.environ,
+                API_PROVIDER="ollama",
+                OPENAI_BASE_URL=llm.base_url,
+                OPENAI_API_KEY="benchmark",
+                MODEL="fake-model",
+                MAX_RETRIES="1",
+                MAX_CHARS="10000",
+                MCP_SERVER_URL=f"http://127.0.0.1:{mcp_port}/sse",
+            )
+            for kind in kinds:
+                for size in sizes:
+                    for w in workers:
+                        scenario = {
+                            "kind": "agent" if kind == "agent" else "pipeline",
+                            "use_mcp": kind == "pipeline",
+                            "size": size,
+                            "workers": w,
+                        }
+                        name = f"{kind}/n={size}/w={w}"
+                        print(f"[Benchmark] {name} ...", file=sys.stderr)
+                        proc = subprocess.run(
+                            [sys.executable, "-m", "benchmarks.run", "--child", json.dumps(scenario)],
+                            cwd=PROJECT_ROOT, env=env, capture_output=True, text=True,
+                        )
+                        if proc.returncode != 0:
+                            print(proc.stderr, file=sys.stderr)
+                            scenarios.append({"name": name, **scenario, "error": proc.stderr.strip()[-500:]})
+                            continue
+                        result = json.loads(proc.stdout.strip().splitlines()[-1])
+                        scenarios.append({"name": name, **scenario, **result})
+                        print(
+                            f"[Benchmark] {name}: {result['rows_per_s']} rows/s, "
+                            f"peak RSS {result['peak_rss_mb']} MB",
+                            file=sys.stderr,
+                        )
+    finally:
+        if mcp_proc:
+            mcp_proc.terminate()
+            mcp_proc.wait(timeout=10)
+
+    results = {
+        "config": {
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "mcp_latency_ms": args.mcp_latency_ms,
+            "python": sys.version.split()[0],
+        },
+        "scenarios": scenarios,
+    }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        sys.stdout.write(text + "\n")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if not compare(results, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
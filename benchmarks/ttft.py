@@ -0,0 +1,132 @@
+"""
+Time-to-first-token for detection prompts with and without a shared prefix.
+
+Streams one detection request per samples.csv row, sequentially, in two modes:
+
+  prefix     the pipeline's layout: static system prefix (rules + few-shot
+             examples), then the per-sample user message
+  no-prefix  the same text with the per-sample content first, so consecutive
+             requests share no prefix and nothing can be reused
+
+Each mode gets one untimed warm-up request, then reports p50/p95/mean TTFT and
+the prompt tokens the provider reported as cached. Runs against the provider
+configured in .env, or against the fake LLM with --fake (which models prefill
+cost per uncached token).
+
+  python -m benchmarks.ttft
+  python -m benchmarks.ttft --fake --prefill-ms-per-1k 400 --rows 20
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from benchmarks.fake_llm import FakeLLMServer
+from benchmarks.run import percentile
+
+
+def _without_prefix(messages: list[dict[str, str]]) -> list[dict[str, str]]:
+    system, user = messages[0]["content"], messages[1]["content"]
+    return [{"role": "user", "content": f"{user}\n\n{system}"}]
+
+
+def time_to_first_token(client: Any, messages: list[dict[str, str]]) -> tuple[float, int]:
+    """Seconds until the first content delta, and the cached prompt tokens reported."""
+    from agent_core.llm_client import completion_options
+
+    started = time.perf_counter()
+    first = None
+    cached = 0
+    stream = client.chat.completions.create(
+        model=os.getenv("MODEL", "gpt-4o-mini"),
+        messages=messages,
+        max_tokens=100,
+        stream=True,
+        stream_options={"include_usage": True},
+        **completion_options(),
+    )
+    for chunk in stream:
+        if first is None and chunk.choices and chunk.choices[0].delta.content:
+            first = time.perf_counter() - started
+        usage = getattr(chunk, "usage", None)
+        details = getattr(usage, "prompt_tokens_details", None) if usage else None
+        if details is not None:
+            cached = getattr(details, "cached_tokens", 0) or 0
+    return (first if first is not None else time.perf_counter() - started), cached
+
+
+def run_mode(client: Any, prompts: list[list[dict[str, str]]], mode: str) -> dict[str, Any]:
+    if mode == "no-prefix":
+        prompts = [_without_prefix(m) for m in prompts]
+    time_to_first_token(client, prompts[0])  # warm-up: model load, connection
+    ttfts, cached = [], 0
+    for messages in prompts:
+        ttft, cached_tokens = time_to_first_token(client, messages)
+        ttfts.append(ttft)
+        cached += cached_tokens
+    return {
+        "mode": mode,
+        "requests": len(ttfts),
+        "p50_ms": round(percentile(ttfts, 50) * 1000, 2),
+        "p95_ms": round(percentile(ttfts, 95) * 1000, 2),
+        "mean_ms": round(sum(ttfts) / len(ttfts) * 1000, 2),
+        "cached_prompt_tokens": cached,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Detection TTFT with and without the static prompt prefix.")
+    parser.add_argument("--rows", type=int, default=20, help="Requests per mode (cycles samples.csv)")
+    parser.add_argument("--modes", default="no-prefix,prefix", help="Comma-separated modes, run in order")
+    parser.add_argument("--fake", action="store_true", help="Use the in-process fake LLM instead of .env")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Fake LLM base latency")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=400.0, help="Fake LLM prefill cost")
+    parser.add_argument("-o", "--output", default=None, help="Write results JSON here (default: stdout)")
+    args = parser.parse_args()
+
+    from agent_core.llm_client import make_client
+    from agents.detection import detection_messages
+    from agents.ground_truth import load_samples
+
+    samples = load_samples()
+    prompts = [detection_messages(samples[i % len(samples)]["Code"]) for i in range(args.rows)]
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+
+    fake = None
+    if args.fake:
+        fake = FakeLLMServer(latency_ms=args.latency_ms, prefill_ms_per_1k_tokens=args.prefill_ms_per_1k).start()
+        os.environ.update(
+            API_PROVIDER="ollama", OPENAI_BASE_URL=fake.base_url, OPENAI_API_KEY="benchmark", MODEL="fake-model"
+        )
+    try:
+        client = make_client()
+        results = []
+        for mode in modes:
+            result = run_mode(client, prompts, mode)
+            results.append(result)
+            print(
+                f"[TTFT] {mode}: p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, "
+                f"cached prompt tokens {result['cached_prompt_tokens']}",
+                file=sys.stderr,
+            )
+    finally:
+        if fake:
+            fake.stop()
+
+    text = json.dumps({"model": os.getenv("MODEL"), "fake": args.fake, "results": results}, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
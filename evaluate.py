@@ -0,0 +1,23 @@
+"""
+Entrypoint for the evaluation harness.
+
+Runs the detection pipeline over samples.csv (and the Correct Code snippets as
+negatives), scores bug lines against the Code / Correct Code diff, and writes
+metrics plus per-row results as JSON.
+
+Usage:
+  python evaluate.py [samples.csv] [-o results.json] [-j 8] [--no-mcp] [--compare baseline.json]
+"""
+
+import sys
+from pathlib import Path
+
+# Ensure project root is on path
+PROJECT_ROOT = Path(__file__).resolve().parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from agents.evaluation import main
+
+if __name__ == "__main__":
+    main()
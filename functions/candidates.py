@@ -0,0 +1,134 @@
+import atexit
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from agent_core.json_scan import iter_json_objects
+from functions.fn import run_python_file, run_succeeded, write_file
+
+SCRATCH_SKIP_DIRS = {".git", "__pycache__"}
+
+def candidate_instructions(n, test_file):
+    return f"""CANDIDATE MODE: write_file and run_python_file are disabled for you.
+Use the read-only tools to inspect the code. When you understand the bug, reply with
+{n} DISTINCT candidate fixes in ONE message, as a single JSON object:
+
+{{"candidates": [
+  {{"files": [{{"file_path": "<path>", "content": "<COMPLETE fixed file content>"}}]}},
+  ...
+]}}
+
+Each candidate is applied to its own copy of the project and tested with {test_file} in parallel.
+The first candidate that passes is kept. Include the COMPLETE content of every file you change."""
+
+def extract_candidates(content):
+    candidates = []
+    for obj in iter_json_objects(content):
+        if not isinstance(obj, dict) or not isinstance(obj.get("candidates"), list):
+            continue
+        for candidate in obj["candidates"]:
+            files = candidate.get("files", [candidate]) if isinstance(candidate, dict) else []
+            files = [
+                (f["file_path"], f["content"])
+                for f in files
+                if isinstance(f, dict) and isinstance(f.get("file_path"), str) and isinstance(f.get("content"), str)
+            ]
+            if files:
+                candidates.append(files)
+    return candidates
+
+# Scratch roots not yet removed; cleaned up at exit if a caller didn't get to it
+_live_scratch_roots = set()
+
+def _cleanup_scratch_roots():
+    for root in list(_live_scratch_roots):
+        shutil.rmtree(root, ignore_errors=True)
+    _live_scratch_roots.clear()
+
+atexit.register(_cleanup_scratch_roots)
+
+def make_scratch_copy(working_directory):
+    # Real copies, not hardlinks: the program under test may open any file for
+    # writing, and that must never reach the original tree
+    abs_working_dir = os.path.abspath(working_directory)
+    scratch_root = tempfile.mkdtemp(prefix="bughunter-")
+    _live_scratch_roots.add(scratch_root)
+    scratch_dir = os.path.join(scratch_root, os.path.basename(abs_working_dir))
+    try:
+        shutil.copytree(
+            abs_working_dir,
+            scratch_dir,
+            ignore=shutil.ignore_patterns(*SCRATCH_SKIP_DIRS),
+            symlinks=True,
+        )
+    except Exception:
+        remove_scratch_copy(scratch_dir)
+        raise
+    return scratch_dir
+
+def remove_scratch_copy(scratch_dir):
+    scratch_root = os.path.dirname(scratch_dir)
+    shutil.rmtree(scratch_root, ignore_errors=True)
+    _live_scratch_roots.discard(scratch_root)
+
+def sync_scratch_copy(scratch_dir, working_directory, file_paths):
+    # Copy back only the files the agent wrote; whatever the test run created or
+    # deleted in the scratch copy stays there
+    abs_working_dir = os.path.abspath(working_directory)
+    updated = []
+    for rel_path in dict.fromkeys(file_paths):
+        src = os.path.abspath(os.path.join(scratch_dir, rel_path))
+        dst = os.path.abspath(os.path.join(abs_working_dir, rel_path))
+        if not dst.startswith(abs_working_dir + os.sep) or not os.path.isfile(src):
+            continue
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        # copyfile writes in place: keeps the destination's mode and hardlinks
+        shutil.copyfile(src, dst)
+        updated.append(rel_path)
+    return updated
+
+def _evaluate_candidate(working_directory, idx, files, test_file):
+    scratch_dir = make_scratch_copy(working_directory)
+    try:
+        for file_path, content in files:
+            result = write_file(scratch_dir, file_path, content)
+            if not result.startswith("File "):
+                return idx, False, result
+        output = run_python_file(scratch_dir, test_file)
+        return idx, run_succeeded(output), output
+    finally:
+        remove_scratch_copy(scratch_dir)
+
+def evaluate_candidates(working_directory, candidates, test_file, verbose=False):
+    outputs = {}
+    winner = None
+    if not candidates:
+        return winner, outputs
+    workers = min(len(candidates), os.cpu_count() or 1)
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [
+            pool.submit(_evaluate_candidate, working_directory, idx, files, test_file)
+            for idx, files in enumerate(candidates)
+        ]
+        for future in as_completed(futures):
+            try:
+                idx, passed, output = future.result()
+            except Exception as e:
+                if verbose:
+                    print(f"[Candidates] evaluation failed: {e}")
+                continue
+            outputs[idx] = output
+            if verbose:
+                print(f"[Candidates] #{idx + 1}: {'PASS' if passed else 'FAIL'}")
+            if passed:
+                winner = idx
+                break
+    finally:
+        # Don't wait for slower candidates once one has passed
+        pool.shutdown(wait=winner is None, cancel_futures=True)
+    return winner, outputs
+
+def commit_candidate(working_directory, files):
+    return [write_file(working_directory, file_path, content) for file_path, content in files]
@@ -1,11 +1,18 @@
+import fnmatch
+import itertools
 import json
+import mmap
 import os
 import re
 import sys
 import time
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+from agent_core.json_scan import iter_json_objects
+from agent_core.llm_client import completion_options
+
 load_dotenv()
 
 def get_files_info(working_directory, directory=None):
@@ -41,6 +48,141 @@ def get_file_content(working_directory, file_path):
     except Exception as e:
         return f'Error: {e}'
 
+GREP_SKIP_DIRS = {".git", "__pycache__", ".venv", "venv", "node_modules", ".mypy_cache", ".pytest_cache"}
+GREP_MMAP_THRESHOLD = 1024 * 1024
+
+def _grep_file(abs_path, regex, context_lines, max_results):
+    try:
+        size = os.path.getsize(abs_path)
+        if size == 0:
+            return []
+        with open(abs_path, "rb") as file:
+            if size >= GREP_MMAP_THRESHOLD:
+                buf = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buf = file.read()
+    except (OSError, ValueError):
+        return []
+
+    try:
+        if b"\0" in buf[:8192]:
+            return []
+
+        hits = []
+        line_no = 1
+        counted_to = 0
+        pos = 0
+        while len(hits) < max_results:
+            match = regex.search(buf, pos)
+            if not match:
+                break
+            line_start = buf.rfind(b"\n", 0, match.start()) + 1
+            line_end = buf.find(b"\n", match.start())
+            if line_end == -1:
+                line_end = len(buf)
+            line_no += buf[counted_to:line_start].count(b"\n")
+            counted_to = line_start
+
+            before = []
+            start = line_start
+            for offset in range(1, context_lines + 1):
+                if start == 0:
+                    break
+                prev_start = buf.rfind(b"\n", 0, start - 1) + 1
+                before.insert(0, (line_no - offset, buf[prev_start:start - 1].rstrip(b"\r")))
+                start = prev_start
+            after = []
+            end = line_end
+            for offset in range(1, context_lines + 1):
+                if end + 1 >= len(buf):
+                    break
+                next_end = buf.find(b"\n", end + 1)
+                if next_end == -1:
+                    next_end = len(buf)
+                after.append((line_no + offset, buf[end + 1:next_end].rstrip(b"\r")))
+                end = next_end
+
+            hits.append((line_no, buf[line_start:line_end].rstrip(b"\r"), before, after))
+            pos = line_end + 1
+        return hits
+    finally:
+        if isinstance(buf, mmap.mmap):
+            buf.close()
+
+def grep_workspace(working_directory, pattern, glob="*", context_lines="0"):
+    abs_working_dir = os.path.abspath(working_directory)
+    try:
+        regex = re.compile(pattern.encode("utf-8"), re.MULTILINE)
+    except re.error as e:
+        return f'Error: invalid regex "{pattern}": {e}'
+    try:
+        context_lines = max(0, min(int(context_lines or 0), 5))
+    except ValueError:
+        return f'Error: context_lines must be an integer, got "{context_lines}"'
+    glob = glob or "*"
+    max_results = int(os.getenv("GREP_MAX_RESULTS", "100"))
+    max_bytes = int(os.getenv("GREP_MAX_BYTES") or os.getenv("MAX_CHARS") or "10000")
+
+    real_working_dir = os.path.realpath(abs_working_dir)
+    candidates = []
+    for root, dirs, files in os.walk(abs_working_dir):
+        dirs[:] = sorted(d for d in dirs if d not in GREP_SKIP_DIRS)
+        for name in sorted(files):
+            abs_path = os.path.join(root, name)
+            rel_path = os.path.relpath(abs_path, abs_working_dir)
+            # Symlinks may point outside the working directory; read only what resolves inside it
+            real_path = os.path.realpath(abs_path)
+            if not real_path.startswith(real_working_dir + os.sep):
+                continue
+            if fnmatch.fnmatch(name, glob) or fnmatch.fnmatch(rel_path, glob):
+                candidates.append((rel_path, real_path))
+    if not candidates:
+        return f'No files matching "{glob}" in the working directory'
+
+    with ThreadPoolExecutor(max_workers=min(16, len(candidates))) as pool:
+        per_file = list(pool.map(
+            lambda c: _grep_file(c[1], regex, context_lines, max_results), candidates
+        ))
+
+    lines = []
+    total_bytes = 0
+    total_hits = 0
+    truncated = False
+    for (rel_path, _), hits in zip(candidates, per_file):
+        # Merge overlapping context windows: each line is printed once, and
+        # context after a hit stops at the next hit's line
+        match_lines = {h[0] for h in hits}
+        printed = 0
+        for line_no, text, before, after in hits:
+            if total_hits >= max_results:
+                truncated = True
+                break
+            before = [(n, t) for n, t in before if n > printed]
+            after = list(itertools.takewhile(lambda h: h[0] not in match_lines, after))
+            block = []
+            if context_lines and lines and (printed == 0 or (before[0][0] if before else line_no) > printed + 1):
+                block.append("--")
+            block += [f"{rel_path}-{n}- {t.decode('utf-8', 'replace')}" for n, t in before]
+            block.append(f"{rel_path}:{line_no}: {text.decode('utf-8', 'replace')}")
+            block += [f"{rel_path}-{n}- {t.decode('utf-8', 'replace')}" for n, t in after]
+            block_bytes = sum(len(b) + 1 for b in block)
+            if total_bytes + block_bytes > max_bytes:
+                truncated = True
+                break
+            lines.extend(block)
+            total_bytes += block_bytes
+            total_hits += 1
+            printed = after[-1][0] if after else line_no
+        if truncated:
+            break
+
+    if not lines:
+        return f'No matches for "{pattern}" in {len(candidates)} files'
+    result = "\n".join(lines)
+    if truncated:
+        result += f"\n...Results truncated at {total_hits} matches / {max_bytes} bytes; narrow the pattern or glob"
+    return result
+
 def write_file(working_directory, file_path, content):
     abs_working_dir = os.path.abspath(working_directory)
     abs_file_path = os.path.abspath(os.path.join(abs_working_dir, file_path))
@@ -89,6 +231,10 @@ def run_python_file(working_directory, file_path):
     except Exception as e:
         return f'Error executing Python file: {e}'
 
+def run_succeeded(result):
+    result = str(result)
+    return not result.startswith("Error") and "Process exited with code" not in result
+
 def call_tool(fn_name, fn_args, working_directory, verbose=False):
     fn = globals().get(fn_name)
     if not fn:
@@ -101,13 +247,14 @@ def call_tool(fn_name, fn_args, working_directory, verbose=False):
     except Exception as e:
         return f"Error: {e}"
 
-def get_api_response(client, messages, tools, max_retries=5):
+def get_api_response(client, messages, tools, max_retries=5, **kwargs):
     for attempt in range(max_retries):
         try:
             return client.chat.completions.create(
                 model=os.getenv("MODEL"),
                 messages=messages,
-                tools=tools
+                tools=tools,
+                **{**completion_options(), **kwargs}
             )
         except Exception as e:
             error_str = str(e)
@@ -132,67 +279,272 @@ def get_api_response(client, messages, tools, max_retries=5):
                 return None
     return None
 
-def parse_and_execute_text_tool_call(content, messages, working_directory, verbose=False):
-    content = content.strip()
-    tool_call_match = re.search(r'\{[^}]*"name"\s*:\s*"([^"]+)"[^}]*"arguments"\s*:\s*(\{[^}]+\})', content)
+READ_ONLY_TOOLS = {"get_files_info", "get_file_content", "grep_workspace"}
+
+class StreamInterruptedError(RuntimeError):
+    pass
+
+def stream_api_response(client, messages, tools, working_directory, max_retries=5, echo=True):
+    # Returns (response, prefetched, stats): response is an assembled ChatCompletion,
+    # prefetched maps tool_call_id -> Future for read-only tools started mid-stream.
+    # A stream that breaks off is requested again from the start, up to max_retries
+    # times; after that StreamInterruptedError is raised.
+    for attempt in range(max_retries):
+        started = time.perf_counter()
+        stream = get_api_response(
+            client, messages, tools, max_retries,
+            stream=True, stream_options={"include_usage": True}
+        )
+        if not stream:
+            return None, {}, {}
+        try:
+            return _consume_stream(stream, working_directory, echo, started)
+        except Exception as e:
+            if attempt < max_retries - 1:
+                wait_time = 2 ** attempt
+                print(f"\nStream interrupted ({e}), retrying in {wait_time}s... ({attempt + 1}/{max_retries})")
+                time.sleep(wait_time)
+            else:
+                raise StreamInterruptedError(f"stream interrupted after {max_retries} attempts: {e}") from e
+    return None, {}, {}
+
+def _consume_stream(stream, working_directory, echo, started):
+    from openai.types.chat import ChatCompletion
+
+    pool = ThreadPoolExecutor(max_workers=4)
+    prefetched = {}
+    calls = {}
+    content_parts = []
+    first_token_at = None
+    delta_count = 0
+    usage = None
+    finish_reason = None
+    response_id = None
+    model = None
+    created = None
 
-    if tool_call_match:
-        fn_name = tool_call_match.group(1)
+    def dispatch(index):
+        call = calls[index]
+        if call["dispatched"] or call["name"] not in READ_ONLY_TOOLS:
+            return
+        # Run ahead only while every earlier call in the message is a read that
+        # has started: after a write, a read must see the written contents
+        if any(not calls[i]["dispatched"] for i in calls if i < index):
+            return
         try:
-            fn_args = json.loads(tool_call_match.group(2))
+            fn_args = json.loads(call["arguments"] or "{}")
         except json.JSONDecodeError:
-            fn_args = {}
+            return
+        call["dispatched"] = True
+        prefetched[call["id"]] = pool.submit(call_tool, call["name"], fn_args, working_directory)
 
-        print(f"\n{'='*70}")
-        print(f"TOOL CALL: {fn_name}")
-        print(f"{'='*70}")
-        if verbose:
-            print(f"Arguments:")
-            print(f"   {json.dumps(fn_args, indent=2)}")
+    try:
+        for chunk in stream:
+            response_id = response_id or chunk.id
+            model = model or chunk.model
+            created = created or chunk.created
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            delta = choice.delta
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
 
-        result = call_tool(fn_name, fn_args, working_directory, verbose)
+            if delta.content:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    if echo:
+                        print(f"\n{'='*70}")
+                        print("STREAMING RESPONSE")
+                        print(f"{'='*70}")
+                delta_count += 1
+                content_parts.append(delta.content)
+                if echo:
+                    print(delta.content, end="", flush=True)
 
-        if verbose:
-            result_str = str(result)
-            if len(result_str) > 500:
-                print(f"Result (truncated, {len(result_str)} chars):")
-                print(f"   {result_str[:500]}...")
-            else:
-                print(f"Result:")
-                # Format multi-line results nicely
-                lines = result_str.split('\n')
-                if len(lines) > 1:
-                    for line in lines[:20]:  # Show first 20 lines
-                        print(f"   {line}")
-                    if len(lines) > 20:
-                        print(f"   ... ({len(lines) - 20} more lines)")
+            for tc in delta.tool_calls or []:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                delta_count += 1
+                index = tc.index if tc.index is not None else len(calls)
+                if index not in calls:
+                    # A new index means every earlier call's arguments are complete
+                    for i in sorted(calls):
+                        dispatch(i)
+                    calls[index] = {"id": f"call_{index}", "name": "", "arguments": "", "dispatched": False}
+                call = calls[index]
+                if tc.id:
+                    call["id"] = tc.id
+                if tc.function:
+                    if tc.function.name:
+                        call["name"] += tc.function.name
+                    if tc.function.arguments:
+                        call["arguments"] += tc.function.arguments
+                        if call["name"] in READ_ONLY_TOOLS and call["arguments"].rstrip().endswith("}"):
+                            dispatch(index)
+        for i in sorted(calls):
+            dispatch(i)
+    except Exception:
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        pool.shutdown(wait=False)
+
+    finished_at = time.perf_counter()
+    if echo and content_parts:
+        print(f"\n{'='*70}\n")
+
+    content = "".join(content_parts)
+    tool_calls = [
+        {
+            "id": call["id"],
+            "type": "function",
+            "function": {"name": call["name"], "arguments": call["arguments"]},
+        }
+        for _, call in sorted(calls.items())
+    ]
+    response = ChatCompletion.model_validate({
+        "id": response_id or "stream",
+        "object": "chat.completion",
+        "created": created or int(time.time()),
+        "model": model or os.getenv("MODEL") or "",
+        "choices": [{
+            "index": 0,
+            "finish_reason": finish_reason or ("tool_calls" if tool_calls else "stop"),
+            "message": {
+                "role": "assistant",
+                "content": content or None,
+                "tool_calls": tool_calls or None,
+            },
+        }],
+        "usage": usage.model_dump() if usage else None,
+    })
+
+    completion_tokens = usage.completion_tokens if usage else delta_count
+    generation_time = finished_at - (first_token_at or finished_at)
+    stats = {
+        "ttft_s": round(first_token_at - started, 3) if first_token_at else None,
+        "total_s": round(finished_at - started, 3),
+        "completion_tokens": completion_tokens,
+        "tokens_per_s": round(completion_tokens / generation_time, 1) if generation_time > 0 else None,
+        "prefetched_tools": len(prefetched),
+    }
+    return response, prefetched, stats
+
+LEGACY_TOOL_CALL_RE = re.compile(r'\{[^}]*"name"\s*:\s*"([^"]+)"[^}]*"arguments"\s*:\s*(\{[^}]+\})')
+TEXT_TOOL_CALL_STATS = {"messages": 0, "tool_calls": 0, "parse_failures_avoided": 0}
+
+def _tool_calls_from_object(obj):
+    if isinstance(obj, list):
+        for item in obj:
+            yield from _tool_calls_from_object(item)
+        return
+    if not isinstance(obj, dict):
+        return
+    if isinstance(obj.get("name"), str) and ("arguments" in obj or "parameters" in obj):
+        fn_args = obj.get("arguments", obj.get("parameters"))
+        if isinstance(fn_args, str):
+            try:
+                fn_args = json.loads(fn_args or "{}")
+            except json.JSONDecodeError:
+                return
+        if isinstance(fn_args, dict):
+            yield obj["name"], fn_args
+        return
+    if "function" in obj:
+        yield from _tool_calls_from_object(obj["function"])
+    elif "tool_calls" in obj:
+        yield from _tool_calls_from_object(obj["tool_calls"])
+
+def extract_text_tool_calls(content):
+    calls = []
+    for obj in iter_json_objects(content):
+        calls.extend(_tool_calls_from_object(obj))
+
+    # Count calls the old single-regex parser would have missed or mangled
+    legacy_ok = 0
+    legacy_match = LEGACY_TOOL_CALL_RE.search(content)
+    if legacy_match:
+        try:
+            json.loads(legacy_match.group(2))
+            legacy_ok = 1
+        except json.JSONDecodeError:
+            pass
+    TEXT_TOOL_CALL_STATS["messages"] += 1
+    TEXT_TOOL_CALL_STATS["tool_calls"] += len(calls)
+    TEXT_TOOL_CALL_STATS["parse_failures_avoided"] += max(0, len(calls) - legacy_ok)
+    return calls
+
+def parse_and_execute_text_tool_call(content, messages, working_directory, verbose=False, echo_final=True, tool_log=None):
+    content = content.strip()
+    tool_calls = extract_text_tool_calls(content)
+
+    if tool_calls:
+        results = []
+        for idx, (fn_name, fn_args) in enumerate(tool_calls, 1):
+            print(f"\n{'='*70}")
+            print(f"TOOL CALL #{idx}: {fn_name}")
+            print(f"{'='*70}")
+            if verbose:
+                print(f"Arguments:")
+                print(f"   {json.dumps(fn_args, indent=2)}")
+
+            result = call_tool(fn_name, fn_args, working_directory, verbose)
+            results.append((fn_name, result))
+            if tool_log is not None:
+                tool_log.append((fn_name, result, fn_args))
+
+            if verbose:
+                result_str = str(result)
+                if len(result_str) > 500:
+                    print(f"Result (truncated, {len(result_str)} chars):")
+                    print(f"   {result_str[:500]}...")
                 else:
-                    print(f"   {result_str}")
-        print(f"{'='*70}\n")
+                    print(f"Result:")
+                    # Format multi-line results nicely
+                    lines = result_str.split('\n')
+                    if len(lines) > 1:
+                        for line in lines[:20]:  # Show first 20 lines
+                            print(f"   {line}")
+                        if len(lines) > 20:
+                            print(f"   ... ({len(lines) - 20} more lines)")
+                    else:
+                        print(f"   {result_str}")
+            print(f"{'='*70}\n")
 
+        if len(results) == 1:
+            result_text = f"Tool result: {results[0][1]}"
+        else:
+            result_text = "\n\n".join(
+                f"Tool result #{idx} ({fn_name}): {result}"
+                for idx, (fn_name, result) in enumerate(results, 1)
+            )
         messages.append({
             "role": "assistant",
             "content": content
         })
         messages.append({
             "role": "user",
-            "content": f"Tool result: {result}\n\nRemember: Respond in English only."
+            "content": f"{result_text}\n\nRemember: Respond in English only."
         })
         return True
     else:
-        print(f"\n{'='*70}")
-        print("FINAL RESPONSE")
-        print(f"{'='*70}")
-        print(content)
-        print(f"{'='*70}\n")
+        if echo_final:
+            print(f"\n{'='*70}")
+            print("FINAL RESPONSE")
+            print(f"{'='*70}")
+            print(content)
+            print(f"{'='*70}\n")
         return False
 
-def handle_structured_tool_calls(message, messages, working_directory, verbose=False):
+def handle_structured_tool_calls(message, messages, working_directory, verbose=False, prefetched=None, tool_log=None):
     messages.append(message)
 
     for idx, tool_call in enumerate(message.tool_calls, 1):
         fn_name = tool_call.function.name
-        fn_args = json.loads(tool_call.function.arguments)
+        fn_args = json.loads(tool_call.function.arguments or "{}")
 
         print(f"\n{'='*70}")
         print(f"🔧 TOOL CALL #{idx}: {fn_name}")
@@ -201,7 +553,12 @@ def handle_structured_tool_calls(message, messages, working_directory, verbose=F
             print(f"Arguments:")
             print(f"   {json.dumps(fn_args, indent=2)}")
 
-        result = call_tool(fn_name, fn_args, working_directory, verbose)
+        if prefetched and tool_call.id in prefetched:
+            result = prefetched[tool_call.id].result()
+        else:
+            result = call_tool(fn_name, fn_args, working_directory, verbose)
+        if tool_log is not None:
+            tool_log.append((fn_name, result, fn_args))
 
         if verbose:
             result_str = str(result)
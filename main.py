@@ -1,12 +1,31 @@
+import contextlib
+import json
 import os
+import re
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 sys.stdout.reconfigure(encoding="utf-8")
 from dotenv import load_dotenv
+from functions.candidates import (
+    candidate_instructions,
+    commit_candidate,
+    evaluate_candidates,
+    extract_candidates,
+    make_scratch_copy,
+    remove_scratch_copy,
+    sync_scratch_copy,
+)
 from functions.fn import (
+    READ_ONLY_TOOLS,
+    StreamInterruptedError,
+    TEXT_TOOL_CALL_STATS,
     get_api_response,
     handle_structured_tool_calls,
     parse_and_execute_text_tool_call,
+    run_succeeded,
+    stream_api_response,
 )
 from agent_core.llm_client import make_client
 from prompts import get_system_prompt
@@ -16,51 +35,122 @@ from tools import tools
 load_dotenv()
 
 
-def main():
-    client = make_client()
+def _flag_value(name, default=None):
+    if name in sys.argv:
+        idx = sys.argv.index(name)
+        if idx + 1 < len(sys.argv):
+            return sys.argv[idx + 1]
+    return default
 
-    if len(sys.argv) < 2:
-        print("Usage: python main.py <prompt> [--verbose]")
-        sys.exit(1)
 
-    verbose = "--verbose" in sys.argv
-    prompt = sys.argv[1]
-
-    working_directory = os.getenv("WORKING_DIRECTORY")
+def run_agent(
+    client,
+    prompt,
+    working_directory,
+    verbose=False,
+    stream=False,
+    num_candidates=0,
+    test_file="main.py",
+    max_iterations=None,
+):
+    # max_iterations=None: run until the model stops (interactive runs)
+    max_retries = int(os.getenv("MAX_RETRIES", "5"))
+    max_candidate_rounds = int(os.getenv("MAX_CANDIDATE_ROUNDS", "3"))
 
-    print(f"\n{'='*70}")
-    print("BUG HUNTER AI - Starting Agent")
-    print(f"{'='*70}")
-    print(f"Working Directory: {working_directory}")
-    print(f"User Prompt: {prompt}")
-    if verbose:
-        print(f"Verbose mode: ENABLED")
-    print(f"{'='*70}\n")
+    user_content = f"{prompt}\n\nIMPORTANT: Respond in English only."
+    agent_tools = tools
+    if num_candidates:
+        user_content += "\n\n" + candidate_instructions(num_candidates, test_file)
+        agent_tools = [t for t in tools if t["function"]["name"] in READ_ONLY_TOOLS]
 
     messages = [
         {"role": "system", "content": get_system_prompt(working_directory)},
-        {
-            "role": "user",
-            "content": f"{prompt}\n\nIMPORTANT: Respond in English only.",
-        },
+        {"role": "user", "content": user_content},
     ]
 
-    while True:
-        response = get_api_response(
-            client, messages, tools, int(os.getenv("MAX_RETRIES"))
-        )
+    result = {
+        "success": False,
+        "iterations": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0,
+        "turn_stats": [],
+        "files_written": [],
+    }
+    tool_log = []
+    turn_stats = result["turn_stats"]
+    candidate_rounds = 0
+    while max_iterations is None or result["iterations"] < max_iterations:
+        result["iterations"] += 1
+        prefetched = {}
+        if stream:
+            response, prefetched, stats = stream_api_response(
+                client, messages, agent_tools, working_directory, max_retries
+            )
+            if stats:
+                turn_stats.append(stats)
+                if verbose:
+                    print(
+                        f"[Stream] turn {len(turn_stats)}: ttft={stats['ttft_s']}s, "
+                        f"{stats['tokens_per_s']} tok/s, {stats['prefetched_tools']} tool(s) prefetched"
+                    )
+        else:
+            response = get_api_response(
+                client, messages, agent_tools, max_retries
+            )
         if not response:
-            return
+            return result
+
+        if response.usage:
+            result["prompt_tokens"] += response.usage.prompt_tokens or 0
+            result["completion_tokens"] += response.usage.completion_tokens or 0
+            result["total_tokens"] += response.usage.total_tokens or 0
 
         message = response.choices[0].message
 
         if message.tool_calls:
             handle_structured_tool_calls(
-                message, messages, working_directory, verbose
+                message, messages, working_directory, verbose, prefetched, tool_log
             )
+        elif message.content and num_candidates and (candidates := extract_candidates(message.content)):
+            candidates = candidates[:num_candidates]
+            candidate_rounds += 1
+            print(f"\n{'='*70}")
+            print(f"EVALUATING {len(candidates)} CANDIDATE FIXES (round {candidate_rounds})")
+            print(f"{'='*70}")
+            winner, outputs = evaluate_candidates(
+                working_directory, candidates, test_file, verbose
+            )
+            if winner is not None:
+                for write_result in commit_candidate(working_directory, candidates[winner]):
+                    print(f"   {write_result}")
+                result["files_written"] = _files_written(tool_log) + [path for path, _ in candidates[winner]]
+                print(f"\n{'='*70}")
+                print(f"FINAL RESPONSE: candidate #{winner + 1} passed {test_file} and was applied")
+                print(f"{'='*70}\n")
+                result["success"] = True
+                return result
+            if candidate_rounds >= max_candidate_rounds:
+                print(f"\n{'='*70}")
+                print(f"FINAL RESPONSE: no candidate passed after {candidate_rounds} rounds")
+                print(f"{'='*70}\n")
+                return result
+            failures = "\n\n".join(
+                f"Candidate #{idx + 1} output:\n{outputs[idx]}" for idx in sorted(outputs)
+            )
+            messages.append({"role": "assistant", "content": message.content})
+            messages.append({
+                "role": "user",
+                "content": (
+                    f"None of the candidates passed {test_file}.\n\n{failures}\n\n"
+                    f"Propose {num_candidates} new candidates in the same JSON format. "
+                    "Respond in English only."
+                ),
+            })
         elif message.content:
             if not parse_and_execute_text_tool_call(
-                message.content, messages, working_directory, verbose
+                message.content, messages, working_directory, verbose,
+                echo_final=not stream, tool_log=tool_log,
             ):
                 break
         else:
@@ -69,15 +159,187 @@ def main():
             print(f"{'='*70}\n")
             break
 
-    if verbose and response.usage:
+    # A run counts as successful when the last test run passed
+    test_runs = [output for name, output, _ in tool_log if name == "run_python_file"]
+    result["success"] = bool(test_runs) and run_succeeded(test_runs[-1])
+    result["files_written"] = _files_written(tool_log)
+    return result
+
+
+def _files_written(tool_log):
+    return [
+        args["file_path"] for name, output, args in tool_log
+        if name == "write_file" and str(output).startswith("File ") and isinstance(args.get("file_path"), str)
+    ]
+
+
+_batch_client = None
+
+
+def _init_batch_worker():
+    global _batch_client
+    _batch_client = make_client()
+
+
+def _run_batch_job(index, job, log_dir, verbose, stream, num_candidates, test_file):
+    job_id = str(job.get("id", index)) if isinstance(job, dict) else str(index)
+    record = {"id": job_id}
+    started = time.perf_counter()
+    scratch_dir = None
+    # The id names the log file: keep it a plain file name inside log_dir
+    log_name = re.sub(r"[^A-Za-z0-9._-]", "_", job_id).lstrip(".") or f"job-{index}"
+    log_path = os.path.join(log_dir, f"{log_name}.log")
+    try:
+        working_directory = job["working_directory"]
+        record["working_directory"] = working_directory
+        with open(log_path, "w", encoding="utf-8") as log, contextlib.redirect_stdout(log):
+            scratch_dir = make_scratch_copy(working_directory)
+            result = run_agent(
+                _batch_client, job["prompt"], scratch_dir, verbose, stream,
+                int(job.get("candidates", num_candidates)), job.get("test_file", test_file),
+                max_iterations=int(os.getenv("MAX_ITERATIONS", "30")),
+            )
+        if result["success"]:
+            record["files_updated"] = sync_scratch_copy(scratch_dir, working_directory, result["files_written"])
+        result.pop("turn_stats", None)
+        record.update(result)
+    except Exception as e:
+        record.update({"success": False, "error": f"{type(e).__name__}: {e}"})
+    finally:
+        if scratch_dir:
+            remove_scratch_copy(scratch_dir)
+    record["wall_time_s"] = round(time.perf_counter() - started, 3)
+    record["log"] = log_path
+    return record
+
+
+def run_batch(jobs_path, report_path, concurrency=4, verbose=False, stream=False, num_candidates=0, test_file="main.py"):
+    with open(jobs_path, "r", encoding="utf-8") as f:
+        jobs = [json.loads(line) for line in f if line.strip()]
+    log_dir = os.path.join(os.path.dirname(os.path.abspath(report_path)), "batch_logs")
+    os.makedirs(log_dir, exist_ok=True)
+
+    print(f"\n{'='*70}")
+    print(f"BUG HUNTER AI - Batch of {len(jobs)} jobs, concurrency {concurrency}")
+    print(f"{'='*70}")
+    print(f"Report: {report_path}")
+    print(f"Logs:   {log_dir}")
+    print(f"{'='*70}\n")
+
+    succeeded = 0
+    started = time.perf_counter()
+    with open(report_path, "w", encoding="utf-8") as report, ProcessPoolExecutor(
+        max_workers=concurrency, initializer=_init_batch_worker
+    ) as pool:
+        futures = [
+            pool.submit(_run_batch_job, idx, job, log_dir, verbose, stream, num_candidates, test_file)
+            for idx, job in enumerate(jobs, 1)
+        ]
+        for future in as_completed(futures):
+            record = future.result()
+            succeeded += bool(record.get("success"))
+            report.write(json.dumps(record) + "\n")
+            report.flush()
+            status = "OK  " if record.get("success") else "FAIL"
+            print(
+                f"[Batch] {status} {record['id']}: {record.get('iterations', 0)} iterations, "
+                f"{record.get('total_tokens', 0):,} tokens, {record['wall_time_s']}s"
+            )
+
+    print(f"\n{'='*70}")
+    print(f"BATCH DONE: {succeeded}/{len(jobs)} succeeded in {time.perf_counter() - started:.1f}s")
+    print(f"{'='*70}\n")
+
+
+def main():
+    verbose = "--verbose" in sys.argv
+    stream = "--stream" in sys.argv
+    num_candidates = int(_flag_value("--candidates", "0"))
+    test_file = _flag_value("--test-file", os.getenv("TEST_FILE", "main.py"))
+
+    batch_path = _flag_value("--batch")
+    if batch_path:
+        run_batch(
+            batch_path,
+            _flag_value("--report", "batch_report.jsonl"),
+            int(_flag_value("--concurrency", os.getenv("BATCH_CONCURRENCY", "4"))),
+            verbose,
+            stream,
+            num_candidates,
+            test_file,
+        )
+        return
+
+    client = make_client()
+
+    if len(sys.argv) < 2:
+        print(
+            "Usage: python main.py <prompt> [--verbose] [--stream] "
+            "[--candidates N] [--test-file main.py]\n"
+            "       python main.py --batch jobs.jsonl [--report report.jsonl] [--concurrency 4]"
+        )
+        sys.exit(1)
+
+    prompt = sys.argv[1]
+
+    working_directory = os.getenv("WORKING_DIRECTORY")
+
+    print(f"\n{'='*70}")
+    print("BUG HUNTER AI - Starting Agent")
+    print(f"{'='*70}")
+    print(f"Working Directory: {working_directory}")
+    print(f"User Prompt: {prompt}")
+    if verbose:
+        print(f"Verbose mode: ENABLED")
+    if stream:
+        print(f"Streaming: ENABLED")
+    if num_candidates:
+        print(f"Candidate mode: {num_candidates} parallel fixes, tested with {test_file}")
+    print(f"{'='*70}\n")
+
+    try:
+        result = run_agent(
+            client, prompt, working_directory, verbose, stream, num_candidates, test_file
+        )
+    except StreamInterruptedError as e:
+        print(f"\n{'='*70}")
+        print(f"ERROR: {e}")
+        print(f"{'='*70}\n")
+        sys.exit(1)
+
+    if verbose and result["total_tokens"]:
         print(f"\n{'='*70}")
         print("TOKEN USAGE")
         print(f"{'='*70}")
-        print(f"   Prompt tokens:    {response.usage.prompt_tokens:,}")
-        print(f"   Response tokens:   {response.usage.completion_tokens:,}")
-        print(f"   Total tokens:      {response.usage.total_tokens:,}")
+        print(f"   Prompt tokens:    {result['prompt_tokens']:,}")
+        print(f"   Response tokens:   {result['completion_tokens']:,}")
+        print(f"   Total tokens:      {result['total_tokens']:,}")
+        print(f"{'='*70}\n")
+
+    if verbose and TEXT_TOOL_CALL_STATS["tool_calls"]:
+        print(f"\n{'='*70}")
+        print("TEXT-MODE TOOL CALLS")
+        print(f"{'='*70}")
+        print(f"   Messages scanned:       {TEXT_TOOL_CALL_STATS['messages']}")
+        print(f"   Tool calls extracted:   {TEXT_TOOL_CALL_STATS['tool_calls']}")
+        print(f"   Parse failures avoided: {TEXT_TOOL_CALL_STATS['parse_failures_avoided']}")
+        print(f"{'='*70}\n")
+
+    turn_stats = result["turn_stats"]
+    if verbose and turn_stats:
+        ttfts = [s["ttft_s"] for s in turn_stats if s["ttft_s"] is not None]
+        rates = [s["tokens_per_s"] for s in turn_stats if s["tokens_per_s"] is not None]
+        print(f"\n{'='*70}")
+        print("STREAMING STATS")
+        print(f"{'='*70}")
+        print(f"   Turns:             {len(turn_stats)}")
+        if ttfts:
+            print(f"   Avg TTFT:          {sum(ttfts) / len(ttfts):.3f}s")
+        if rates:
+            print(f"   Avg tokens/s:      {sum(rates) / len(rates):.1f}")
+        print(f"   Prefetched tools:  {sum(s['prefetched_tools'] for s in turn_stats)}")
         print(f"{'='*70}\n")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -18,7 +18,7 @@ def get_system_prompt(working_directory):
         docs_section = f"""
 DOCUMENTATION:
 - Language / device documentation is available under: {docs_directory}
-- Use get_files_info and get_file_content to explore and read documentation files.
+- Use get_files_info, grep_workspace and get_file_content to explore and read documentation files.
 - When you are unsure about syntax, semantics, or device behavior, FIRST consult the documentation before guessing.
 """
 
@@ -38,7 +38,8 @@ CRITICAL RULES:
 2. When using write_file, you MUST include the COMPLETE file content - all functions, all methods.
 3. DO NOT truncate or simplify code. Copy the entire file and only change the buggy line.
 4. Never give a final response until you have fixed the code AND tested it successfully.
-5. STOP IMMEDIATELY after test passes. When run_python_file shows the correct output, give a final response saying "Bug fixed successfully" and STOP. Do not make any more changes.
+5. To locate a symbol or string, use grep_workspace(pattern, glob, context_lines) instead of reading whole files.
+6. STOP IMMEDIATELY after test passes. When run_python_file shows the correct output, give a final response saying "Bug fixed successfully" and STOP. Do not make any more changes.
 
 Workflow:
 1. get_files_info(".") - list files
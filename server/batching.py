@@ -0,0 +1,85 @@
+"""
+Micro-batching for concurrent MCP requests.
+
+Requests that arrive within a short window (or until max_batch is reached) are
+collected into one batch, processed with a single call in a worker thread, and
+each waiting request gets its own result back. This turns N concurrent
+single-query embedding passes into one batched forward pass and keeps the
+event loop free while the model runs.
+"""
+
+import asyncio
+from typing import Any, Callable, Generic, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Args:
+        process_batch: Synchronous function mapping a list of items to a list of
+            results of the same length; it runs in a worker thread.
+        max_batch: Flush immediately once this many items are pending.
+        window_s: Maximum time the first item of a batch waits for company.
+        on_batch: Optional callback(batch_size) for metrics.
+        on_queue: Optional callback(pending_count) for metrics.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[list[T]], list[R]],
+        max_batch: int = 16,
+        window_s: float = 0.005,
+        on_batch: Callable[[int], Any] | None = None,
+        on_queue: Callable[[int], Any] | None = None,
+    ) -> None:
+        self.process_batch = process_batch
+        self.max_batch = max(1, max_batch)
+        self.window_s = window_s
+        self._on_batch = on_batch
+        self._on_queue = on_queue
+        self._pending: list[tuple[T, asyncio.Future[R]]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    async def submit(self, item: T) -> R:
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[R] = loop.create_future()
+        self._pending.append((item, future))
+        if self._on_queue:
+            self._on_queue(len(self._pending))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_s, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        if self._on_queue:
+            self._on_queue(0)
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[tuple[T, "asyncio.Future[R]"]]) -> None:
+        if self._on_batch:
+            self._on_batch(len(batch))
+        try:
+            results = await asyncio.to_thread(self.process_batch, [item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"process_batch returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,294 @@
+"""
+Pluggable embedding backend for the MCP server and ingestion.
+
+EMBED_BACKEND selects how server/embedding_model (BGE) is run:
+  torch  HuggingFaceEmbedding, PyTorch eager mode (default)
+  onnx   OnnxEmbedding, the same model exported to ONNX and run with ONNX Runtime;
+         ONNX_THREADS sets the inference session's intra-op threads (default:
+         all cores)
+
+Export once, then check speed and agreement against the PyTorch backend:
+
+  python server/embedding_backend.py export [--quantize]
+  python server/embedding_backend.py bench [--texts 256] [--tolerance 0.99]
+
+`export --quantize` additionally writes model_int8.onnx (dynamic int8 weights);
+select it with ONNX_MODEL_FILE=model_int8.onnx. Pooling (CLS / mean), query
+prompts and normalisation are read from the sentence-transformers config in the
+model directory so both backends produce the same vectors.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+EMBEDDING_MODEL_PATH = PROJECT_ROOT / "server" / "embedding_model"
+ONNX_MODEL_DIR = PROJECT_ROOT / "server" / "embedding_model_onnx"
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+
+
+def _read_json(path: Path) -> dict[str, Any]:
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _pooling_mode(model_dir: Path) -> str:
+    """'cls' or 'mean', from the sentence-transformers pooling config (BGE uses CLS)."""
+    config = _read_json(model_dir / "1_Pooling" / "config.json")
+    if config.get("pooling_mode_mean_tokens") and not config.get("pooling_mode_cls_token"):
+        return "mean"
+    return "cls"
+
+
+def _query_prompt(model_dir: Path) -> str:
+    return _read_json(model_dir / "config_sentence_transformers.json").get("prompts", {}).get("query", "")
+
+
+def _load_onnx_class() -> type:
+    """Defined lazily so llama-index is only imported when the ONNX backend is used."""
+    from llama_index.core.bridge.pydantic import Field, PrivateAttr
+    from llama_index.core.embeddings import BaseEmbedding
+
+    class OnnxEmbedding(BaseEmbedding):
+        """BaseEmbedding over an ONNX export of a BERT-style sentence-transformers model."""
+
+        query_instruction: str = Field(default="", description="Prefix added to queries")
+        text_instruction: str = Field(default="", description="Prefix added to documents")
+        pooling: str = Field(default="cls", description="'cls' or 'mean'")
+        normalize: bool = Field(default=True)
+        max_length: int = Field(default=512)
+
+        _tokenizer: Any = PrivateAttr()
+        _session: Any = PrivateAttr()
+        _input_names: set = PrivateAttr()
+
+        def __init__(
+            self,
+            model_dir: str | Path,
+            onnx_path: str | Path,
+            num_threads: int | None = None,
+            **kwargs: Any,
+        ) -> None:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+
+            model_dir = Path(model_dir)
+            kwargs.setdefault("pooling", _pooling_mode(model_dir))
+            kwargs.setdefault("query_instruction", _query_prompt(model_dir))
+            super().__init__(model_name=str(onnx_path), **kwargs)
+
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if num_threads:
+                options.intra_op_num_threads = num_threads
+            self._session = ort.InferenceSession(
+                str(onnx_path), sess_options=options, providers=["CPUExecutionProvider"]
+            )
+            self._input_names = {i.name for i in self._session.get_inputs()}
+            self._tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+
+        @classmethod
+        def class_name(cls) -> str:
+            return "OnnxEmbedding"
+
+        def embed_batch(self, texts: list[str], prompt_name: str | None = None) -> list[list[float]]:
+            """Embed texts in one forward pass; prompt_name "query" or "text" picks the prefix."""
+            import numpy as np
+
+            prefix = {"query": self.query_instruction, "text": self.text_instruction}.get(prompt_name or "", "")
+            encoded = self._tokenizer(
+                [prefix + t for t in texts],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            feeds = {k: v.astype(np.int64) for k, v in encoded.items() if k in self._input_names}
+            hidden = self._session.run(None, feeds)[0]
+            if self.pooling == "mean":
+                mask = encoded["attention_mask"][..., None].astype(hidden.dtype)
+                vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            else:
+                vectors = hidden[:, 0]
+            if self.normalize:
+                vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+            return vectors.tolist()
+
+        def _get_query_embedding(self, query: str) -> list[float]:
+            return self.embed_batch([query], prompt_name="query")[0]
+
+        def _get_text_embedding(self, text: str) -> list[float]:
+            return self.embed_batch([text], prompt_name="text")[0]
+
+        def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+            return self.embed_batch(texts, prompt_name="text")
+
+        async def _aget_query_embedding(self, query: str) -> list[float]:
+            return self._get_query_embedding(query)
+
+        async def _aget_text_embedding(self, text: str) -> list[float]:
+            return self._get_text_embedding(text)
+
+    return OnnxEmbedding
+
+
+def load_embed_model(model_dir: str | Path = EMBEDDING_MODEL_PATH, backend: str | None = None) -> Any:
+    """Return a LlamaIndex embedding model for EMBED_BACKEND (torch or onnx)."""
+    backend = (backend or os.getenv("EMBED_BACKEND", "torch")).lower()
+    if backend == "onnx":
+        onnx_dir = Path(os.getenv("ONNX_MODEL_DIR", str(ONNX_MODEL_DIR)))
+        onnx_path = onnx_dir / os.getenv("ONNX_MODEL_FILE", ONNX_FILE)
+        if not onnx_path.exists():
+            raise FileNotFoundError(
+                f"{onnx_path} not found; run `python server/embedding_backend.py export` first"
+            )
+        threads = int(os.getenv("ONNX_THREADS", "0")) or None
+        print(f"Embedding backend: onnx ({onnx_path.name}, threads={threads or 'default'})")
+        return _load_onnx_class()(model_dir=model_dir, onnx_path=onnx_path, num_threads=threads)
+    if backend != "torch":
+        raise ValueError(f"Unknown EMBED_BACKEND {backend!r} (expected 'torch' or 'onnx')")
+
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    return HuggingFaceEmbedding(model_name=str(model_dir))
+
+
+def embed_query_batch(model: Any, queries: list[str]) -> list[list[float]]:
+    """Embed several queries with one forward pass, matching model.get_query_embedding."""
+    if len(queries) == 1:
+        return [model.get_query_embedding(queries[0])]
+    if hasattr(model, "embed_batch"):
+        return model.embed_batch(queries, prompt_name="query")
+    # HuggingFaceEmbedding has no public batched query method. _embed(..., prompt_name="query")
+    # is what its get_query_embedding runs; requirements.txt pins the release line that has it,
+    # and anything else falls back to one public call per query.
+    try:
+        return model._embed(queries, prompt_name="query")
+    except (AttributeError, TypeError):
+        return [model.get_query_embedding(q) for q in queries]
+
+
+def export_onnx(
+    model_dir: Path = EMBEDDING_MODEL_PATH,
+    out_dir: Path = ONNX_MODEL_DIR,
+    quantize: bool = False,
+    opset: int = 17,
+) -> Path:
+    """Export the transformer encoder (last_hidden_state) to ONNX; optionally add a dynamic-int8 copy."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+    model = AutoModel.from_pretrained(str(model_dir)).eval()
+    sample = tokenizer(["an example sentence"], return_tensors="pt")
+    input_names = list(sample.keys())
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    onnx_path = out_dir / ONNX_FILE
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            str(onnx_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    print(f"Exported {model_dir} to {onnx_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = out_dir / ONNX_INT8_FILE
+        quantize_dynamic(str(onnx_path), str(int8_path), weight_type=QuantType.QInt8)
+        print(f"Wrote dynamic int8 model to {int8_path}")
+    return onnx_path
+
+
+def _sample_texts(n: int) -> list[str]:
+    """Benchmark inputs: Context and Code cells from samples.csv, cycled to n."""
+    with open(PROJECT_ROOT / "samples.csv", "r", encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    texts = [t for row in rows for t in (row.get("Context", ""), row.get("Code", "")) if t.strip()]
+    return [texts[i % len(texts)] for i in range(n)]
+
+
+def _time_embeddings(model: Any, texts: list[str], batch_size: int) -> tuple[list[list[float]], float]:
+    embed_query_batch(model, texts[:batch_size])  # warm-up
+    started = time.perf_counter()
+    vectors: list[list[float]] = []
+    for i in range(0, len(texts), batch_size):
+        vectors.extend(embed_query_batch(model, texts[i:i + batch_size]))
+    return vectors, time.perf_counter() - started
+
+
+def benchmark(texts: int, batch_size: int, tolerance: float, onnx_files: list[str]) -> bool:
+    """Print embeddings/s per backend and cosine agreement with torch; False if below tolerance."""
+    import numpy as np
+
+    inputs = _sample_texts(texts)
+    torch_vectors, torch_s = _time_embeddings(load_embed_model(backend="torch"), inputs, batch_size)
+    reference = np.asarray(torch_vectors, dtype=np.float32)
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+    print(f"{'backend':<24}{'emb/s':>10}{'speedup':>10}{'min cos':>10}{'mean cos':>10}")
+    print(f"{'torch':<24}{len(inputs) / torch_s:>10.1f}{1.0:>10.2f}{'-':>10}{'-':>10}")
+
+    ok = True
+    for name in onnx_files:
+        os.environ["ONNX_MODEL_FILE"] = name
+        try:
+            model = load_embed_model(backend="onnx")
+        except FileNotFoundError as e:
+            print(f"{'onnx/' + name:<24}skipped: {e}")
+            continue
+        vectors, seconds = _time_embeddings(model, inputs, batch_size)
+        candidate = np.asarray(vectors, dtype=np.float32)
+        candidate /= np.linalg.norm(candidate, axis=1, keepdims=True)
+        cosines = (reference * candidate).sum(axis=1)
+        passed = float(cosines.min()) >= tolerance
+        ok = ok and passed
+        print(
+            f"{'onnx/' + name:<24}{len(inputs) / seconds:>10.1f}{torch_s / seconds:>10.2f}"
+            f"{cosines.min():>10.4f}{cosines.mean():>10.4f}{'' if passed else '  BELOW TOLERANCE'}"
+        )
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export / benchmark the ONNX embedding backend.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Export server/embedding_model to ONNX")
+    export.add_argument("--quantize", action="store_true", help="Also write a dynamic int8 model")
+    export.add_argument("--opset", type=int, default=17)
+    bench = sub.add_parser("bench", help="Compare embeddings/s and cosine similarity against torch")
+    bench.add_argument("--texts", type=int, default=256, help="Number of texts to embed")
+    bench.add_argument("--batch-size", type=int, default=16)
+    bench.add_argument("--tolerance", type=float, default=0.99, help="Minimum cosine similarity to torch")
+    bench.add_argument(
+        "--models", default=f"{ONNX_FILE},{ONNX_INT8_FILE}", help="Comma-separated ONNX files to compare"
+    )
+    args = parser.parse_args()
+
+    if not EMBEDDING_MODEL_PATH.is_dir():
+        print(f"Embedding model not found: {EMBEDDING_MODEL_PATH}")
+        sys.exit(1)
+    if args.command == "export":
+        export_onnx(quantize=args.quantize, opset=args.opset)
+    elif not benchmark(args.texts, args.batch_size, args.tolerance, [m for m in args.models.split(",") if m]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Hot-swappable index state for the MCP server.
+
+Everything derived from a collection's storage directory (LlamaIndex index,
+retriever, keyword index, optional int8 index, version stamp) lives in one
+immutable IndexState. Requests read `manager.current` once and use that
+snapshot for the whole batch; a reload builds a complete new state in the
+background and replaces the reference in a single assignment, so in-flight
+requests finish on the old index and new ones see the new index. The embedding model is not part of the state and stays loaded.
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from server.metrics import log
+
+
+@dataclass(frozen=True)
+class IndexState:
+    index: Any
+    retriever: Any
+    quantized: Any | None
+    keyword: Any
+    version: str
+    loaded_at: float
+    load_seconds: float
+
+    def describe(self) -> dict[str, Any]:
+        return {
+            "version": self.version,
+            "loaded_at": round(self.loaded_at, 3),
+            "load_seconds": round(self.load_seconds, 3),
+            "int8": self.quantized is not None,
+            "nodes": len(self.keyword.node_ids),
+        }
+
+
+class IndexManager:
+    """
+    Args:
+        loader: Builds a fresh IndexState from storage (runs off the request path).
+        stamp: Returns the version currently stamped on disk (used by the watcher).
+    """
+
+    def __init__(self, loader: Callable[[], IndexState], stamp: Callable[[], str]) -> None:
+        self._loader = loader
+        self._stamp = stamp
+        self._reload_lock = threading.Lock()
+        self._state = loader()
+        self.reloads = 0
+        self.failures = 0
+        self._watcher: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    @property
+    def current(self) -> IndexState:
+        return self._state
+
+    def reload(self, force: bool = True) -> dict[str, Any]:
+        """Load storage into a new state and swap it in. Concurrent calls are serialized."""
+        with self._reload_lock:
+            previous = self._state
+            if not force and self._stamp() == previous.version:
+                return {"reloaded": False, **previous.describe()}
+            try:
+                state = self._loader()
+            except Exception as e:
+                self.failures += 1
+                log.always("index_reload_error", error=str(e), serving_version=previous.version)
+                return {"reloaded": False, "error": str(e), **previous.describe()}
+            self._state = state
+            self.reloads += 1
+        log.always("index_reloaded", previous_version=previous.version, **state.describe())
+        return {"reloaded": True, "previous_version": previous.version, **state.describe()}
+
+    def start_watcher(self, interval_s: float) -> None:
+        """Poll the version stamp every interval_s seconds and reload when it changes."""
+        if interval_s <= 0 or self._watcher is not None:
+            return
+
+        def _watch() -> None:
+            while not self._stop.wait(interval_s):
+                if self._stamp() != self._state.version:
+                    self.reload(force=False)
+
+        self._watcher = threading.Thread(target=_watch, name="index-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> dict[str, Any]:
+        return {**self._state.describe(), "reloads": self.reloads, "reload_failures": self.failures}
+
+
+def timed_state(build: Callable[[], tuple[Any, Any, Any, Any]], version: str) -> IndexState:
+    """Run build() -> (index, retriever, quantized, keyword) and wrap the result with its load time."""
+    started = time.perf_counter()
+    index, retriever, quantized, keyword = build()
+    return IndexState(
+        index=index,
+        retriever=retriever,
+        quantized=quantized,
+        keyword=keyword,
+        version=version,
+        loaded_at=time.time(),
+        load_seconds=time.perf_counter() - started,
+    )
@@ -8,9 +8,25 @@ returns relevant bug-pattern and API documentation. Run from project root:
 
 Optionally set ADD_TO_EXISTING=1 to try loading the existing index and inserting
 (newer LlamaIndex may support this); by default we create a fresh index from samples.
+
+Pass --quantize int8 to also write an int8 copy of the vectors (see
+server/quantized_index.py) plus quantization_report.json with the memory saving
+and recall@5 against the float baseline, using the Context column as queries.
+
+--collection NAME writes a named collection to server/storage/NAME/ (the default
+collection is server/storage/ itself), and --docs DIR ingests the text files in a
+documentation directory instead of samples.csv:
+
+  python server/ingest_from_samples.py --collection bug_patterns
+  python server/ingest_from_samples.py --collection api_docs --docs docs/rdi
+
+EMBED_BACKEND=onnx embeds with the ONNX Runtime export (server/embedding_backend.py);
+use the same backend as the server so query and document vectors match.
 """
 
+import argparse
 import csv
+import json
 import os
 import sys
 from pathlib import Path
@@ -23,6 +39,7 @@ sys.path.insert(0, str(PROJECT_ROOT))
 STORAGE_PATH = PROJECT_ROOT / "server" / "storage"
 EMBEDDING_MODEL_PATH = PROJECT_ROOT / "server" / "embedding_model"
 SAMPLES_CSV = PROJECT_ROOT / "samples.csv"
+DOC_EXTENSIONS = [".md", ".txt", ".rst", ".html", ".h", ".hpp", ".cpp"]
 
 
 def _build_documents_from_csv() -> list:
@@ -46,8 +63,69 @@ def _build_documents_from_csv() -> list:
     return documents
 
 
+def _build_documents_from_dir(docs_dir: Path) -> list:
+    """Load documentation files (markdown, text, headers, ...) recursively from docs_dir."""
+    from llama_index.core import SimpleDirectoryReader
+
+    reader = SimpleDirectoryReader(input_dir=str(docs_dir), recursive=True, required_exts=DOC_EXTENSIONS)
+    return reader.load_data()
+
+
+def _write_int8_index(storage_path: Path, report_queries: list[str] | None) -> None:
+    """Write the int8 copy; with report_queries, also a recall report against float search."""
+    from llama_index.core import Settings
+
+    from server.quantized_index import QuantizedIndex, load_vector_store, quantization_report
+
+    node_ids, vectors = load_vector_store(storage_path)
+    qindex = QuantizedIndex.from_vectors(node_ids, vectors)
+    qindex.save(storage_path)
+    print(f"Wrote int8 index for {len(node_ids)} vectors to {storage_path}")
+
+    contexts = [c for c in report_queries or [] if c]
+    if not contexts or not node_ids:
+        print("No report queries for this collection; skipping the recall report")
+        return
+    import numpy as np
+
+    queries = np.asarray([Settings.embed_model.get_query_embedding(c) for c in contexts], dtype=np.float32)
+    report = quantization_report(node_ids, vectors, queries, qindex)
+    with open(storage_path / "quantization_report.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(
+        f"int8: {report['int8_bytes']:,} bytes vs float32 {report['float32_bytes']:,} "
+        f"({report['memory_saving']:.0%} smaller); recall@5 {report['recall@5_int8']:.3f}, "
+        f"with rerank {report['recall@5_int8_rerank']:.3f}"
+    )
+
+
 def main() -> None:
-    if not SAMPLES_CSV.exists():
+    parser = argparse.ArgumentParser(description="Ingest samples.csv into the MCP server index.")
+    parser.add_argument(
+        "--quantize",
+        choices=["none", "int8"],
+        default=os.getenv("INDEX_QUANTIZATION", "none"),
+        help="Also write an int8-quantized copy of the vectors (default: none)",
+    )
+    parser.add_argument(
+        "--collection",
+        default=os.getenv("INGEST_COLLECTION", "default"),
+        help="Collection to (re)build, e.g. api_docs or bug_patterns (default: the legacy root index)",
+    )
+    parser.add_argument("--docs", type=Path, default=None, help="Ingest documentation files from this directory")
+    args = parser.parse_args()
+
+    from server.namespaces import collection_path
+
+    try:
+        storage_path = collection_path(STORAGE_PATH, args.collection)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    if args.docs is not None and not args.docs.is_dir():
+        print(f"Docs directory not found: {args.docs}")
+        sys.exit(1)
+    if args.docs is None and not SAMPLES_CSV.exists():
         print(f"Samples file not found: {SAMPLES_CSV}")
         sys.exit(1)
     if not EMBEDDING_MODEL_PATH.is_dir():
@@ -55,20 +133,51 @@ def main() -> None:
         print("Ensure server/embedding_model exists (e.g. BAAI/bge-base-en-v1.5).")
         sys.exit(1)
 
-    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
     from llama_index.core import Settings, StorageContext, VectorStoreIndex
 
-    Settings.embed_model = HuggingFaceEmbedding(
-        model_name=str(EMBEDDING_MODEL_PATH)
-    )
+    from server.embedding_backend import load_embed_model
+
+    Settings.embed_model = load_embed_model(EMBEDDING_MODEL_PATH)
 
-    documents = _build_documents_from_csv()
-    print(f"Built {len(documents)} documents from {SAMPLES_CSV}")
+    if args.docs is not None:
+        documents = _build_documents_from_dir(args.docs)
+        print(f"Loaded {len(documents)} documents from {args.docs}")
+    else:
+        documents = _build_documents_from_csv()
+        print(f"Built {len(documents)} documents from {SAMPLES_CSV}")
 
     index = VectorStoreIndex.from_documents(documents)
-    STORAGE_PATH.mkdir(parents=True, exist_ok=True)
-    index.storage_context.persist(persist_dir=str(STORAGE_PATH))
-    print(f"Persisted index to {STORAGE_PATH}")
+    storage_path.mkdir(parents=True, exist_ok=True)
+    index.storage_context.persist(persist_dir=str(storage_path))
+    print(f"Persisted collection {args.collection!r} to {storage_path}")
+
+    # API-term document frequencies for the pipeline's deterministic query planner
+    from agents.query_planner import VOCABULARY_FILE, build_vocabulary
+
+    vocabulary = build_vocabulary(doc.get_content() for doc in documents)
+    with open(storage_path / VOCABULARY_FILE, "w", encoding="utf-8") as f:
+        json.dump(vocabulary, f, indent=1, sort_keys=True)
+    print(f"Wrote {len(vocabulary['df'])} API terms to {storage_path / VOCABULARY_FILE}")
+
+    if args.quantize == "int8":
+        # samples.csv contexts are realistic queries for the samples collection only
+        report_queries = None
+        if args.docs is None:
+            with open(SAMPLES_CSV, "r", encoding="utf-8", newline="") as f:
+                report_queries = [row.get("Context", "").strip() for row in csv.DictReader(f)]
+        _write_int8_index(storage_path, report_queries)
+    else:
+        # Don't leave an int8 copy of the previous index behind for the server to pick up
+        from server.quantized_index import FLOAT_GLOB, INT8_FILE
+
+        (storage_path / INT8_FILE).unlink(missing_ok=True)
+        for path in storage_path.glob(FLOAT_GLOB):
+            path.unlink(missing_ok=True)
+
+    # Written last: a new stamp invalidates the server's result cache
+    from server.result_cache import write_index_version
+
+    print(f"Index version {write_index_version(storage_path)}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,75 @@
+"""
+In-memory BM25 keyword index over a collection's nodes.
+
+Complements vector search for exact identifiers (vForceRange, TA::MULTI_PORT,
+digCap) that embeddings tend to blur. Tokens are lower-cased identifier pieces;
+camelCase and snake_case names are also split so `vForce` matches `vforcerange`
+queries partially. Built from the docstore when a collection is loaded, so it
+can never go stale relative to the vector index.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Iterable
+
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for word in _WORD_RE.findall(text):
+        lowered = word.lower()
+        tokens.append(lowered)
+        parts = [p.lower() for piece in word.split("_") for p in _CAMEL_RE.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if len(p) > 1)
+    return tokens
+
+
+class KeywordIndex:
+    def __init__(self, docs: Iterable[tuple[str, str]], k1: float = 1.5, b: float = 0.75) -> None:
+        """docs: (node_id, text) pairs."""
+        self.k1 = k1
+        self.b = b
+        self.node_ids: list[str] = []
+        self._tfs: list[Counter] = []
+        self._lengths: list[int] = []
+        self._postings: dict[str, list[int]] = {}
+        for node_id, text in docs:
+            tf = Counter(tokenize(text))
+            doc = len(self.node_ids)
+            self.node_ids.append(node_id)
+            self._tfs.append(tf)
+            self._lengths.append(sum(tf.values()))
+            for term in tf:
+                self._postings.setdefault(term, []).append(doc)
+        n = len(self.node_ids)
+        self._avg_len = (sum(self._lengths) / n) if n else 0.0
+        self._idf = {
+            term: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def search(self, query: str, top_k: int = 20) -> list[tuple[str, float]]:
+        scores: dict[int, float] = {}
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for doc in self._postings[term]:
+                tf = self._tfs[doc][term]
+                norm = tf + self.k1 * (1 - self.b + self.b * self._lengths[doc] / (self._avg_len or 1.0))
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (self.k1 + 1) / norm
+        ranked = sorted(scores.items(), key=lambda kv: -kv[1])[:top_k]
+        return [(self.node_ids[doc], score) for doc, score in ranked]
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[tuple[str, float]]:
+    """Merge ranked id lists; score = sum over lists of 1 / (k + rank)."""
+    fused: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, node_id in enumerate(ranking, 1):
+            fused[node_id] = fused.get(node_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda kv: -kv[1])
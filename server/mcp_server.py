@@ -1,13 +1,34 @@
 # from huggingface_hub import snapshot_download
 from pathlib import Path
 
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.core import StorageContext, load_index_from_storage, Settings
+from llama_index.core import QueryBundle, StorageContext, load_index_from_storage, Settings
 from llama_index.core.retrievers import VectorIndexRetriever
 
+import asyncio
 import math
 import os
+import sys
+import threading
+import time
+from typing import NamedTuple
 from fastmcp import FastMCP
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+
+# Make server/ helper modules importable whether run from project root or server/
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from server.batching import MicroBatcher
+from server.embedding_backend import embed_query_batch, load_embed_model
+from server.index_state import IndexManager, IndexState, timed_state
+from server.keyword_index import KeywordIndex, reciprocal_rank_fusion
+from server.metrics import COUNT_BUCKETS, log, registry
+from server.namespaces import DEFAULT_COLLECTION, discover_collections
+from server.quantized_index import INT8_FILE, QuantizedIndex
+from server.rerank import load_reranker, rerank
+from server.result_cache import IndexVersion, ResultCache, normalize_query
 
 current_directory = os.getcwd()
 print(f"Current working directory: {current_directory}")
@@ -25,9 +46,8 @@ else:
     # snapshot_download(repo_id=model_id, local_dir=local_dir, local_dir_use_symlinks=False)
 
 
-embed_model = HuggingFaceEmbedding(
-    model_name=directory_path
-)
+# EMBED_BACKEND=onnx runs an ONNX Runtime export instead of PyTorch (see embedding_backend.py)
+embed_model = load_embed_model(directory_path)
 Settings.embed_model = embed_model
 
 if os.path.basename(current_directory) == "server":
@@ -35,33 +55,163 @@ if os.path.basename(current_directory) == "server":
 else:
     storage_path = os.path.join(".", "server", "storage")
 
-storage_context = StorageContext.from_defaults(persist_dir=storage_path)
-index = load_index_from_storage(storage_context=storage_context)
-retriever = VectorIndexRetriever(index=index, similarity_top_k=20)
+DEFAULT_TOP_K = 20
+SEARCH_MODES = ("vector", "keyword", "hybrid")
+# Full-precision rerank of the top int8 candidates; 0 disables it
+INT8_RERANK_CANDIDATES = int(os.getenv("INT8_RERANK_CANDIDATES", "80"))
+# Candidates retrieved per query when the caller passes `context` for reranking, and the time
+# the reranker may spend on them (see server/rerank.py)
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "40"))
+RERANK_BUDGET_S = float(os.getenv("RERANK_BUDGET_MS", "30")) / 1000.0
+reranker = load_reranker()
+# Poll each collection's index_version and hot-swap a re-ingested index; 0 disables (use reload_index)
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "5"))
+
+
+def load_index_state(path: Path, index_version: IndexVersion) -> IndexState:
+    """Load index, retriever, keyword index and optional int8 index from one collection (embed model is reused)."""
+    # Read the stamp first: if ingestion finishes mid-load, the watcher sees a newer stamp and reloads again
+    version = index_version.get()
+
+    def _build():
+        storage_context = StorageContext.from_defaults(persist_dir=str(path))
+        index = load_index_from_storage(storage_context=storage_context)
+        retriever = VectorIndexRetriever(index=index, similarity_top_k=DEFAULT_TOP_K)
+        keyword = KeywordIndex((node_id, node.get_content()) for node_id, node in index.docstore.docs.items())
+        # Optional int8 scoring, written by `ingest_from_samples.py --quantize int8`.
+        # RETRIEVAL_BACKEND=float forces the LlamaIndex retriever even if the file exists.
+        quantized_index = None
+        if os.getenv("RETRIEVAL_BACKEND", "auto") != "float" and (path / INT8_FILE).exists():
+            quantized_index = QuantizedIndex.load(path)
+            print(f"Using int8 index for {path} ({len(quantized_index.node_ids)} vectors, {quantized_index.nbytes:,} bytes)")
+        return index, retriever, quantized_index, keyword
+
+    return timed_state(_build, version)
+
+
+# One hot-reloadable index per collection (see server/namespaces.py for the layout)
+collections: dict[str, IndexManager] = {}
+_collections_lock = threading.Lock()
+
+
+def refresh_collections() -> list[str]:
+    """Load collections that appeared under storage_path since startup; returns their names."""
+    added = []
+    with _collections_lock:
+        for name, path in discover_collections(Path(storage_path)).items():
+            if name in collections:
+                continue
+            version = IndexVersion(path)
+            manager = IndexManager(lambda path=path, version=version: load_index_state(path, version), version.get)
+            manager.start_watcher(INDEX_WATCH_INTERVAL)
+            collections[name] = manager
+            added.append(name)
+    if added:
+        print(f"Loaded collections: {', '.join(added)}")
+    return added
+
+
+refresh_collections()
+if not collections:
+    raise SystemExit(f"No index found under {storage_path}; run server/ingest_from_samples.py first")
 
 # nodes = retriever.retrieve("what is the range of vForceRange parameters")
 # for ele in nodes:
 #     print(ele,"\n\n")
 
 
+EMBED_SECONDS = registry.histogram("mcp_embed_seconds", "Query embedding latency")
+RETRIEVE_SECONDS = registry.histogram("mcp_retrieve_seconds", "Vector retrieval latency (excluding embedding)")
+REQUEST_SECONDS = registry.histogram("mcp_search_request_seconds", "End-to-end search_documents latency")
+RESULT_COUNT = registry.histogram("mcp_search_results", "Chunks returned per search_documents call", COUNT_BUCKETS)
+IN_FLIGHT = registry.gauge("mcp_search_in_flight", "Concurrent search_documents requests")
+QUEUE_DEPTH = registry.gauge("mcp_batch_queue_depth", "Queries waiting for the next embedding micro-batch")
+BATCH_SIZE = registry.histogram("mcp_embed_batch_size", "Queries embedded per model call", COUNT_BUCKETS)
+REQUESTS = registry.counter("mcp_search_requests_total", "search_documents requests served")
+ERRORS = registry.counter("mcp_search_errors_total", "search_documents requests that raised")
+CACHE_HITS = registry.counter("mcp_result_cache_hits_total", "search_documents requests served from the result cache")
+RERANK_SECONDS = registry.histogram("mcp_rerank_seconds", "Reranking latency per query")
+RERANK_OVER_BUDGET = registry.counter(
+    "mcp_rerank_over_budget_total", "Reranks that hit RERANK_BUDGET_MS before scoring every candidate"
+)
+CACHE_MISSES = registry.counter("mcp_result_cache_misses_total", "search_documents requests that ran retrieval")
+
+# Retrieval candidates before reranking, keyed by (collection, mode, normalized query, top_k, whether
+# the wider rerank set was fetched, version of the loaded index); a reload changes every key. The
+# snippet-specific rerank runs on every request, so rows with the same query share one entry.
+result_cache = ResultCache(
+    max_entries=int(os.getenv("RESULT_CACHE_SIZE", "4096")),
+    ttl_s=float(os.getenv("RESULT_CACHE_TTL_S", "3600")),
+)
+
+
 mcp= FastMCP("ABH_Server",port=8003)
 
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@mcp.tool()
+def server_stats() -> dict:
+    """
+    Returns server metrics: request counts, concurrent requests,
+    embed / retrieval / end-to-end latency histograms (seconds) with p50/p95/p99,
+    result cache size and hit rate, and each collection's index version / reload counts.
+    """
+    return {
+        **registry.snapshot(),
+        "result_cache": result_cache.stats(),
+        "collections": {name: manager.stats() for name, manager in collections.items()},
+    }
+
+@mcp.tool()
+def list_collections() -> list:
+    """
+    Lists the searchable collections (e.g. default, api_docs, bug_patterns).
+    """
+    return sorted(collections)
+
+@mcp.tool()
+async def reload_index(collection: str = "") -> dict:
+    """
+    Reloads a collection (or every collection, picking up newly ingested ones)
+    in the background and atomically swaps it in. Requests keep being served
+    from the current index until the new one is ready.
+
+    Args:
+        collection (str): Collection to reload; empty reloads all.
+
+    Returns:
+        dict: per collection: reloaded (bool), version, previous_version, load_seconds, or error.
+    """
+    def _reload() -> dict:
+        added = refresh_collections()
+        names = [collection] if collection else [n for n in collections if n not in added]
+        report = {name: {"reloaded": True, "added": True, **collections[name].stats()} for name in added}
+        for name in names:
+            if name not in collections:
+                report[name] = {"reloaded": False, "error": f"Unknown collection {name!r}"}
+            elif name not in added:
+                report[name] = collections[name].reload()
+        return report
+
+    return await asyncio.to_thread(_reload)
+
 @mcp.tool()
 def add(a: int, b: int) -> int:
-   print(f"Server received add request: {a}, {b}")
+   log.sample("add", a=a, b=b)
    return a + b
 
 @mcp.tool()
 def multiply(a: int, b: int) -> int:
-   print(f"Server received multiply request: {a}, {b}")
+   log.sample("multiply", a=a, b=b)
    return a * b
 
 @mcp.tool()
 def sine(a: int) -> float:
-    print(f"Server received sine request: {a}")
     radians = math.radians(a)  # Convert from degrees to radians
     result = math.sin(radians)
-    print(f"Sine of {a} degrees (radians: {radians}): {result}")
+    log.sample("sine", degrees=a, radians=radians, result=result)
     return result
 
 @mcp.tool()
@@ -71,32 +221,180 @@ def list_files_and_folders() -> list:
     Returns:
         A list of strings, each representing a file or folder.
     """
-    print("Server received request to list files and folders.")
     try:
         # Get all files and directories in the current working directory
         items = os.listdir(".")
-        print(f"Files and Folders in Current Directory: {items}")
+        log.sample("list_files_and_folders", items=len(items))
         return items
     except Exception as e:
-        print(f"Error listing files and folders: {e}")
+        log.always("list_files_and_folders_error", error=str(e))
         return [f"Error: {str(e)}"]
     
+def embed_queries(queries: list[str]) -> list[list[float]]:
+    """Embed several queries with one forward pass, matching get_query_embedding."""
+    return embed_query_batch(embed_model, queries)
+
+
+class SearchRequest(NamedTuple):
+    collection: str
+    query: str
+    top_k: int
+    mode: str
+    rerank: bool
+
+
+def _vector_search(state: IndexState, queries: list[str], embeddings: list, top_k: int) -> list[list[tuple[str, float]]]:
+    """(node_id, score) hits per query from the int8 index if loaded, else the LlamaIndex retriever."""
+    if state.quantized is not None:
+        return state.quantized.search_batch(embeddings, top_k=top_k, rerank_k=INT8_RERANK_CANDIDATES or None)
+    batch_retriever = state.retriever
+    if top_k != DEFAULT_TOP_K:
+        batch_retriever = VectorIndexRetriever(index=state.index, similarity_top_k=top_k)
+    return [
+        [(ele.node.node_id, ele.get_score()) for ele in batch_retriever.retrieve(QueryBundle(query_str=q, embedding=e))]
+        for q, e in zip(queries, embeddings)
+    ]
+
+
+def _search_batch(items: list[SearchRequest]) -> list[list[dict]]:
+    # One snapshot per collection per batch; a concurrent reload doesn't affect it
+    states = {item.collection: collections[item.collection].current for item in items}
+    # Hybrid fuses a deeper vector list with the keyword ranking; reranking needs a wider candidate set
+    depth = [item.top_k if item.mode == "vector" else max(item.top_k, DEFAULT_TOP_K) for item in items]
+    depth = [max(d, RERANK_CANDIDATES) if item.rerank else d for d, item in zip(depth, items)]
+    cut = [max(item.top_k, RERANK_CANDIDATES) if item.rerank else item.top_k for item in items]
+
+    needs_vectors = [i for i, item in enumerate(items) if item.mode != "keyword"]
+    vector_hits: dict[int, list[tuple[str, float]]] = {}
+    if needs_vectors:
+        started = time.perf_counter()
+        embeddings = embed_queries([items[i].query for i in needs_vectors])
+        EMBED_SECONDS.observe(time.perf_counter() - started)
+        by_collection: dict[str, list[int]] = {}
+        for i, embedding in zip(needs_vectors, embeddings):
+            by_collection.setdefault(items[i].collection, []).append(i)
+        embedding_of = dict(zip(needs_vectors, embeddings))
+        for name, idxs in by_collection.items():
+            retrieve_started = time.perf_counter()
+            hits = _vector_search(
+                states[name], [items[i].query for i in idxs], [embedding_of[i] for i in idxs], max(depth[i] for i in idxs)
+            )
+            elapsed = time.perf_counter() - retrieve_started
+            for i, h in zip(idxs, hits):
+                vector_hits[i] = h
+                RETRIEVE_SECONDS.observe(elapsed / len(idxs))
+
+    results = []
+    for i, item in enumerate(items):
+        state = states[item.collection]
+        if item.mode == "vector":
+            hits = vector_hits[i][: cut[i]]
+        else:
+            retrieve_started = time.perf_counter()
+            keyword_hits = state.keyword.search(item.query, depth[i])
+            if item.mode == "keyword":
+                hits = keyword_hits[: cut[i]]
+            else:
+                hits = reciprocal_rank_fusion(
+                    [[node_id for node_id, _ in vector_hits[i]], [node_id for node_id, _ in keyword_hits]]
+                )[: cut[i]]
+            RETRIEVE_SECONDS.observe(time.perf_counter() - retrieve_started)
+        results.append(
+            [{"text": state.index.docstore.get_node(node_id).get_content(), "score": score} for node_id, score in hits]
+        )
+    return results
+
+
+def _rerank(context: str, chunks: list[dict], top_k: int) -> list[dict]:
+    """Best top_k of the (cached) candidates for this snippet; the candidate list is not modified."""
+    started = time.perf_counter()
+    ranked, over_budget = rerank(reranker, context, chunks, top_k, RERANK_BUDGET_S)
+    RERANK_SECONDS.observe(time.perf_counter() - started)
+    if over_budget:
+        RERANK_OVER_BUDGET.inc()
+    return ranked
+
+
+batcher = MicroBatcher(
+    _search_batch,
+    max_batch=int(os.getenv("EMBED_MAX_BATCH", "16")),
+    window_s=float(os.getenv("EMBED_BATCH_WINDOW_MS", "5")) / 1000.0,
+    on_batch=BATCH_SIZE.observe,
+    on_queue=QUEUE_DEPTH.set,
+)
+
+
 @mcp.tool()
-def search_documents(query: str) -> list:
+async def search_documents(
+    query: str,
+    top_k: int = DEFAULT_TOP_K,
+    collection: str = DEFAULT_COLLECTION,
+    mode: str = "vector",
+    context: str = "",
+) -> list:
     """
     Searches documents using vector similarity retrieval.
     
     Args:
         query (str): The search query string to find relevant documents.
+        top_k (int): Maximum number of documents to return (default 20).
+        collection (str): Collection to search, e.g. "api_docs" or "bug_patterns" (see list_collections).
+        mode (str): "vector" (default), "keyword" (BM25) or "hybrid" (reciprocal rank fusion of both).
+        context (str): Optional code snippet; if given, a wider candidate set is reranked
+            against it and the best top_k are returned.
         
     Returns:
         list: A list of dictionaries, each containing:
             - text (str): The retrieved document text content
             - score (float): The similarity score of the document to the query
+              (BM25 score for keyword, fused rank score for hybrid, reranker score with context;
+              the retrieval score is then kept as retrieval_score)
     """
-    print(f"Server received search_documents request: {query}")
-    nodes = retriever.retrieve(query)
-    return [{"text" : ele.get_text(), "score" : ele.get_score()} for ele in nodes]
+    top_k = max(1, min(int(top_k), 100))
+    collection = collection or DEFAULT_COLLECTION
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown mode {mode!r}; expected one of {', '.join(SEARCH_MODES)}")
+    if collection not in collections:
+        # It may have been ingested after startup
+        await asyncio.to_thread(refresh_collections)
+        if collection not in collections:
+            raise ValueError(f"Unknown collection {collection!r}; available: {', '.join(sorted(collections))}")
+    started = time.perf_counter()
+    context = context.strip()
+    cache_key = (collection, mode, normalize_query(query), top_k, bool(context), collections[collection].current.version)
+    candidates = result_cache.get(cache_key)
+    cache_hit = candidates is not None
+    if cache_hit:
+        CACHE_HITS.inc()
+    else:
+        CACHE_MISSES.inc()
+    IN_FLIGHT.inc()
+    try:
+        if not cache_hit:
+            candidates = await batcher.submit(SearchRequest(collection, query, top_k, mode, bool(context)))
+            result_cache.put(cache_key, candidates)
+        results = await asyncio.to_thread(_rerank, context, candidates, top_k) if context else candidates
+    except Exception as e:
+        ERRORS.inc()
+        log.always("search_documents_error", query=query[:200], error=str(e))
+        raise
+    finally:
+        IN_FLIGHT.dec()
+
+    elapsed = time.perf_counter() - started
+    RESULT_COUNT.observe(len(results))
+    REQUEST_SECONDS.observe(elapsed)
+    REQUESTS.inc()
+    log.sample(
+        "search_documents",
+        query=query[:200],
+        collection=collection,
+        mode=mode,
+        cache_hit=cache_hit,
+        request_ms=round(elapsed * 1000, 2),
+        results=len(results),
+    )
+    return results
 
 if __name__ =="__main__":
    print("Starting MCP Server....")
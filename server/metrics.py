@@ -0,0 +1,196 @@
+"""
+In-memory metrics and sampled structured logging for the MCP server.
+
+Histograms, counters and gauges are plain thread-safe Python objects rendered
+in the Prometheus text exposition format (served at /metrics) and as a dict
+(returned by the server_stats tool). Request logs go through a QueueHandler so
+formatting and stderr I/O happen on a background thread, and only a sampled
+fraction of requests is logged at all (LOG_SAMPLE_RATE, default 0.01).
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any
+
+# Latency buckets (seconds) cover ~1 ms embeddings up to multi-second cold retrievals
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        idx = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                idx = i
+                break
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += value
+            self._count += 1
+
+    def quantile(self, q: float) -> float | None:
+        """Upper bound of the bucket holding the q-quantile (coarse, like histogram_quantile)."""
+        with self._lock:
+            counts, total = list(self._counts), self._count
+        if total == 0:
+            return None
+        target = q * total
+        running = 0
+        for i, c in enumerate(counts):
+            running += c
+            if running >= target:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            count, total = self._count, self._sum
+        return {
+            "count": count,
+            "sum": round(total, 6),
+            "mean": round(total / count, 6) if count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+    def render(self) -> str:
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        running = 0
+        for bound, c in zip(self.buckets, counts):
+            running += c
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {running}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {count}")
+        return "\n".join(lines)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help = help_text
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+    def snapshot(self) -> int:
+        return self._value
+
+    def render(self) -> str:
+        return f"# HELP {self.name} {self.help}\n# TYPE {self.name} counter\n{self.name} {self._value}"
+
+
+class Gauge:
+    """Current value plus the high-water mark since start (e.g. concurrent requests)."""
+
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help = help_text
+        self._value = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+            self._max = max(self._max, self._value)
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self._value = value
+            self._max = max(self._max, value)
+
+    def snapshot(self) -> dict[str, float]:
+        return {"current": self._value, "max": self._max}
+
+    def render(self) -> str:
+        return (
+            f"# HELP {self.name} {self.help}\n# TYPE {self.name} gauge\n{self.name} {self._value}\n"
+            f"# HELP {self.name}_max High-water mark of {self.name}\n# TYPE {self.name}_max gauge\n"
+            f"{self.name}_max {self._max}"
+        )
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Histogram | Counter | Gauge] = {}
+        self.started = time.time()
+
+    def histogram(self, name: str, help_text: str, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help_text, buckets))  # type: ignore[return-value]
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help_text))  # type: ignore[return-value]
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._metrics.setdefault(name, Gauge(name, help_text))  # type: ignore[return-value]
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        return "\n".join(m.render() for m in self._metrics.values()) + "\n"
+
+    def snapshot(self) -> dict[str, Any]:
+        stats: dict[str, Any] = {"uptime_s": round(time.time() - self.started, 1)}
+        stats.update({name: m.snapshot() for name, m in self._metrics.items()})
+        return stats
+
+
+class SampledLogger:
+    """JSON-lines logger that records only a random fraction of events, off the request thread."""
+
+    def __init__(self, name: str, sample_rate: float) -> None:
+        self.sample_rate = sample_rate
+        self._logger = logging.getLogger(name)
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        stream = logging.StreamHandler()
+        stream.setFormatter(logging.Formatter("%(message)s"))
+        self._listener = logging.handlers.QueueListener(log_queue, stream)
+        self._listener.start()
+
+    def sample(self, event: str, **fields: Any) -> None:
+        if self.sample_rate <= 0 or (self.sample_rate < 1 and random.random() >= self.sample_rate):
+            return
+        self._logger.info(json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, default=str))
+
+    def always(self, event: str, **fields: Any) -> None:
+        self._logger.info(json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, default=str))
+
+    def stop(self) -> None:
+        self._listener.stop()
+
+
+registry = Registry()
+log = SampledLogger("mcp_server", float(os.getenv("LOG_SAMPLE_RATE", "0.01")))
@@ -0,0 +1,47 @@
+"""
+Named collections under server/storage.
+
+Each collection is a separate persisted LlamaIndex directory (plus its own
+index_version stamp and optional int8 files):
+
+  server/storage/                 legacy single index -> collection "default"
+  server/storage/api_docs/        collection "api_docs"
+  server/storage/bug_patterns/    collection "bug_patterns"
+
+Kept separate from mcp_server.py so ingestion can resolve paths without loading
+the server.
+"""
+
+import re
+from pathlib import Path
+
+DEFAULT_COLLECTION = "default"
+# Marker file every persisted LlamaIndex storage directory contains
+_DOCSTORE_FILE = "docstore.json"
+_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+
+def validate_collection_name(name: str) -> str:
+    if not _NAME_RE.match(name):
+        raise ValueError(f"Invalid collection name {name!r} (letters, digits, '_' and '-' only)")
+    return name
+
+
+def collection_path(storage_root: Path, name: str) -> Path:
+    """Storage directory for a collection; "default" is the storage root itself."""
+    if name == DEFAULT_COLLECTION:
+        return Path(storage_root)
+    return Path(storage_root) / validate_collection_name(name)
+
+
+def discover_collections(storage_root: Path) -> dict[str, Path]:
+    """Collections with a persisted index under storage_root, by name."""
+    root = Path(storage_root)
+    found: dict[str, Path] = {}
+    if (root / _DOCSTORE_FILE).exists():
+        found[DEFAULT_COLLECTION] = root
+    if root.is_dir():
+        for child in sorted(root.iterdir()):
+            if child.is_dir() and _NAME_RE.match(child.name) and (child / _DOCSTORE_FILE).exists():
+                found.setdefault(child.name, child)
+    return found
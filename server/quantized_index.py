@@ -0,0 +1,192 @@
+"""
+Int8-quantized vector storage and scoring for the retrieval index.
+
+The persisted LlamaIndex vector store keeps every 768-dim BGE vector as JSON
+floats. This module converts those vectors into per-vector symmetric int8 codes
+(plus one float32 scale each, ~4x smaller than float32 and far smaller than
+JSON), scores queries with block-wise NumPy matrix products, and can rerank the
+top candidates against the full-precision vectors, which are memory-mapped from
+disk so they only cost RAM for the rows that are actually touched.
+
+Files written next to the LlamaIndex storage:
+  int8_index.npz          node ids, int8 codes, scales, name of the float file
+  vectors_f32-<id>.npy    normalised float32 vectors (for optional rerank)
+
+A running server may have the previous float file memory-mapped, so save()
+never rewrites a file in place: the float vectors go to a new versioned file,
+int8_index.npz is written to a temp file and swapped in with os.replace(), and
+only then are older float files unlinked (open maps keep their data).
+"""
+
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+INT8_FILE = "int8_index.npz"
+FLOAT_FILE = "vectors_f32.npy"  # unversioned name used by older indexes
+FLOAT_GLOB = "vectors_f32*.npy"
+VECTOR_STORE_FILE = "default__vector_store.json"
+# Rows scored per matrix product; bounds the float32 temporary to BLOCK x dim
+BLOCK = 8192
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-vector int8 quantization: vectors ~= codes * scales[:, None]."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def load_vector_store(storage_dir: Path) -> tuple[list[str], np.ndarray]:
+    """Read node ids and embeddings from a persisted SimpleVectorStore."""
+    with open(Path(storage_dir) / VECTOR_STORE_FILE, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    embedding_dict = data.get("embedding_dict", {})
+    node_ids = list(embedding_dict)
+    vectors = np.asarray([embedding_dict[i] for i in node_ids], dtype=np.float32)
+    return node_ids, vectors
+
+
+class QuantizedIndex:
+    def __init__(
+        self,
+        node_ids: list[str],
+        codes: np.ndarray,
+        scales: np.ndarray,
+        full_vectors: np.ndarray | None = None,
+    ) -> None:
+        self.node_ids = node_ids
+        self.codes = codes
+        self.scales = scales
+        self.full_vectors = full_vectors
+
+    @classmethod
+    def from_vectors(cls, node_ids: list[str], vectors: np.ndarray) -> "QuantizedIndex":
+        normalized = _normalize(np.asarray(vectors, dtype=np.float32))
+        codes, scales = quantize_int8(normalized)
+        return cls(node_ids, codes, scales, normalized)
+
+    def save(self, storage_dir: Path) -> None:
+        storage_dir = Path(storage_dir)
+        float_name = ""
+        if self.full_vectors is not None:
+            float_name = f"vectors_f32-{uuid.uuid4().hex[:12]}.npy"
+            with open(storage_dir / float_name, "wb") as f:
+                np.save(f, np.asarray(self.full_vectors, dtype=np.float32))
+        tmp = storage_dir / f"{INT8_FILE}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                node_ids=np.asarray(self.node_ids),
+                codes=self.codes,
+                scales=self.scales,
+                float_file=np.asarray(float_name),
+            )
+        os.replace(tmp, storage_dir / INT8_FILE)
+        for old in storage_dir.glob(FLOAT_GLOB):
+            if old.name != float_name:
+                old.unlink(missing_ok=True)
+
+    @classmethod
+    def load(cls, storage_dir: Path) -> "QuantizedIndex":
+        storage_dir = Path(storage_dir)
+        with np.load(storage_dir / INT8_FILE) as data:
+            node_ids = [str(i) for i in data["node_ids"]]
+            codes = data["codes"]
+            scales = data["scales"]
+            float_name = str(data["float_file"]) if "float_file" in data.files else FLOAT_FILE
+        float_path = storage_dir / float_name if float_name else None
+        full_vectors = np.load(float_path, mmap_mode="r") if float_path and float_path.exists() else None
+        return cls(node_ids, codes, scales, full_vectors)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + self.scales.nbytes)
+
+    def _approx_scores(self, queries: np.ndarray) -> np.ndarray:
+        """(num_queries, num_vectors) approximate cosine scores from int8 codes."""
+        scores = np.empty((queries.shape[0], len(self.node_ids)), dtype=np.float32)
+        for start in range(0, len(self.node_ids), BLOCK):
+            block = self.codes[start:start + BLOCK].astype(np.float32)
+            scores[:, start:start + BLOCK] = (queries @ block.T) * self.scales[start:start + BLOCK]
+        return scores
+
+    def search_batch(
+        self, queries: np.ndarray, top_k: int = 20, rerank_k: int | None = None
+    ) -> list[list[tuple[str, float]]]:
+        """
+        Score a (num_queries, dim) batch. If rerank_k is set and full-precision
+        vectors are available, the top rerank_k int8 candidates are rescored exactly.
+        """
+        queries = _normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        n = len(self.node_ids)
+        if n == 0:
+            return [[] for _ in range(len(queries))]
+        scores = self._approx_scores(queries)
+        width = min(n, max(top_k, rerank_k or 0))
+        candidates = np.argpartition(-scores, width - 1, axis=1)[:, :width]
+
+        results = []
+        for qi, cand in enumerate(candidates):
+            if rerank_k and self.full_vectors is not None:
+                cand = np.sort(cand)  # sequential reads from the memory map
+                cand_scores = np.asarray(self.full_vectors[cand]) @ queries[qi]
+            else:
+                cand_scores = scores[qi, cand]
+            order = np.argsort(-cand_scores)[:top_k]
+            results.append([(self.node_ids[cand[i]], float(cand_scores[i])) for i in order])
+        return results
+
+    def search(self, query: np.ndarray, top_k: int = 20, rerank_k: int | None = None) -> list[tuple[str, float]]:
+        return self.search_batch(np.asarray(query)[None, :], top_k, rerank_k)[0]
+
+
+def exact_search(node_ids: list[str], vectors: np.ndarray, queries: np.ndarray, top_k: int) -> list[list[str]]:
+    """Float32 brute-force cosine baseline."""
+    scores = _normalize(np.atleast_2d(queries).astype(np.float32)) @ _normalize(vectors.astype(np.float32)).T
+    top = np.argsort(-scores, axis=1)[:, :top_k]
+    return [[node_ids[i] for i in row] for row in top]
+
+
+def recall_at_k(expected: list[list[str]], actual: list[list[str]], k: int) -> float:
+    hits = sum(len(set(e[:k]) & set(a[:k])) for e, a in zip(expected, actual))
+    total = sum(min(k, len(e)) for e in expected)
+    return hits / total if total else 1.0
+
+
+def quantization_report(
+    node_ids: list[str],
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    qindex: QuantizedIndex,
+    k: int = 5,
+    rerank_k: int = 50,
+) -> dict[str, Any]:
+    """Memory savings and recall@k of int8 (with / without rerank) against the float baseline."""
+    expected = exact_search(node_ids, vectors, queries, k)
+    int8_only = [[i for i, _ in hits] for hits in qindex.search_batch(queries, top_k=k)]
+    reranked = [[i for i, _ in hits] for hits in qindex.search_batch(queries, top_k=k, rerank_k=rerank_k)]
+    float_bytes = int(np.asarray(vectors, dtype=np.float32).nbytes)
+    return {
+        "vectors": len(node_ids),
+        "dim": int(vectors.shape[1]) if len(node_ids) else 0,
+        "queries": int(len(queries)),
+        "float32_bytes": float_bytes,
+        "int8_bytes": qindex.nbytes,
+        "memory_saving": round(1 - qindex.nbytes / float_bytes, 4) if float_bytes else 0.0,
+        f"recall@{k}_int8": round(recall_at_k(expected, int8_only, k), 4),
+        f"recall@{k}_int8_rerank": round(recall_at_k(expected, reranked, k), 4),
+        "rerank_candidates": rerank_k,
+    }
@@ -0,0 +1,102 @@
+"""
+Rerank retrieved chunks against the code snippet being analysed.
+
+search_documents retrieves a wider candidate set (RERANK_CANDIDATES) when the
+caller passes `context`, and a reranker orders it by relevance to that context
+before cutting to top_k:
+
+  LexicalReranker       identifier overlap weighted by rarity within the
+                        candidate set, plus a small retrieval-rank prior (default)
+  CrossEncoderReranker  a local sentence-transformers cross-encoder (RERANK_MODEL)
+
+Both stop scoring once RERANK_BUDGET_MS is spent; unscored candidates keep
+their retrieval order after the scored ones, so a slow model degrades to plain
+retrieval instead of stalling the request.
+"""
+
+import math
+import os
+import time
+from typing import Any
+
+from server.keyword_index import tokenize
+
+# Weight of the original retrieval rank relative to lexical coverage (0..1)
+RANK_PRIOR = 0.1
+
+
+class LexicalReranker:
+    name = "lexical"
+
+    def score(self, context: str, texts: list[str], deadline: float) -> list[float | None]:
+        context_terms = set(tokenize(context))
+        chunk_terms = [set(tokenize(t)) for t in texts]
+        n = len(texts)
+        # Terms present in every candidate (e.g. "rdi") carry almost no signal
+        df = {term: sum(1 for terms in chunk_terms if term in terms) for term in context_terms}
+        idf = {term: math.log(1 + n / (1 + d)) for term, d in df.items()}
+        total = sum(idf.values()) or 1.0
+        scores: list[float | None] = []
+        for rank, terms in enumerate(chunk_terms):
+            if time.perf_counter() > deadline:
+                scores.extend([None] * (n - rank))
+                break
+            coverage = sum(idf[t] for t in context_terms & terms) / total
+            scores.append(coverage + RANK_PRIOR * (1 - rank / n))
+        return scores
+
+
+class CrossEncoderReranker:
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str, batch_size: int = 8, max_context_chars: int = 1500) -> None:
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name)
+        self.batch_size = batch_size
+        self.max_context_chars = max_context_chars
+
+    def score(self, context: str, texts: list[str], deadline: float) -> list[float | None]:
+        context = context[: self.max_context_chars]
+        scores: list[float | None] = []
+        for start in range(0, len(texts), self.batch_size):
+            # The first batch is always scored so the budget never yields nothing
+            if start and time.perf_counter() > deadline:
+                scores.extend([None] * (len(texts) - start))
+                break
+            batch = texts[start:start + self.batch_size]
+            scores.extend(float(s) for s in self.model.predict([(context, t) for t in batch]))
+        return scores
+
+
+def rerank(
+    reranker: Any, context: str, hits: list[dict[str, Any]], top_k: int, budget_s: float
+) -> tuple[list[dict[str, Any]], bool]:
+    """
+    Order hits ({"text", "score"}, in retrieval order) by reranker score and keep top_k.
+    Returns (hits, budget_exhausted). The retrieval score is kept as "retrieval_score".
+    """
+    if not hits:
+        return hits, False
+    scores = reranker.score(context, [h.get("text") or "" for h in hits], time.perf_counter() + budget_s)
+    scored = [(s, i) for i, s in enumerate(scores) if s is not None]
+    unscored = [i for i, s in enumerate(scores) if s is None]
+    order = [i for _, i in sorted(scored, key=lambda t: (-t[0], t[1]))] + unscored
+    ranked = [
+        {**hits[i], "retrieval_score": hits[i].get("score"), "score": scores[i] if scores[i] is not None else 0.0}
+        for i in order[:top_k]
+    ]
+    return ranked, bool(unscored)
+
+
+def load_reranker() -> Any:
+    """Cross-encoder if RERANK_MODEL is set (and loadable), else the lexical scorer."""
+    model_name = os.getenv("RERANK_MODEL", "").strip()
+    if model_name:
+        try:
+            reranker = CrossEncoderReranker(model_name)
+            print(f"Reranker: cross-encoder {model_name}")
+            return reranker
+        except Exception as e:
+            print(f"Could not load RERANK_MODEL {model_name!r} ({e}); using lexical reranker")
+    return LexicalReranker()
@@ -0,0 +1,113 @@
+"""
+Bounded LRU/TTL cache for search_documents results, invalidated by index version.
+
+Keys end with the index version (mcp_server.py builds the rest). The version is
+the content of the `index_version` stamp that ingest_from_samples.py writes next
+to the persisted index, so re-ingesting changes every key and stale entries
+simply age out of the LRU instead of being served.
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Hashable
+
+INDEX_VERSION_FILE = "index_version"
+
+
+def normalize_query(query: str) -> str:
+    """Collapse whitespace and case (the BGE tokenizer is uncased, so embeddings don't change)."""
+    return " ".join(query.split()).lower()
+
+
+def write_index_version(storage_dir: Path) -> str:
+    """Stamp a freshly persisted index with a new unique version."""
+    version = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    path = Path(storage_dir) / INDEX_VERSION_FILE
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(version + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+    return version
+
+
+class IndexVersion:
+    """Current index version, re-read only when the stamp file's mtime changes."""
+
+    def __init__(self, storage_dir: Path) -> None:
+        self.path = Path(storage_dir) / INDEX_VERSION_FILE
+        self._mtime: float | None = None
+        self._version = "unversioned"
+        self._lock = threading.Lock()
+
+    def get(self) -> str:
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            return self._version
+        if mtime != self._mtime:
+            with self._lock:
+                try:
+                    self._version = self.path.read_text(encoding="utf-8").strip() or "unversioned"
+                    self._mtime = mtime
+                except OSError:
+                    pass
+        return self._version
+
+
+class ResultCache:
+    """Thread-safe LRU with per-entry TTL. max_entries <= 0 disables caching."""
+
+    def __init__(self, max_entries: int = 4096, ttl_s: float = 3600.0) -> None:
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        if self.max_entries <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (self.ttl_s > 0 and now - entry[0] > self.ttl_s):
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            size = len(self._data)
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
@@ -0,0 +1,74 @@
+"""
+_fan_out early stop: the slow queries of a row are cancelled once enough
+chunks are in, instead of waiting for every query or the deadline.
+
+    python -m unittest test_mcp_lookup
+"""
+
+import asyncio
+import contextlib
+import time
+import unittest
+from unittest import mock
+
+from agents import mcp_lookup
+
+
+def _fake_search(delays: dict[str, float], results: dict[str, list[dict]], cancelled: list[str]):
+    async def call_search(client, query, **kwargs):
+        try:
+            await asyncio.sleep(delays[query])
+        except asyncio.CancelledError:
+            cancelled.append(query)
+            raise
+        return results[query]
+
+    return call_search
+
+
+@contextlib.asynccontextmanager
+async def _fake_session(url=None):
+    yield object()
+
+
+class FanOutEarlyStopTest(unittest.TestCase):
+    def _run(self, delays, results, top_k=3, timeout=10.0):
+        cancelled: list[str] = []
+        with mock.patch.object(mcp_lookup, "call_search", _fake_search(delays, results, cancelled)), \
+                mock.patch.object(mcp_lookup, "open_session", _fake_session), \
+                mock.patch.dict("os.environ", {"MCP_ROUTING": "0"}):
+            started = time.monotonic()
+            chunks = asyncio.run(mcp_lookup._fan_out(list(delays), top_k, timeout, None, False))
+        return chunks, cancelled, time.monotonic() - started
+
+    def test_slow_queries_are_cancelled(self):
+        # Scores on different scales (RRF, cosine); the two fast queries return top_k chunks
+        results = {
+            "fast api": [{"text": "A", "score": 0.032}, {"text": "B", "score": 0.031}],
+            "fast pattern": [{"text": "C", "score": 0.82}, {"text": "A", "score": 0.7}],
+            "slow 1": [{"text": "D", "score": 0.9}],
+            "slow 2": [{"text": "E", "score": 0.9}],
+        }
+        delays = {"fast api": 0.01, "fast pattern": 0.02, "slow 1": 5.0, "slow 2": 5.0}
+        chunks, cancelled, elapsed = self._run(delays, results)
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual(sorted(cancelled), ["slow 1", "slow 2"])
+        # Found by both answered queries, so ranked first with nearly full support
+        self.assertEqual(chunks[0]["text"], "A")
+        self.assertGreater(chunks[0]["score"], 0.9)
+        self.assertEqual({c["text"] for c in chunks}, {"A", "B", "C"})
+        self.assertTrue(all(0.0 < c["score"] <= 1.0 for c in chunks))
+
+    def test_single_fast_query_does_not_cancel_the_rest(self):
+        results = {
+            "fast": [{"text": "A", "score": 0.9}, {"text": "B", "score": 0.8}, {"text": "C", "score": 0.7}],
+            "slower": [{"text": "D", "score": 12.0}],
+        }
+        chunks, cancelled, _ = self._run({"fast": 0.01, "slower": 0.2}, results)
+        self.assertEqual(cancelled, [])
+        # The slower query was waited for and its top chunk made the cut
+        self.assertIn("D", [c["text"] for c in chunks])
+
+
+if __name__ == "__main__":
+    unittest.main()
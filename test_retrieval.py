@@ -17,7 +17,7 @@ rdi.port(TA::MULTI_PORT).func().burst("MPBurst1").burst();
 RDI_END();"""
 
 print("--- TESTING SAMPLE 32 ---")
-sample_id, bug_line, explanation = run_pipeline_row("32", code_32, verbose=True)
+sample_id, bug_line, explanation, _ = run_pipeline_row("32", code_32, verbose=True)
 print("\nFINAL RESULT:")
 print(f"ID: {sample_id}, Line: {bug_line}")
 print(f"Explanation: {explanation}")
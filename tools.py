@@ -15,6 +15,13 @@ def tool(name, description, **params):
 tools = [
     tool("get_files_info", "List files in directory", directory="Directory path"),
     tool("get_file_content", "Read file contents", file_path="Path to file"),
+    tool(
+        "grep_workspace",
+        "Search files for a regex and return only matching lines with line numbers",
+        pattern="Python regular expression to search for",
+        glob='Filename glob to restrict the search, e.g. "*.py" (use "*" for all files)',
+        context_lines='Number of surrounding lines to include per match, 0-5 (use "0" for none)',
+    ),
     tool("write_file", "Write content to file", file_path="Path to file", content="Content to write"),
     tool("run_python_file", "Execute Python file", file_path="Path to Python file"),
 ]